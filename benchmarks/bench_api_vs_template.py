@@ -0,0 +1,108 @@
+"""
+Benchmark the CPU time of the JSON API against the equivalent rendered pages.
+
+Each pair of routes is requested through the Flask test client against a seeded
+SQLite database, and the process CPU time per request is reported. The API is
+measured with orjson and with Flask's json module.
+
+Usage: python benchmarks/bench_api_vs_template.py [--requests 300] [--lines 30]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+from orderapp import app, db
+from orderapp.cache import catalog_cache
+from orderapp.json_provider import IsoDateJSONProvider, OrjsonProvider, orjson
+from orderapp.models.item import PremadeBox, UnitPriceVeggie, WeightedVeggie
+from orderapp.models.order import Order, OrderLine
+from orderapp.models.payment import DebitCardPayment
+from orderapp.models.user import Customer
+
+VEGGIES = 40
+ORDERS = 50
+
+def build_database(session, lines):
+    """Seed a customer, a catalog, and paid orders with the given number of lines"""
+    customer = Customer(firstname='Ying', lastname='Zheng', username='ying', password='123',
+                        address='23 Kingsland Road, Auckland', balance=0.0, maxOwing=100.0)
+    veggies = [WeightedVeggie(vegName=f'Weighted {i}', weight=1.0, weightPerKilo=3.99, stock=1000)
+               for i in range(VEGGIES // 2)]
+    veggies += [UnitPriceVeggie(vegName=f'Unit {i}', quantity=1, pricePerUnit=0.99, stock=1000)
+                for i in range(VEGGIES // 2)]
+    box = PremadeBox(boxSize='Large', numOfBoxes=1, stock=1000)
+    session.add_all([customer, box] + veggies)
+    box.set_contents(veggies)
+
+    for number in range(ORDERS):
+        order = Order(orderNumber=str(1000 + number), customer=customer,
+                      deliveryMethod='Delivery', paymentMethod='Debit Card')
+        session.add(order)
+        with session.no_autoflush:
+            for line in range(lines):
+                item = box if line == 0 else veggies[line % VEGGIES]
+                session.add(OrderLine(order=order, item=item, quantity=1))
+        order.record_totals()
+        session.add(DebitCardPayment(paymentAmount=1.0, customer=customer, order=order,
+                                     bankName='ANZ Bank', debitCardNumber='9876543210987654'))
+    session.commit()
+    return customer.id, order.id
+
+def cpu_per_request(client, path, requests):
+    client.get(path)
+    started = time.process_time()
+    for _ in range(requests):
+        response = client.get(path)
+    assert response.status_code == 200, response.status_code
+    return (time.process_time() - started) / requests
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--lines', type=int, default=30)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        db.metadata.create_all(engine)
+        session = scoped_session(sessionmaker(bind=engine))
+
+        with patch('orderapp.db.session', session):
+            customer_id, order_id = build_database(session, args.lines)
+            session.remove()
+
+            client = app.test_client()
+            with client.session_transaction() as client_session:
+                client_session.update({'loggedin': True, 'id': customer_id, 'role': 'private_customer'})
+
+            pairs = [
+                ('order details', f'/order_details/{order_id}', f'/api/v1/orders/{order_id}'),
+                ('order history', '/order_history', f"/api/v1/orders?limit={ORDERS}"),
+                ('catalog', '/view_veggies', '/api/v1/catalog'),
+            ]
+            providers = [('json', IsoDateJSONProvider(app))]
+            if orjson is not None:
+                providers.insert(0, ('orjson', OrjsonProvider(app)))
+
+            print(f"{args.requests} requests each, {args.lines} lines per order, CPU ms per request")
+            print(f"{'route':<15}{'template':>10}" + ''.join(f"{name:>10}" for name, _ in providers))
+            for name, page, api in pairs:
+                catalog_cache.clear()
+                row = [cpu_per_request(client, page, args.requests)]
+                for _, provider in providers:
+                    with patch.object(app, 'json', provider):
+                        row.append(cpu_per_request(client, api, args.requests))
+                print(f"{name:<15}" + ''.join(f"{seconds * 1000:>10.2f}" for seconds in row))
+
+            session.remove()
+        engine.dispose()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark prefix searches in the in-memory customer directory.
+
+Builds the directory from synthetic customers (500k by default) and times
+searches for prefixes of different lengths, plus adding and renaming a customer.
+
+Usage: python benchmarks/bench_customer_directory.py [--customers 500000]
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from orderapp.directory import CustomerDirectory, CustomerEntry
+
+SEARCHES = 1000
+
+def random_name(length):
+    return random.choice(string.ascii_uppercase) + ''.join(random.choices(string.ascii_lowercase, k=length - 1))
+
+def build_entries(count, seed=1161174):
+    random.seed(seed)
+    return [CustomerEntry(customer_id, random_name(random.randint(3, 9)), random_name(random.randint(3, 12)),
+                          f"user{customer_id}", 'private_customer')
+            for customer_id in range(1, count + 1)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--customers', type=int, default=500000)
+    args = parser.parse_args()
+
+    entries = build_entries(args.customers)
+    directory = CustomerDirectory(reload_interval=None)
+    started = time.perf_counter()
+    directory.build(entries)
+    print(f"Built the directory of {args.customers} customers in {time.perf_counter() - started:.2f}s")
+
+    for length in [0, 1, 2, 3, 5]:
+        prefixes = [entry.lastname[:length] for entry in random.sample(entries, SEARCHES)]
+        started = time.perf_counter()
+        for prefix in prefixes:
+            page = directory.search(prefix)
+        elapsed = (time.perf_counter() - started) / SEARCHES
+        print(f"  prefix length {length}: {elapsed * 1000:.3f}ms per search")
+
+    started = time.perf_counter()
+    for customer_id in range(args.customers + 1, args.customers + 1 + SEARCHES):
+        directory.put(CustomerEntry(customer_id, random_name(6), random_name(8), f"user{customer_id}", 'private_customer'))
+    print(f"  add a customer: {(time.perf_counter() - started) / SEARCHES * 1000:.3f}ms")
+
+    started = time.perf_counter()
+    for entry in random.sample(entries, SEARCHES):
+        directory.put(entry._replace(lastname=random_name(8)))
+    print(f"  rename a customer: {(time.perf_counter() - started) / SEARCHES * 1000:.3f}ms")
+
+if __name__ == '__main__':
+    main()
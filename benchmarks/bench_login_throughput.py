@@ -0,0 +1,79 @@
+"""
+Benchmark login throughput for each password hasher, hashed inline and on the pools.
+
+Concurrent clients check a password against a stored hash while another thread
+serves cheap requests. Reports logins per second and the p95 latency of the cheap
+requests, which shows how much hashing starves the rest of the app.
+
+Usage: python benchmarks/bench_login_throughput.py [--logins 200] [--clients 8]
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from orderapp import app
+from orderapp.passwords import PasswordHashing
+
+HASHERS = ['legacy', 'pbkdf2_sha256', 'scrypt']
+POOLS = [None, 'thread', 'process']
+
+def cheap_request():
+    # Roughly the Python work of rendering a small page
+    return sum(len(str(number)) for number in range(2000))
+
+def serve_cheap_requests(stop, latencies):
+    while not stop.is_set():
+        started = time.perf_counter()
+        cheap_request()
+        latencies.append(time.perf_counter() - started)
+        time.sleep(0.001)
+
+def run(hasher, pool, logins, clients, workers):
+    config = dict(app.config, PASSWORD_HASH_POOL=pool, PASSWORD_HASH_WORKERS=workers,
+                  PASSWORD_HASH_MAX_PENDING=clients)
+    password_hashing = PasswordHashing(config)
+    stored = password_hashing.hashers[hasher].hash('123')
+    # Start the pool before timing
+    password_hashing.verify('123', stored)
+
+    stop = threading.Event()
+    latencies = []
+    server = threading.Thread(target=serve_cheap_requests, args=(stop, latencies))
+    server.start()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        results = list(executor.map(lambda _: password_hashing.verify('123', stored), range(logins)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    server.join()
+    if password_hashing.pool is not None:
+        password_hashing.pool.shutdown()
+
+    assert all(results)
+    p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+    return logins / elapsed, p95
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=app.config['PASSWORD_HASH_WORKERS'])
+    args = parser.parse_args()
+
+    print(f"{args.logins} logins from {args.clients} clients, {args.workers} pool workers")
+    print(f"{'hasher':<15}{'pool':<10}{'logins/s':>10}{'other p95 ms':>15}")
+    for hasher in HASHERS:
+        for pool in POOLS:
+            throughput, p95 = run(hasher, pool, args.logins, args.clients, args.workers)
+            print(f"{hasher:<15}{pool or 'inline':<10}{throughput:>10.1f}{p95 * 1000:>15.2f}")
+
+if __name__ == '__main__':
+    main()
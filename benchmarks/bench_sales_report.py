@@ -0,0 +1,126 @@
+"""
+Benchmark the staff sales report on a synthetic order history in SQLite.
+
+The SQL aggregates run over the full dataset (1M orders by default). The old
+per-order Python computation loads every order, so it is only run on a
+smaller dataset, where both results are also checked against each other.
+
+Usage: python benchmarks/bench_sales_report.py [--orders 1000000] [--compare-orders 20000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import scoped_session, sessionmaker
+from orderapp import db
+from orderapp.models.user import Staff
+from orderapp.models.order import Order, OrderLine
+
+CUSTOMERS = 500
+ITEMS = 20
+BATCH_SIZE = 50000
+
+def build_database(path, order_count, seed=1161174):
+    """Create a SQLite database with order_count random orders"""
+    random.seed(seed)
+    engine = create_engine(f'sqlite:///{path}')
+    db.metadata.create_all(engine)
+    tables = db.metadata.tables
+
+    with engine.begin() as conn:
+        conn.execute(insert(tables['users']), [
+            {'id': i, 'firstname': 'F', 'lastname': 'L', 'username': f'user{i}', 'password_hash': 'x',
+             'type': 'corporate_customer' if i % 5 == 0 else 'private_customer'}
+            for i in range(1, CUSTOMERS + 1)])
+        conn.execute(insert(tables['customers']), [
+            {'id': i, 'custAddress': 'A', 'custBalance': 0.0, 'maxOwing': 100.0}
+            for i in range(1, CUSTOMERS + 1)])
+        conn.execute(insert(tables['items']), [
+            {'id': i, 'type': 'weighted_veggie', 'stock': 1000} for i in range(1, ITEMS + 1)])
+
+        first_day = date.today() - timedelta(days=3 * 365)
+        line_id = 1
+        for start in range(0, order_count, BATCH_SIZE):
+            orders, lines = [], []
+            for order_id in range(start + 1, min(start + BATCH_SIZE, order_count) + 1):
+                orders.append({
+                    'id': order_id,
+                    'orderNumber': str(order_id),
+                    'orderDate': first_day + timedelta(days=random.randrange(3 * 365)),
+                    'deliveryMethod': random.choice(['Delivery', 'Pickup']),
+                    'orderStatus': 'Completed',
+                    'paymentMethod': 'Account',
+                    'customer_id': random.randint(1, CUSTOMERS),
+                })
+                for _ in range(random.randint(1, 3)):
+                    lines.append({'id': line_id, 'order_id': order_id, 'item_id': random.randint(1, ITEMS),
+                                  'quantity': 1.0, 'subtotal': round(random.uniform(1, 50), 2)})
+                    line_id += 1
+            conn.execute(insert(tables['orders']), orders)
+            conn.execute(insert(tables['order_lines']), lines)
+    return engine
+
+def legacy_weekly_sales():
+    """The report's old implementation: load every order and total it in Python"""
+    weekly_sales = defaultdict(float)
+    for order in Order.query.all():
+        week_key = f"week{(order.orderDate.day - 1) // 7 + 1}/{order.orderDate.month:02d}/{order.orderDate.year}"
+        weekly_sales[week_key] += order.calculate_total()
+    return dict(sorted(weekly_sales.items(),
+                       key=lambda x: (int(x[0].split('/')[-1]),
+                                      int(x[0].split('/')[1]),
+                                      int(x[0].split('week')[1].split('/')[0]))))
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - started
+
+def run(engine, staff, legacy):
+    session = scoped_session(sessionmaker(bind=engine))
+    results = {}
+    with patch('orderapp.db.session', session):
+        results['weekly'] = timed(staff.get_weekly_sales)
+        results['monthly'] = timed(staff.get_monthly_sales)
+        results['yearly'] = timed(staff.get_yearly_sales)
+        if legacy:
+            results['legacy weekly'] = timed(legacy_weekly_sales)
+    session.remove()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=1000000)
+    parser.add_argument('--compare-orders', type=int, default=20000)
+    args = parser.parse_args()
+
+    staff = Staff(firstname='Lucy', lastname='Baker', username='staff', password='123', deptName='Sales')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Comparing with the old implementation on {args.compare_orders} orders")
+        engine = build_database(os.path.join(tmp, 'compare.db'), args.compare_orders)
+        results = run(engine, staff, legacy=True)
+        engine.dispose()
+        new, legacy = results['weekly'][0], results['legacy weekly'][0]
+        assert list(new) == list(legacy)
+        assert all(abs(new[key] - legacy[key]) < 1e-6 for key in new), "weekly sales differ"
+        print(f"  SQL weekly: {results['weekly'][1]:.3f}s, old weekly: {results['legacy weekly'][1]:.3f}s, results match")
+
+        print(f"Building {args.orders} orders")
+        engine, build_time = timed(lambda: build_database(os.path.join(tmp, 'bench.db'), args.orders))
+        print(f"  built in {build_time:.1f}s")
+        for name, (result, elapsed) in run(engine, staff, legacy=False).items():
+            print(f"  {name}: {elapsed:.3f}s ({len(result)} rows)")
+        engine.dispose()
+
+if __name__ == '__main__':
+    main()
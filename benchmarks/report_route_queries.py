@@ -0,0 +1,135 @@
+"""
+Report how many SQL statements each route sends to the database.
+
+Runs a customer's shopping session and a staff session through the Flask test
+client against a temporary SQLite database, then prints the statement count
+of every route from the route query counters.
+
+The sessions run twice, each in a new process so no in-process cache is
+carried over. The baseline run loads a corporate customer as a
+Customer, as the routes did before the current user was loaded by role, so
+their corporate columns are lazy loaded. The report prints both counts and
+the queries saved.
+
+Usage: python benchmarks/report_route_queries.py
+"""
+import os
+import re
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+from orderapp import app, db
+from orderapp.models.user import Staff, Customer, CorporateCustomer
+from orderapp.models.item import WeightedVeggie, PackVeggie, UnitPriceVeggie, PremadeBox
+from orderapp.query_stats import route_query_stats
+
+# Models the routes loaded the user as before, the route's own model rather than the role's
+BASELINE_ROLE_MODELS = {
+    'staff': Staff,
+    'private_customer': Customer,
+    'corporate_customer': Customer,
+}
+
+def seed(session):
+    """Add a staff member, two customers, some veggies and a premade box"""
+    veggies = [
+        WeightedVeggie(vegName='Kumara', weight=1.0, weightPerKilo=3.99, stock=100),
+        PackVeggie(vegName='Celery', numOfPack=1, pricePerPack=3.99, stock=75),
+        UnitPriceVeggie(vegName='Feijoa', quantity=1, pricePerUnit=0.99, stock=200),
+    ]
+    box = PremadeBox(boxSize='Small', numOfBoxes=1, stock=30)
+    customer = Customer(firstname='Ying', lastname='Zheng', username='ying', password='123',
+                        address='23 Kingsland Road, Auckland', balance=0.0, maxOwing=100.0)
+    session.add_all([
+        Staff(firstname='Lucy', lastname='Baker', username='staff', password='123', deptName='Sales'),
+        customer,
+        CorporateCustomer(firstname='Hello', lastname='Fresh', username='fresh', password='123',
+                          address='23 Commerce St, Wellington', balance=0.0, maxCredit=500.0),
+    ] + veggies + [box])
+    box.set_contents(veggies)
+    session.commit()
+    return veggies[0].id, box.id, customer.id
+
+def run_sessions(client, veggie_id, box_id, customer_id):
+    """Shop and pay as a private and a corporate customer, then look around as staff"""
+    for username in ['ying', 'fresh']:
+        order_id = run_customer_session(client, username, veggie_id, box_id)
+    run_staff_session(client, customer_id, order_id)
+
+def run_customer_session(client, username, veggie_id, box_id):
+    """Shop, pay and cancel the order as a customer"""
+    client.post('/login', data={'username': username, 'password': '123'})
+    client.get('/view_veggies')
+    client.post('/add_to_cart', data={'item_id': veggie_id, 'item_type': 'weighted', 'quantity': '2'})
+    client.post('/add_to_cart', data={'item_id': box_id, 'item_type': 'premade_box', 'quantity': '1'})
+    client.get('/view_cart')
+    client.post('/process_payment', data={'delivery_method': 'Delivery'})
+    page = client.post('/place_order_and_process_payment',
+                       data={'payment_method': 'Debit Card', 'delivery_method': 'Delivery'}).get_data(as_text=True)
+    order_id = re.search(r'name="order_id" value="(\d+)"', page).group(1)
+    client.post('/add_debit_card_payment',
+                data={'bank_name': 'ANZ', 'debit_card_number': '1234567890123456', 'order_id': order_id})
+    client.get(f'/order_details/{order_id}')
+    client.get('/order_history')
+    client.get('/payment_history')
+    client.get('/profile')
+    client.get('/pay_balance')
+    client.get(f'/cancel_order/{order_id}')
+    client.get('/logout')
+    return order_id
+
+def run_staff_session(client, customer_id, order_id):
+    """Look at the orders, customers and reports as staff"""
+    client.post('/login', data={'username': 'staff', 'password': '123'})
+    client.get('/view_all_veggies')
+    client.get('/view_all_orders')
+    client.get('/customer_list')
+    client.get(f'/customer_details/{customer_id}')
+    client.get('/report')
+    client.get('/popularity')
+    client.post('/update_order_status', data={'order_id': order_id, 'new_status': 'Completed'})
+    client.get('/logout')
+
+def run(role_models=None):
+    """
+    Run the sessions against a new database and return the route query counters.
+    role_models replaces the models the current user is loaded as.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'routes.db')}")
+        db.metadata.create_all(engine)
+        session = scoped_session(sessionmaker(bind=engine))
+        with patch('orderapp.db.session', session), \
+                patch.dict('orderapp.current_user.ROLE_MODELS', role_models or {}):
+            ids = seed(session)
+            session.remove()
+            route_query_stats.clear()
+            run_sessions(app.test_client(), *ids)
+            session.remove()
+        engine.dispose()
+    return route_query_stats.stats()
+
+def run_in_new_process(role_models=None):
+    """Run the sessions in a new process, starting with empty caches"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+        return executor.submit(run, role_models).result()
+
+def main():
+    baseline = run_in_new_process(BASELINE_ROLE_MODELS)
+    current = run_in_new_process()
+
+    print(f"{'Route':<35}{'Requests':>10}{'Baseline':>10}{'Queries':>10}{'Saved':>10}{'Average':>10}")
+    for endpoint, counters in current.items():
+        before = baseline.get(endpoint, counters)['queries']
+        print(f"{endpoint:<35}{counters['requests']:>10}{before:>10}{counters['queries']:>10}"
+              f"{before - counters['queries']:>10}{counters['average']:>10}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,4 @@
+import os
+
+# Select the test configuration profile before the app is imported
+os.environ.setdefault('ORDERAPP_ENV', 'test')
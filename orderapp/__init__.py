@@ -1,13 +1,24 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_hashing import Hashing
-from orderapp.config import Config
+from orderapp.config import get_config
+from orderapp.json_provider import json_provider
+from orderapp.pool_stats import pool_stats
+from orderapp.routing import RoutingSession
 
 app = Flask(__name__)
-app.config.from_object(Config)
+app.config.from_object(get_config())
+app.json = json_provider(app)
+# The pool telemetry is created before the app, since the config uses its pool class
+pool_stats.slow_wait = app.config['DB_POOL_SLOW_WAIT']
 
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+# Count the pool of the primary and of each bind, such as the read replica, separately
+with app.app_context():
+    for bind_key, engine in db.engines.items():
+        pool_stats.track(bind_key or 'primary', engine)
 hashing = Hashing(app)
 
 # Import views after app initialization
-from orderapp.views import staff, customer, main
+from orderapp.views import staff, customer, main, api
+from orderapp import commands, current_user, directory, query_stats, reaper
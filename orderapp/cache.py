@@ -0,0 +1,228 @@
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+from jinja2 import nodes
+from jinja2.ext import Extension
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from orderapp import app
+from orderapp.models.item import Item
+from orderapp.versions import mark_content_changed
+
+class CatalogCache:
+    """
+    In-process cache for catalog data.
+    Every entry remembers the catalog version it was loaded at, so bumping the version
+    invalidates all entries at once. Entries also expire after a TTL, which bounds how
+    long another process's changes can go unnoticed.
+    """
+
+    def __init__(self, max_entries=256, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, loader):
+        """
+        Return the cached value for the key, calling loader() to fill it on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                version, expires_at, value = entry
+                if version == self.version and expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            version = self.version
+
+        value = loader()
+
+        with self._lock:
+            # Don't keep a value that was loaded while the catalog changed
+            if version == self.version:
+                self._entries[key] = (version, time.monotonic() + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def bump_version(self):
+        """
+        Move to a new catalog version and drop every cached entry.
+        Return the new version.
+        """
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            return self.version
+
+    def clear(self):
+        """
+        Drop every cached entry and reset the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Return the cache counters.
+        """
+        with self._lock:
+            return {
+                'version': self.version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+            }
+
+catalog_cache = CatalogCache(max_entries=app.config['CATALOG_CACHE_SIZE'],
+                             ttl=app.config['CATALOG_CACHE_TTL'])
+
+class FragmentCache:
+    """
+    In-process cache for rendered template fragments, shared by every user.
+    The least recently used fragments are evicted to keep within max_entries fragments
+    and max_size characters in total. Fragments are keyed by the shared content versions,
+    so they change with the page's ETag, and expire after a TTL to free unused ones.
+    """
+
+    def __init__(self, max_entries=512, max_size=4 * 1024 * 1024, ttl=300):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_render(self, key, render):
+        """
+        Return the fragment cached for the key, calling render() to fill it on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, fragment = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return fragment
+                self._remove(key)
+            self.misses += 1
+
+        fragment = render()
+
+        with self._lock:
+            # A fragment bigger than the whole cache is never kept
+            if key not in self._entries and len(fragment) <= self.max_size:
+                self._entries[key] = (time.monotonic() + self.ttl, fragment)
+                self.size += len(fragment)
+                while len(self._entries) > self.max_entries or self.size > self.max_size:
+                    self._remove(next(iter(self._entries)))
+                    self.evictions += 1
+        return fragment
+
+    def _remove(self, key):
+        expires_at, fragment = self._entries.pop(key)
+        self.size -= len(fragment)
+
+    def clear(self):
+        """
+        Drop every cached fragment and reset the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """
+        Return the cache counters.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'size': self.size,
+                'max_entries': self.max_entries,
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+            }
+
+fragment_cache = FragmentCache(max_entries=app.config['FRAGMENT_CACHE_SIZE'],
+                               max_size=app.config['FRAGMENT_CACHE_MAX_SIZE'],
+                               ttl=app.config['FRAGMENT_CACHE_TTL'])
+
+class FragmentCacheExtension(Extension):
+    """
+    Template tag that renders a block once for each key and reuses it for every user:
+
+        {% cache 'catalog', catalog_version %} ... {% endcache %}
+
+    The template name and line are part of the key, so the given values only need to change
+    when the block's content does. Only cache blocks that show nothing specific to the user.
+    """
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [nodes.Const(f"{parser.name}:{lineno}"), parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.Tuple(key, 'load')]),
+                               [], [], body).set_lineno(lineno)
+
+    def _render(self, key, caller):
+        return fragment_cache.get_or_render(key, caller)
+
+app.jinja_env.add_extension(FragmentCacheExtension)
+
+def mark_catalog_changed(session):
+    """
+    Flag the session so the catalog version is bumped when it commits.
+    Use this for changes made with plain SQL statements, which the flush hook can't see.
+    """
+    session.info['catalog_changed'] = True
+    mark_content_changed(session, 'catalog')
+
+@event.listens_for(Session, 'after_flush')
+def _track_item_changes(session, flush_context):
+    """
+    Flag the session if any item was added, changed or removed in this flush.
+    """
+    if any(isinstance(obj, Item) for obj in chain(session.new, session.dirty, session.deleted)):
+        mark_catalog_changed(session)
+
+@event.listens_for(Session, 'after_commit')
+def _bump_catalog_version(session):
+    """
+    Bump the catalog version once the item changes are committed.
+    """
+    if session.info.pop('catalog_changed', False):
+        catalog_cache.bump_version()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_item_changes(session):
+    """
+    Forget the item changes when the transaction is rolled back.
+    """
+    session.info.pop('catalog_changed', None)
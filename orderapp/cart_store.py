@@ -0,0 +1,170 @@
+import json
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import session
+from orderapp import app, db
+from orderapp.models.cart import SavedCart
+
+class Cart:
+    """
+    Shopping cart lines keyed by (item id, cart item type).
+    Each line is a dictionary with the id, type, name, price, quantity and subtotal.
+    """
+
+    def __init__(self, lines=None):
+        self._lines = {(line['id'], line['type']): line for line in lines or []}
+
+    def add(self, item_id, item_type, name, price, quantity, subtotal):
+        """
+        Add a quantity of an item, adding to the line if the item is already in the cart.
+        """
+        line = self._lines.get((item_id, item_type))
+        if line:
+            line['quantity'] += quantity
+            line['subtotal'] = round(float(line['subtotal']) + subtotal, 2)
+        else:
+            self._lines[(item_id, item_type)] = {
+                'id': item_id,
+                'type': item_type,
+                'name': name,
+                'price': float(price),
+                'quantity': quantity,
+                'subtotal': round(float(subtotal), 2)
+            }
+
+    @property
+    def lines(self):
+        """
+        Return copies of the cart lines in the order they were added.
+        """
+        return [dict(line) for line in self._lines.values()]
+
+    @property
+    def subtotal(self):
+        return sum(float(line['subtotal']) for line in self._lines.values())
+
+    def __len__(self):
+        return len(self._lines)
+
+    def to_json(self):
+        return json.dumps(list(self._lines.values()))
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(json.loads(data))
+
+class MemoryCartStore:
+    """
+    Keep carts in this process's memory.
+    Carts are lost on restart and aren't shared between processes, so this suits a single process.
+    """
+
+    def __init__(self, ttl=86400):
+        self.ttl = ttl
+        self._carts = {}
+        self._lock = threading.Lock()
+
+    def load(self, cart_id, user_id):
+        """
+        Return the user's cart with the given id, or None if there isn't one.
+        """
+        with self._lock:
+            entry = self._carts.get(cart_id)
+            if entry is None:
+                return None
+            owner, expires_at, data = entry
+            if owner != user_id or expires_at <= time.monotonic():
+                return None
+            return Cart.from_json(data)
+
+    def save(self, cart_id, user_id, cart):
+        with self._lock:
+            self._carts[cart_id] = (user_id, time.monotonic() + self.ttl, cart.to_json())
+
+    def delete(self, cart_id):
+        with self._lock:
+            self._carts.pop(cart_id, None)
+
+    def purge(self):
+        """
+        Remove the expired carts. Return the number of carts removed.
+        """
+        now = time.monotonic()
+        with self._lock:
+            expired = [cart_id for cart_id, (_, expires_at, _) in self._carts.items() if expires_at <= now]
+            for cart_id in expired:
+                del self._carts[cart_id]
+        return len(expired)
+
+class DatabaseCartStore:
+    """
+    Keep carts in the carts table, shared by every process.
+    """
+
+    def __init__(self, ttl=86400):
+        self.ttl = ttl
+
+    def load(self, cart_id, user_id):
+        """
+        Return the user's cart with the given id, or None if there isn't one.
+        """
+        saved = db.session.get(SavedCart, cart_id)
+        if saved is None or saved.user_id != user_id or \
+                saved.updatedAt <= datetime.now() - timedelta(seconds=self.ttl):
+            return None
+        return Cart.from_json(saved.lines)
+
+    def save(self, cart_id, user_id, cart):
+        saved = db.session.get(SavedCart, cart_id)
+        if saved is None:
+            saved = SavedCart(id=cart_id, user_id=user_id)
+            db.session.add(saved)
+        saved.lines = cart.to_json()
+        saved.updatedAt = datetime.now()
+        db.session.commit()
+
+    def delete(self, cart_id):
+        db.session.query(SavedCart).filter(SavedCart.id == cart_id).delete()
+        db.session.commit()
+
+    def purge(self):
+        """
+        Remove the expired carts. Return the number of carts removed.
+        """
+        cutoff = datetime.now() - timedelta(seconds=self.ttl)
+        removed = db.session.query(SavedCart).filter(SavedCart.updatedAt <= cutoff).delete()
+        db.session.commit()
+        return removed
+
+CART_STORES = {
+    'memory': MemoryCartStore,
+    'database': DatabaseCartStore,
+}
+
+cart_store = CART_STORES[app.config['CART_STORE']](ttl=app.config['CART_TTL'])
+
+def load_session_cart():
+    """
+    Return the logged in user's cart, or an empty cart if they don't have one.
+    """
+    cart_id = session.get('cart_id')
+    cart = cart_store.load(cart_id, session['id']) if cart_id else None
+    return cart or Cart()
+
+def save_session_cart(cart):
+    """
+    Save the logged in user's cart, giving the session a cart id the first time.
+    """
+    if 'cart_id' not in session:
+        session['cart_id'] = secrets.token_urlsafe(32)
+    cart_store.save(session['cart_id'], session['id'], cart)
+
+def discard_session_cart():
+    """
+    Delete the logged in user's cart and remove its id from the session.
+    """
+    cart_id = session.pop('cart_id', None)
+    if cart_id:
+        cart_store.delete(cart_id)
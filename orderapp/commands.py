@@ -0,0 +1,41 @@
+import click
+from orderapp import app, db
+from orderapp.cart_store import cart_store
+from orderapp.models.order import Order
+from orderapp.models.report import ItemDailySales, ItemSales, SalesRollup
+from orderapp.reaper import reap_unpaid_orders
+
+@app.cli.command('rebuild-sales-rollups')
+def rebuild_sales_rollups():
+    """Recompute the sales rollups from the order history."""
+    order_count = SalesRollup.rebuild()
+    click.echo(f"Sales rollups rebuilt from {order_count} orders.")
+
+@app.cli.command('rebuild-item-sales')
+def rebuild_item_sales():
+    """Recompute the item sales counters and daily counters from the order history."""
+    item_count = ItemSales.rebuild()
+    day_count = ItemDailySales.rebuild()
+    click.echo(f"Sales counters rebuilt for {item_count} items, with {day_count} daily counters.")
+
+@app.cli.command('verify-order-totals')
+def verify_order_totals():
+    """Check the stored order totals against the order lines."""
+    mismatched = [order for order in db.session.query(Order).filter(Order.totalAmount.isnot(None))
+                  if not order.verify_total()]
+    for order in mismatched:
+        click.echo(f"Order {order.orderNumber}: stored {order.totalAmount:.2f}, calculated {order.calculate_total():.2f}")
+    click.echo(f"{len(mismatched)} orders with a mismatched total.")
+
+@app.cli.command('purge-carts')
+def purge_carts():
+    """Remove the carts that haven't been used within CART_TTL."""
+    removed = cart_store.purge()
+    click.echo(f"{removed} expired carts removed.")
+
+@app.cli.command('reap-unpaid-orders')
+@click.option('--grace', type=int, default=None, help='Seconds an order may stay unpaid, UNPAID_ORDER_GRACE by default.')
+def reap_unpaid_orders_command(grace):
+    """Delete the orders left unpaid past the grace period, with their order lines."""
+    deleted = reap_unpaid_orders(grace=grace)
+    click.echo(f"{deleted} unpaid orders deleted.")
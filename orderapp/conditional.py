@@ -0,0 +1,97 @@
+import threading
+from datetime import timezone
+from itertools import chain
+from flask import g, request, session, template_rendered
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from werkzeug.http import generate_etag
+from orderapp import app, db
+from orderapp.models.order import Order
+from orderapp.versions import content_versions, mark_content_changed
+
+class ConditionalStats:
+    """
+    Count the conditional GET requests of each route, and how many were answered with a 304.
+    """
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, not_modified):
+        """
+        Add one request to the endpoint's counters.
+        """
+        with self._lock:
+            requests, hits = self._routes.get(endpoint, (0, 0))
+            self._routes[endpoint] = (requests + 1, hits + bool(not_modified))
+
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+
+    def stats(self):
+        """
+        Return the counters of each endpoint, with the share of requests answered with a 304.
+        """
+        with self._lock:
+            return {
+                endpoint: {
+                    'requests': requests,
+                    'not_modified': hits,
+                    'hit_rate': round(hits / requests, 3),
+                }
+                for endpoint, (requests, hits) in sorted(self._routes.items())
+            }
+
+conditional_stats = ConditionalStats()
+
+def page_etag(*parts):
+    """
+    Return the ETag of a page showing content at the given versions.
+    The logged in user is part of the tag, since every page shows their name and role specific links.
+    """
+    key = ':'.join(str(part) for part in (request.endpoint, session.get('id'), session.get('role')) + parts)
+    return generate_etag(key.encode())
+
+def catalog_etag(*args, **kwargs):
+    """
+    ETag of the catalog pages, from the catalog version.
+    """
+    return page_etag(content_versions.get('catalog')), None
+
+def order_list_etag(*args, **kwargs):
+    """
+    ETag of an order list page, from the orders version and the page's filters.
+    """
+    return page_etag(content_versions.get('orders'), request.query_string.decode()), None
+
+def order_etag(order_id, **kwargs):
+    """
+    ETag and last modified time of an order's page, from its id, status and when it was last updated.
+    Return None for an order that doesn't exist or that the user may not view, so the view can answer it
+    without revealing whether the order exists or when it changed.
+    """
+    order = db.session.execute(
+        select(Order.orderStatus, Order.updatedAt, Order.customer_id).where(Order.id == order_id)).first()
+    if order is None or (session.get('role') != 'staff' and order.customer_id != session.get('id')):
+        return None
+    # updatedAt is stored in UTC without a time zone
+    return (page_etag(order_id, order.orderStatus, order.updatedAt.isoformat()),
+            order.updatedAt.replace(tzinfo=timezone.utc))
+
+@event.listens_for(Session, 'after_flush')
+def _track_order_changes(session, flush_context):
+    """
+    Flag the session if any order was added, changed or removed in this flush.
+    """
+    if any(isinstance(obj, Order) for obj in chain(session.new, session.dirty, session.deleted)):
+        mark_content_changed(session, 'orders')
+
+@template_rendered.connect_via(app)
+def _note_error_page(sender, template, context, **extra):
+    """
+    Note a route that caught an error and rendered the error page, so the page isn't tagged.
+    """
+    if template.name == 'error.html':
+        g.error_page = True
@@ -96,20 +96,32 @@ CREATE TABLE premade_boxes (
         FOREIGN KEY(id) REFERENCES items (id)
 );
 
+CREATE INDEX ix_premade_boxes_custom ON premade_boxes (`isCustom`);
+
 DROP TABLE IF EXISTS orders;
 CREATE TABLE orders (
         id INTEGER NOT NULL AUTO_INCREMENT, 
         `orderDate` DATE NOT NULL, 
+        `createdAt` DATETIME NOT NULL, 
+        `updatedAt` DATETIME(6) NOT NULL, 
         `orderNumber` VARCHAR(50) NOT NULL, 
         `deliveryMethod` ENUM('Delivery','Pickup') NOT NULL, 
         `orderStatus` ENUM('Pending','Processed','Completed','Cancelled') NOT NULL, 
         `paymentMethod` ENUM('Credit Card','Debit Card','Account') NOT NULL, 
         customer_id INTEGER NOT NULL, 
+        `totalAmount` FLOAT, 
+        `discountAmount` FLOAT, 
+        `deliveryFee` FLOAT, 
         PRIMARY KEY (id), 
         UNIQUE (`orderNumber`), 
         FOREIGN KEY(customer_id) REFERENCES users (id)
 );
 
+CREATE INDEX ix_orders_date_id ON orders (`orderDate`, id);
+CREATE INDEX ix_orders_status_date_id ON orders (`orderStatus`, `orderDate`, id);
+CREATE INDEX ix_orders_created ON orders (`createdAt`);
+CREATE INDEX ix_orders_customer_date ON orders (customer_id, `orderDate`);
+
 DROP TABLE IF EXISTS order_lines;
 CREATE TABLE order_lines (
         id INTEGER NOT NULL AUTO_INCREMENT, 
@@ -122,6 +134,9 @@ CREATE TABLE order_lines (
         FOREIGN KEY(item_id) REFERENCES items (id)
 );
 
+CREATE INDEX ix_order_lines_order ON order_lines (order_id);
+CREATE INDEX ix_order_lines_item ON order_lines (item_id);
+
 DROP TABLE IF EXISTS payments;
 CREATE TABLE payments (
         id INTEGER NOT NULL AUTO_INCREMENT, 
@@ -136,6 +151,8 @@ CREATE TABLE payments (
         FOREIGN KEY(order_id) REFERENCES orders (id)
 );
 
+CREATE INDEX ix_payments_customer ON payments (customer_id);
+
 DROP TABLE IF EXISTS credit_card_payments;
 CREATE TABLE credit_card_payments (
         id INTEGER NOT NULL, 
@@ -172,4 +189,62 @@ CREATE TABLE box_contents (
         FOREIGN KEY(veggie_id) REFERENCES veggies (id), 
         FOREIGN KEY(customer_id) REFERENCES customers (id), 
         FOREIGN KEY(order_id) REFERENCES orders (id)
-);
\ No newline at end of file
+);
+
+CREATE INDEX ix_box_contents_box ON box_contents (box_id);
+CREATE INDEX ix_box_contents_order ON box_contents (order_id);
+
+DROP TABLE IF EXISTS id_sequences;
+CREATE TABLE id_sequences (
+        name VARCHAR(50) NOT NULL, 
+        `nextValue` INTEGER NOT NULL, 
+        PRIMARY KEY (name)
+);
+
+DROP TABLE IF EXISTS sales_rollups;
+CREATE TABLE sales_rollups (
+        period VARCHAR(10) NOT NULL, 
+        year INTEGER NOT NULL, 
+        month INTEGER NOT NULL, 
+        week INTEGER NOT NULL, 
+        total FLOAT NOT NULL, 
+        `orderCount` INTEGER NOT NULL, 
+        PRIMARY KEY (period, year, month, week)
+);
+
+DROP TABLE IF EXISTS item_sales;
+CREATE TABLE item_sales (
+        item_id INTEGER NOT NULL, 
+        `orderCount` INTEGER NOT NULL, 
+        `unitsSold` FLOAT NOT NULL, 
+        revenue FLOAT NOT NULL, 
+        PRIMARY KEY (item_id), 
+        FOREIGN KEY(item_id) REFERENCES items (id)
+);
+
+CREATE INDEX ix_item_sales_order_count ON item_sales (`orderCount`, item_id);
+CREATE INDEX ix_item_sales_units_sold ON item_sales (`unitsSold`, item_id);
+CREATE INDEX ix_item_sales_revenue ON item_sales (revenue, item_id);
+
+DROP TABLE IF EXISTS item_daily_sales;
+CREATE TABLE item_daily_sales (
+        day DATE NOT NULL, 
+        item_id INTEGER NOT NULL, 
+        `orderCount` INTEGER NOT NULL, 
+        `unitsSold` FLOAT NOT NULL, 
+        revenue FLOAT NOT NULL, 
+        PRIMARY KEY (day, item_id), 
+        FOREIGN KEY(item_id) REFERENCES items (id)
+);
+
+DROP TABLE IF EXISTS carts;
+CREATE TABLE carts (
+        id VARCHAR(64) NOT NULL, 
+        user_id INTEGER NOT NULL, 
+        `lines` TEXT NOT NULL, 
+        `updatedAt` DATETIME NOT NULL, 
+        PRIMARY KEY (id), 
+        FOREIGN KEY(user_id) REFERENCES users (id)
+);
+
+CREATE INDEX `ix_carts_updatedAt` ON carts (`updatedAt`);
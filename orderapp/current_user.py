@@ -0,0 +1,26 @@
+from flask import g, request, session
+from orderapp import app, db
+from orderapp.models.user import CorporateCustomer, Customer, Staff
+
+# Model loaded for each role, so only the inheritance tables of that role are joined
+ROLE_MODELS = {
+    'staff': Staff,
+    'private_customer': Customer,
+    'corporate_customer': CorporateCustomer,
+}
+
+@app.before_request
+def load_current_user():
+    """
+    Load the logged in user into g.user once per request.
+    Only routes marked with withCurrentUser load the user, and only when the role fits the route.
+    """
+    g.user = None
+    view = app.view_functions.get(request.endpoint)
+    required_model = getattr(view, 'current_user_model', None)
+    model = ROLE_MODELS.get(session.get('role'))
+
+    if required_model is None or 'loggedin' not in session or model is None:
+        return
+    if issubclass(model, required_model):
+        g.user = db.session.get(model, session['id'])
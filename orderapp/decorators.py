@@ -2,7 +2,14 @@ from flask import redirect
 from flask import url_for
 from flask import render_template
 from flask import session
+from flask import abort
+from flask import g
+from flask import make_response
+from flask import request
+from flask import jsonify
 from functools import wraps
+import time
+from orderapp.conditional import conditional_stats
 
 def isLoggedIn(f):
     """
@@ -35,3 +42,84 @@ def isAuthorized(allowed_roles=None):
                 return redirect(url_for('login'))
         return my_wrapper
     return my_decorator
+
+def isApiAuthorized(allowed_roles=None):
+    """
+    Login is required for accessing an API route, with one of the allowed roles if any are given.
+    Instead of redirecting to the login page, the route returns a JSON error with status 401 or 403.
+    """
+    def my_decorator(f):
+        @wraps(f)
+        def my_wrapper(*args, **kwargs):
+            if 'loggedin' not in session:
+                return jsonify({'error': 'Login required'}), 401
+            if allowed_roles and session.get('role') not in allowed_roles:
+                return jsonify({'error': 'Access Denied'}), 403
+            return f(*args, **kwargs)
+        return my_wrapper
+    return my_decorator
+
+def withCurrentUser(model):
+    """
+    The route uses the logged in user, loaded into g.user before the request.
+    The user must be an instance of the model, otherwise the route returns 404.
+    """
+    def my_decorator(f):
+        @wraps(f)
+        def my_wrapper(*args, **kwargs):
+            if g.get('user') is None:
+                abort(404)
+            return f(*args, **kwargs)
+        my_wrapper.current_user_model = model
+        return my_wrapper
+    return my_decorator
+
+def readFromReplica(f):
+    """
+    The route's queries are sent to the read replica, if one is configured.
+    A user who wrote recently keeps reading from the primary, so they see their own changes.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.read_replica = session.get('read_primary_until', 0) < time.time()
+        return f(*args, **kwargs)
+    return decorated_function
+
+def withETag(etag_for):
+    """
+    Answer a conditional GET with 304 Not Modified without running the route.
+    etag_for is called with the route's arguments and returns the page's ETag and last modified
+    time in UTC or None, or None to run the route without a tag. The page is tagged unless it is an error.
+    """
+    def my_decorator(f):
+        @wraps(f)
+        def my_wrapper(*args, **kwargs):
+            validators = etag_for(*args, **kwargs)
+            if validators is None:
+                return f(*args, **kwargs)
+
+            etag, last_modified = validators
+            if request.if_none_match:
+                not_modified = etag in request.if_none_match
+            else:
+                not_modified = bool(last_modified and request.if_modified_since
+                                    and last_modified.replace(microsecond=0) <= request.if_modified_since)
+            conditional_stats.record(request.endpoint, not_modified)
+
+            if not_modified:
+                response = make_response('', 304)
+            else:
+                g.error_page = False
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200 or g.error_page:
+                    return response
+
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+            # Pages are per user, caches keep them but check back every time
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return my_wrapper
+    return my_decorator
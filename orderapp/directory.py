@@ -0,0 +1,199 @@
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import namedtuple
+from itertools import chain
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from orderapp import app, db
+from orderapp.models.user import Customer, User
+
+CustomerEntry = namedtuple('CustomerEntry', ['id', 'firstname', 'lastname', 'username', 'type'])
+
+# Polymorphic identities of Customer and its subclasses
+CUSTOMER_TYPES = [mapper.polymorphic_identity for mapper in Customer.__mapper__.self_and_descendants]
+
+class CustomerDirectory:
+    """
+    In-memory prefix index of the customers for the staff customer directory.
+    Every customer's username, first name and last name are kept lowercased in one sorted
+    array of (name, id) keys, so a prefix search is a binary search followed by a short scan.
+    Changes committed in this process are applied as they happen. The index is also
+    reloaded after reload_interval seconds to pick up changes made by other processes.
+    """
+
+    def __init__(self, reload_interval=600):
+        self.reload_interval = reload_interval
+        self._entries = {}
+        self._keys = []
+        self._loaded_at = None
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _terms(entry):
+        """
+        Return the lowercased names a customer can be found by.
+        """
+        return {entry.username.lower(), entry.firstname.lower(), entry.lastname.lower()}
+
+    def build(self, entries):
+        """
+        Replace the index with the given customer entries.
+        """
+        keys = sorted((term, entry.id) for entry in entries for term in self._terms(entry))
+        with self._lock:
+            self._entries = {entry.id: entry for entry in entries}
+            self._keys = keys
+            self._loaded_at = time.monotonic()
+
+    def load(self):
+        """
+        Build the index from the users table.
+        Only the user columns are read, the customer tables don't need to be joined.
+        """
+        rows = db.session.execute(
+            select(User.id, User.firstname, User.lastname, User.username, User.type).
+            where(User.type.in_(CUSTOMER_TYPES))).all()
+        self.build([CustomerEntry(*row) for row in rows])
+
+    @property
+    def loaded(self):
+        return self._loaded_at is not None
+
+    def _ensure_loaded(self):
+        """
+        Load the index on first use, and again once it is older than the reload interval.
+        """
+        if not self.loaded or (self.reload_interval and
+                               time.monotonic() - self._loaded_at > self.reload_interval):
+            self.load()
+
+    def put(self, entry):
+        """
+        Add a customer to the index, or replace their names if they are already in it.
+        """
+        with self._lock:
+            self._remove(entry.id)
+            self._entries[entry.id] = entry
+            for term in self._terms(entry):
+                insort(self._keys, (term, entry.id))
+
+    def remove(self, customer_id):
+        """
+        Remove a customer from the index.
+        """
+        with self._lock:
+            self._remove(customer_id)
+
+    def _remove(self, customer_id):
+        entry = self._entries.pop(customer_id, None)
+        if entry is None:
+            return
+        for term in self._terms(entry):
+            position = bisect_left(self._keys, (term, customer_id))
+            if position < len(self._keys) and self._keys[position] == (term, customer_id):
+                del self._keys[position]
+
+    def search(self, prefix='', after=None, limit=20):
+        """
+        Find the customers with a username, first name or last name starting with the prefix.
+        Customers are listed once each, in order of their first matching name.
+        After: cursor of the last customer on the previous page.
+        Return a dictionary with a page of customer entries, and the cursor of the next page or None on the last page.
+        Raise ValueError if the cursor is invalid.
+        """
+        self._ensure_loaded()
+        prefix = (prefix or '').strip().lower()
+        customers = []
+        next_cursor = None
+
+        with self._lock:
+            if after:
+                position = bisect_right(self._keys, self._decode_cursor(after))
+            else:
+                position = bisect_left(self._keys, (prefix,))
+
+            last_key = None
+            while position < len(self._keys):
+                term, customer_id = self._keys[position]
+                position += 1
+                if not term.startswith(prefix):
+                    break
+                entry = self._entries[customer_id]
+                # Skip the customer's other names, they are listed under the first one that matches
+                if min(name for name in self._terms(entry) if name.startswith(prefix)) != term:
+                    continue
+                if len(customers) == limit:
+                    next_cursor = self._encode_cursor(last_key)
+                    break
+                customers.append(entry)
+                last_key = (term, customer_id)
+
+        return {'customers': customers, 'next_cursor': next_cursor}
+
+    @staticmethod
+    def _encode_cursor(key):
+        term, customer_id = key
+        return f"{customer_id}:{term}"
+
+    @staticmethod
+    def _decode_cursor(cursor):
+        try:
+            customer_id, term = cursor.split(':', 1)
+            return (term, int(customer_id))
+        except (AttributeError, ValueError):
+            raise ValueError(f"Invalid page cursor: {cursor}")
+
+    def stats(self):
+        """
+        Return the index counters.
+        """
+        with self._lock:
+            return {
+                'customers': len(self._entries),
+                'keys': len(self._keys),
+                'age': time.monotonic() - self._loaded_at if self.loaded else None,
+            }
+
+customer_directory = CustomerDirectory(reload_interval=app.config['CUSTOMER_DIRECTORY_RELOAD'])
+
+def _names_changed(customer):
+    state = inspect(customer)
+    return any(state.attrs[name].history.has_changes() for name in ['firstname', 'lastname', 'username'])
+
+@event.listens_for(Session, 'after_flush')
+def _track_customer_changes(session, flush_context):
+    """
+    Remember the customers added, renamed or removed in this flush.
+    """
+    changes = session.info.setdefault('customer_changes', {})
+    for customer in chain(session.new, session.dirty):
+        if isinstance(customer, Customer) and (customer in session.new or _names_changed(customer)):
+            changes[customer.id] = CustomerEntry(customer.id, customer.firstname, customer.lastname,
+                                                 customer.username, customer.type)
+    for customer in session.deleted:
+        if isinstance(customer, Customer):
+            changes[customer.id] = None
+    if not changes:
+        session.info.pop('customer_changes')
+
+@event.listens_for(Session, 'after_commit')
+def _apply_customer_changes(session):
+    """
+    Apply the committed customer changes to the directory.
+    """
+    changes = session.info.pop('customer_changes', {})
+    if not customer_directory.loaded:
+        return
+    for customer_id, entry in changes.items():
+        if entry is None:
+            customer_directory.remove(customer_id)
+        else:
+            customer_directory.put(entry)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_customer_changes(session):
+    """
+    Forget the customer changes when the transaction is rolled back.
+    """
+    session.info.pop('customer_changes', None)
@@ -8,13 +8,13 @@ from orderapp.models.user import Staff, Customer, CorporateCustomer
 from orderapp.models.item import WeightedVeggie, PackVeggie, UnitPriceVeggie, PremadeBox
 from orderapp.models.order import Order, OrderLine
 from orderapp.models.payment import CreditCardPayment, DebitCardPayment
-from orderapp.config import Config
+from orderapp.config import get_config
 
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(parent_dir)
 
 # Create engine using the configuration
-engine = create_engine(Config.SQLALCHEMY_DATABASE_URI)
+engine = create_engine(get_config().SQLALCHEMY_DATABASE_URI)
 
 # Create all tables
 db.metadata.create_all(engine)
@@ -106,6 +106,10 @@ def insert_initial_data():
     ]
     session.add_all(payments)
 
+    # Store the totals of the paid orders
+    for order in orders:
+        order.record_totals()
+
     # Commit the session
     session.commit()
 
@@ -0,0 +1,53 @@
+from datetime import date
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _default(o):
+    """
+    Write dates as ISO 8601 strings, other values are converted the same way as by Flask's default provider.
+    """
+    if isinstance(o, date):
+        return o.isoformat()
+    return DefaultJSONProvider.default(o)
+
+class IsoDateJSONProvider(DefaultJSONProvider):
+    """
+    Flask's default JSON provider, but writing dates as ISO 8601 strings like orjson
+    rather than as HTTP dates, so the API output is the same with either serializer.
+    """
+
+    default = staticmethod(_default)
+
+class OrjsonProvider(IsoDateJSONProvider):
+    """
+    JSON provider that serializes with orjson, which is several times faster than the json module.
+    Dates are written as ISO 8601 strings. Values orjson doesn't know, such as Decimal,
+    are converted the same way as by Flask's default provider.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return self._dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Skip the round trip through str, orjson already returns UTF-8 bytes
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._dumps(obj), mimetype=self.mimetype)
+
+    def _dumps(self, obj):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS)
+
+def json_provider(app):
+    """
+    Return the JSON provider for the app, orjson if it is installed and enabled,
+    otherwise Flask's json module with ISO dates.
+    """
+    if app.config['JSON_SERIALIZER'] == 'orjson' and orjson is not None:
+        return OrjsonProvider(app)
+    return IsoDateJSONProvider(app)
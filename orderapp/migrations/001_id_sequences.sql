@@ -0,0 +1,9 @@
+-- Sequence table for allocating order numbers in blocks.
+-- The order_number row is created on first use, starting after the highest existing order number.
+USE orderapp;
+
+CREATE TABLE IF NOT EXISTS id_sequences (
+        name VARCHAR(50) NOT NULL, 
+        `nextValue` INTEGER NOT NULL, 
+        PRIMARY KEY (name)
+);
@@ -0,0 +1,13 @@
+-- Precomputed weekly, monthly and yearly sales for the staff report.
+-- Fill it from the existing orders afterwards with: flask --app orderapp rebuild-sales-rollups
+USE orderapp;
+
+CREATE TABLE IF NOT EXISTS sales_rollups (
+        period VARCHAR(10) NOT NULL, 
+        year INTEGER NOT NULL, 
+        month INTEGER NOT NULL, 
+        week INTEGER NOT NULL, 
+        total FLOAT NOT NULL, 
+        `orderCount` INTEGER NOT NULL, 
+        PRIMARY KEY (period, year, month, week)
+);
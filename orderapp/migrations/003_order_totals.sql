@@ -0,0 +1,26 @@
+-- Store the total, discount and delivery fee of each order when it is paid.
+-- Existing paid orders are backfilled the same way as Order.record_totals.
+-- Check them afterwards with: flask --app orderapp verify-order-totals
+USE orderapp;
+
+ALTER TABLE orders
+        ADD COLUMN `totalAmount` FLOAT, 
+        ADD COLUMN `discountAmount` FLOAT, 
+        ADD COLUMN `deliveryFee` FLOAT;
+
+UPDATE orders
+        JOIN users ON users.id = orders.customer_id
+        JOIN payments ON payments.order_id = orders.id
+        LEFT JOIN (
+                SELECT order_id, SUM(subtotal) AS subtotal
+                FROM order_lines
+                GROUP BY order_id
+        ) AS line_totals ON line_totals.order_id = orders.id
+SET
+        orders.`deliveryFee` = CASE WHEN orders.`deliveryMethod` = 'Delivery' THEN 10.00 ELSE 0 END,
+        orders.`discountAmount` = CASE WHEN users.type = 'corporate_customer'
+                THEN COALESCE(line_totals.subtotal, 0) - COALESCE(line_totals.subtotal, 0) * 0.9 ELSE 0 END,
+        orders.`totalAmount` = CASE WHEN users.type = 'corporate_customer'
+                THEN COALESCE(line_totals.subtotal, 0) * 0.9 ELSE COALESCE(line_totals.subtotal, 0) END
+                + CASE WHEN orders.`deliveryMethod` = 'Delivery' THEN 10.00 ELSE 0 END
+WHERE orders.`totalAmount` IS NULL;
@@ -0,0 +1,5 @@
+-- Indexes for paging through the staff order list newest first, with and without a status filter.
+USE orderapp;
+
+CREATE INDEX ix_orders_date_id ON orders (`orderDate`, id);
+CREATE INDEX ix_orders_status_date_id ON orders (`orderStatus`, `orderDate`, id);
@@ -0,0 +1,14 @@
+-- Server-side shopping carts, the session cookie only holds the cart id.
+-- Remove expired carts with: flask --app orderapp purge-carts
+USE orderapp;
+
+CREATE TABLE IF NOT EXISTS carts (
+        id VARCHAR(64) NOT NULL, 
+        user_id INTEGER NOT NULL, 
+        `lines` TEXT NOT NULL, 
+        `updatedAt` DATETIME NOT NULL, 
+        PRIMARY KEY (id), 
+        FOREIGN KEY(user_id) REFERENCES users (id)
+);
+
+CREATE INDEX `ix_carts_updatedAt` ON carts (`updatedAt`);
@@ -0,0 +1,11 @@
+-- Record when each order was created, so abandoned unpaid orders can be removed after a grace period.
+-- Existing orders are backfilled from their order date, today's keep the migration time.
+-- Remove them with: flask --app orderapp reap-unpaid-orders
+USE orderapp;
+
+ALTER TABLE orders
+        ADD COLUMN `createdAt` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP AFTER `orderDate`;
+
+UPDATE orders SET `createdAt` = `orderDate` WHERE `orderDate` < CURRENT_DATE;
+
+CREATE INDEX ix_orders_created ON orders (`createdAt`);
@@ -0,0 +1,14 @@
+-- Sales counters of each item for the staff popularity page.
+-- Fill it from the existing orders afterwards with: flask --app orderapp rebuild-item-sales
+USE orderapp;
+
+CREATE TABLE IF NOT EXISTS item_sales (
+        item_id INTEGER NOT NULL, 
+        `orderCount` INTEGER NOT NULL, 
+        `unitsSold` FLOAT NOT NULL, 
+        revenue FLOAT NOT NULL, 
+        PRIMARY KEY (item_id), 
+        FOREIGN KEY(item_id) REFERENCES items (id)
+);
+
+CREATE INDEX ix_item_sales_order_count ON item_sales (`orderCount`, item_id);
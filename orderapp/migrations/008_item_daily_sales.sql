@@ -0,0 +1,17 @@
+-- Daily sales counters of each item for the popularity of the last 7, 30 and 90 days,
+-- and indexes for ranking the all time counters by units sold and revenue.
+-- Fill it from the existing orders afterwards with: flask --app orderapp rebuild-item-sales
+USE orderapp;
+
+CREATE TABLE IF NOT EXISTS item_daily_sales (
+        day DATE NOT NULL, 
+        item_id INTEGER NOT NULL, 
+        `orderCount` INTEGER NOT NULL, 
+        `unitsSold` FLOAT NOT NULL, 
+        revenue FLOAT NOT NULL, 
+        PRIMARY KEY (day, item_id), 
+        FOREIGN KEY(item_id) REFERENCES items (id)
+);
+
+CREATE INDEX ix_item_sales_units_sold ON item_sales (`unitsSold`, item_id);
+CREATE INDEX ix_item_sales_revenue ON item_sales (revenue, item_id);
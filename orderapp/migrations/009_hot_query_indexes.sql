@@ -0,0 +1,13 @@
+-- Indexes for the foreign key and filter columns of the hot queries:
+-- order history, order lines, box contents, payment history and the default premade boxes.
+-- MySQL already indexes foreign key columns on its own, these replace those implicit indexes
+-- with named ones, and orders gets a composite index that also covers the history's sort.
+USE orderapp;
+
+CREATE INDEX ix_orders_customer_date ON orders (customer_id, `orderDate`);
+CREATE INDEX ix_order_lines_order ON order_lines (order_id);
+CREATE INDEX ix_order_lines_item ON order_lines (item_id);
+CREATE INDEX ix_box_contents_box ON box_contents (box_id);
+CREATE INDEX ix_box_contents_order ON box_contents (order_id);
+CREATE INDEX ix_payments_customer ON payments (customer_id);
+CREATE INDEX ix_premade_boxes_custom ON premade_boxes (`isCustom`);
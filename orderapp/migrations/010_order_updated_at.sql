@@ -0,0 +1,9 @@
+-- Record when each order last changed, so order pages can answer conditional GETs with 304 Not Modified.
+-- Existing orders start from when they were created.
+-- The catalog and order list versions are kept in id_sequences, their rows are created on first change.
+USE orderapp;
+
+ALTER TABLE orders
+        ADD COLUMN `updatedAt` DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) AFTER `createdAt`;
+
+UPDATE orders SET `updatedAt` = `createdAt`;
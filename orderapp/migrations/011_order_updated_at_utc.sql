@@ -0,0 +1,9 @@
+-- Keep when each order last changed in UTC, since it is sent as the Last-Modified header of the order's page.
+-- Values written so far are in the server's local time, convert them. The app always sets the column,
+-- so the local time default is dropped, as in create_tables.sql.
+USE orderapp;
+
+UPDATE orders SET `updatedAt` = CONVERT_TZ(`updatedAt`, @@session.time_zone, '+00:00');
+
+ALTER TABLE orders
+        ALTER COLUMN `updatedAt` DROP DEFAULT;
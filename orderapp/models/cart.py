@@ -0,0 +1,15 @@
+from orderapp import db
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime
+from datetime import datetime
+
+class SavedCart(db.Model):
+    """
+    Shopping cart kept in the database, only its id travels in the session cookie.
+    Lines: JSON list of the cart lines.
+    """
+    __tablename__ = 'carts'
+
+    id = Column(String(64), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    lines = Column(Text, nullable=False)
+    updatedAt = Column(DateTime, nullable=False, default=datetime.now, index=True)
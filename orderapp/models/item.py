@@ -1,6 +1,14 @@
 from orderapp import db
-from sqlalchemy import Boolean, Column, Integer, String, Float, ForeignKey, Date, Table, Enum
-from sqlalchemy.orm import relationship
+from sqlalchemy import Boolean, Column, Integer, String, Float, ForeignKey, Date, Index, Table, Enum
+from sqlalchemy.orm import relationship, with_polymorphic
+
+# Item type used in the cart for each item class
+CART_ITEM_TYPES = {
+    'weighted': 'weighted_veggie',
+    'pack': 'pack_veggie',
+    'unit_price': 'unit_price_veggie',
+    'premade_box': 'premade_box',
+}
 
 class Item(db.Model):
     """
@@ -21,6 +29,17 @@ class Item(db.Model):
         'polymorphic_on': type
     }
 
+    @classmethod
+    def load_many(cls, item_ids):
+        """
+        Load several items of any type in a single polymorphic query.
+        Return a dictionary with the item id as the key, and the item as the value.
+        """
+        if not item_ids:
+            return {}
+        items = with_polymorphic(Item, '*')
+        return {item.id: item for item in db.session.query(items).filter(items.id.in_(set(item_ids))).all()}
+
     def calculate_subtotal(self):
         # This method should be overridden in subclasses
         pass
@@ -48,6 +67,15 @@ class Veggie(Item):
         self.vegName = vegName
         self.stock = stock
 
+    @classmethod
+    def load_in_stock(cls):
+        """
+        Load every in-stock veggie subtype in a single polymorphic query.
+        The subtype tables are outer joined, so no extra query is needed per row.
+        """
+        veggies = with_polymorphic(Veggie, [WeightedVeggie, PackVeggie, UnitPriceVeggie])
+        return db.session.query(veggies).filter(veggies.stock > 0).order_by(veggies.id).all()
+
 class WeightedVeggie(Veggie):
     """
     Subclass for weighted veggies.
@@ -153,6 +181,9 @@ box_contents = Table('box_contents', db.Model.metadata,
     Column('veggie_id', Integer, ForeignKey('veggies.id')),
     Column('customer_id', Integer, ForeignKey('customers.id'), nullable=True),
     Column('order_id', Integer, ForeignKey('orders.id'), nullable=True),
+    # Supports loading a box's contents and the boxes customized for an order
+    Index('ix_box_contents_box', 'box_id'),
+    Index('ix_box_contents_order', 'order_id'),
 )
 
 class PremadeBox(Item):
@@ -164,6 +195,10 @@ class PremadeBox(Item):
     IsCustom: Whether the premade box is customized.
     """
     __tablename__ = 'premade_boxes'
+    __table_args__ = (
+        # Supports listing the default boxes without the customized ones
+        Index('ix_premade_boxes_custom', 'isCustom'),
+    )
 
     id = Column(Integer, ForeignKey('items.id'), primary_key=True)
     boxSize = Column(Enum('Small', 'Medium', 'Large'), nullable=False)
@@ -202,6 +237,25 @@ class PremadeBox(Item):
         return db.session.query(Veggie).join(box_contents).filter(
             box_contents.c.box_id == self.id
         ).all()
+
+    @staticmethod
+    def get_contents_for_boxes(box_ids):
+        """
+        Get the contents of several boxes in a single query.
+        Return a dictionary with the box id as the key, and a list of veggie names as the value.
+        """
+        contents = {box_id: [] for box_id in box_ids}
+        if not contents:
+            return contents
+
+        rows = db.session.query(box_contents.c.box_id, Veggie.vegName).\
+            join(Veggie, Veggie.id == box_contents.c.veggie_id).\
+            filter(box_contents.c.box_id.in_(contents)).\
+            order_by(box_contents.c.box_id, Veggie.id).all()
+
+        for box_id, veg_name in rows:
+            contents[box_id].append(veg_name)
+        return contents
     
     def get_price(self):
         """
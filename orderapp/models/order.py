@@ -1,7 +1,32 @@
-from orderapp import db
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Date, Enum
-from sqlalchemy.orm import relationship
-from datetime import date
+from orderapp import app, db
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Date, DateTime, Enum, Index, and_, bindparam, cast, func, insert, or_, select, update
+from sqlalchemy.dialects import mysql
+from sqlalchemy.orm import joinedload, relationship, selectinload, with_polymorphic
+from datetime import date, datetime, timezone
+from collections import defaultdict
+from orderapp.models.item import Item, PremadeBox
+from orderapp.models.sequence import BlockAllocator
+from orderapp.cache import mark_catalog_changed
+
+
+def _utc_now():
+    """
+    Return the current time in UTC, without a time zone to match the DATETIME columns.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+class InsufficientStockError(ValueError):
+    """
+    Raised when an order can't be fulfilled from the current stock.
+    Shortfalls: list of dictionaries with the item id, name, available and requested stock.
+    """
+
+    def __init__(self, shortfalls):
+        self.shortfalls = shortfalls
+        details = ', '.join(
+            f"{shortfall['name']} (Available: {shortfall['available']}, Ordered: {shortfall['requested']})"
+            for shortfall in shortfalls)
+        super().__init__(f"Not enough stock for {details}")
 
 
 class Order(db.Model):
@@ -9,14 +34,32 @@ class Order(db.Model):
     Order class.
     """
     __tablename__ = 'orders'
+    __table_args__ = (
+        # Supports paging through the order list newest first, with and without a status filter
+        Index('ix_orders_date_id', 'orderDate', 'id'),
+        Index('ix_orders_status_date_id', 'orderStatus', 'orderDate', 'id'),
+        # Supports a customer's order history newest first
+        Index('ix_orders_customer_date', 'customer_id', 'orderDate'),
+        # Supports finding abandoned unpaid orders, see reaper.py
+        Index('ix_orders_created', 'createdAt'),
+    )
 
     id = Column(Integer, primary_key=True)
     orderDate = Column(Date, nullable=False, default=date.today)
+    createdAt = Column(DateTime, nullable=False, default=datetime.now)
+    # Moved on by every change to the order, with microseconds so changes within a second tell apart.
+    # Kept in UTC, since it is sent as the Last-Modified header of the order's page.
+    updatedAt = Column(DateTime().with_variant(mysql.DATETIME(fsp=6), 'mysql'), nullable=False,
+                       default=_utc_now, onupdate=_utc_now)
     orderNumber = Column(String(50), unique=True, nullable=False)
     deliveryMethod = Column(Enum('Delivery', 'Pickup'), nullable=False)
     orderStatus = Column(Enum('Pending', 'Processed','Completed','Cancelled'), nullable=False, default='Pending')
     paymentMethod = Column(Enum('Credit Card', 'Debit Card', 'Account'), nullable=False)
     customer_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    # Totals are stored when the order is paid, they are empty until then
+    totalAmount = Column(Float)
+    discountAmount = Column(Float)
+    deliveryFee = Column(Float)
     
     customer = relationship('Customer', foreign_keys=[customer_id])
     payment = relationship('Payment', back_populates='order', uselist=False)
@@ -37,6 +80,26 @@ class Order(db.Model):
         self.orderStatus = orderStatus
         self.orderDate = orderDate or date.today()
 
+    @property
+    def cursor(self):
+        """
+        Return the position of the order in the order list, used to fetch the page after it.
+        """
+        return f"{self.orderDate.isoformat()}_{self.id}"
+
+    @classmethod
+    def before_cursor(cls, cursor):
+        """
+        Return a filter for the orders that come after the cursor in the order list, newest first.
+        Raise ValueError if the cursor is invalid.
+        """
+        try:
+            order_date, order_id = cursor.split('_')
+            order_date, order_id = date.fromisoformat(order_date), int(order_id)
+        except (AttributeError, ValueError):
+            raise ValueError(f"Invalid page cursor: {cursor}")
+        return or_(cls.orderDate < order_date, and_(cls.orderDate == order_date, cls.id < order_id))
+
     def calculate_total(self):
         """
         Calculate the total price of the order.
@@ -51,10 +114,69 @@ class Order(db.Model):
         elif self.deliveryMethod == 'Pickup' and self.customer.type == 'corporate_customer':
             return sum(line.subtotal for line in self.order_lines) * 0.9
 
-    def get_order_details(self):
+    @property
+    def total(self):
+        """
+        Return the total price of the order.
+        Uses the stored total of a paid order, otherwise calculates it from the order lines.
+        """
+        if self.totalAmount is not None:
+            return self.totalAmount
+        return self.calculate_total()
+
+    def record_totals(self):
+        """
+        Store the total, the discount applied and the delivery fee of the order.
+        Called when the order is paid, the caller is responsible for committing.
+        Return the total.
+        """
+        subtotal = sum(line.subtotal for line in self.order_lines)
+        discounted = subtotal * 0.9 if self.customer.type == 'corporate_customer' else subtotal
+        self.deliveryFee = 10.00 if self.deliveryMethod == 'Delivery' else 0.0
+        self.discountAmount = subtotal - discounted
+        self.totalAmount = discounted + self.deliveryFee
+        return self.totalAmount
+
+    def verify_total(self):
+        """
+        Check the stored total against a fresh calculation from the order lines.
+        Return True if they match, or the order has no stored total.
+        """
+        if self.totalAmount is None:
+            return True
+        return abs(self.totalAmount - self.calculate_total()) < 0.005
+
+    @staticmethod
+    def details_options():
+        """
+        Loader options for the order details: the customer is joined in, the order lines and
+        their items of every type are each loaded in one extra query, however many lines there are.
+        Works the same for one order or a page of orders.
+        """
+        return (joinedload(Order.customer),
+                selectinload(Order.order_lines).selectinload(OrderLine.item.of_type(with_polymorphic(Item, '*'))))
+
+    @classmethod
+    def get_details_for_orders(cls, orders):
+        """
+        Get the details of several orders, loaded with details_options.
+        The contents of the premade boxes in all the orders are resolved in one query.
+        Return a list of order details in the same order.
+        """
+        box_contents = PremadeBox.get_contents_for_boxes(
+            list({line.item.id for order in orders for line in order.order_lines if not hasattr(line.item, 'vegName')}))
+        return [order.get_order_details(box_contents) for order in orders]
+
+    def get_order_details(self, box_contents=None):
         """
         Get the order details.
+        Box contents can be passed in as a dictionary from PremadeBox.get_contents_for_boxes.
         """
+        # Resolve the contents of every premade box in the order in one query
+        if box_contents is None:
+            box_contents = PremadeBox.get_contents_for_boxes(
+                [line.item.id for line in self.order_lines if not hasattr(line.item, 'vegName')])
+
         return {
             'id': self.id,
             'orderNumber': self.orderNumber,
@@ -62,8 +184,8 @@ class Order(db.Model):
             'deliveryMethod': self.deliveryMethod,
             'paymentMethod': self.paymentMethod,
             'orderStatus': self.orderStatus,
-            'total': self.calculate_total(),
-            'items': [self._get_item_details(line) for line in self.order_lines],
+            'total': self.total,
+            'items': [self._get_item_details(line, box_contents) for line in self.order_lines],
             'customer': {
                 'id': self.customer.id,
                 'type': self.customer.type,
@@ -73,9 +195,10 @@ class Order(db.Model):
             },
         }
 
-    def _get_item_details(self, line):
+    def _get_item_details(self, line, box_contents=None):
         """
         Get details for a single item in the order.
+        Box contents can be passed in as a dictionary from PremadeBox.get_contents_for_boxes.
         """
         if hasattr(line.item, 'vegName'):
             return {
@@ -86,10 +209,12 @@ class Order(db.Model):
             }
         else:  
             # Premade Box
+            if box_contents is None:
+                box_contents = PremadeBox.get_contents_for_boxes([line.item.id])
             return {
                 'name': line.item.boxSize + ' Premade Box',
                 'size': line.item.boxSize,
-                'contents': [veggie.vegName for veggie in line.item.get_contents()],
+                'contents': box_contents[line.item.id],
                 'quantity': line.quantity,
                 'unit_price': line.item.get_price(),
                 'subtotal': line.subtotal
@@ -107,19 +232,91 @@ class Order(db.Model):
         db.session.add(new_line)
         db.session.commit()
 
+    def add_items(self, items):
+        """
+        Add several items to the order with one bulk insert of order lines.
+        Items: list of (item, quantity) tuples.
+        The order must already be flushed, and the caller is responsible for committing.
+        """
+        for item, quantity in items:
+            if item.stock < quantity:
+                raise ValueError(f"Not enough stock for {self._get_item_name(item)}. Available: {item.stock}, Requested: {quantity}")
+
+        db.session.execute(insert(OrderLine), [
+            {
+                'order_id': self.id,
+                'item_id': item.id,
+                'quantity': quantity,
+                'subtotal': item.calculate_subtotal(quantity)
+            }
+            for item, quantity in items
+        ])
+
     def update_stock(self):
         """
-        Update the stock of items after receiving the payment.
+        Take the order's stock from the items and commit.
         """
+        self.take_stock()
+        db.session.commit()
+
+    def take_stock(self):
+        """
+        Take the order's stock from the items in the current transaction, without committing,
+        so it is saved together with the payment.
+        All the decrements are applied as guarded UPDATE statements, so concurrent orders can't
+        oversell. If any item falls short, the whole transaction is rolled back and an
+        InsufficientStockError lists every shortfall.
+        """
+        # Combine lines for the same item so each item is only updated once
+        quantities = defaultdict(float)
+        names = {}
         for line in self.order_lines:
-            item = line.item
-            if item.stock < line.quantity:
-                raise ValueError(f"Not enough stock for {item.vegName}. Available: {item.stock}, Ordered: {line.quantity}")
-            
-            item.stock -= line.quantity
-            db.session.add(item)
-        
-        db.session.commit()    
+            quantities[line.item.id] += line.quantity
+            names[line.item.id] = self._get_item_name(line.item)
+
+        if not quantities:
+            return
+
+        items = Item.__table__
+        statement = update(items).\
+            where(items.c.id == bindparam('item_id'), items.c.stock >= bindparam('quantity')).\
+            values(stock=items.c.stock - bindparam('quantity'))
+        params = [{'item_id': item_id, 'quantity': quantity} for item_id, quantity in quantities.items()]
+
+        if db.session.get_bind().dialect.supports_sane_multi_rowcount:
+            updated = db.session.execute(statement, params).rowcount
+        else:
+            updated = sum(db.session.execute(statement, param).rowcount for param in params)
+
+        if updated != len(params):
+            db.session.rollback()
+            raise InsufficientStockError(self._get_stock_shortfalls(quantities, names))
+
+        mark_catalog_changed(db.session)
+
+    def _get_stock_shortfalls(self, quantities, names):
+        """
+        Get the items that don't have enough stock for the requested quantities.
+        """
+        stock = dict(db.session.query(Item.id, Item.stock).filter(Item.id.in_(quantities)).all())
+        return [
+            {
+                'item_id': item_id,
+                'name': names[item_id],
+                'available': stock.get(item_id, 0),
+                'requested': quantity
+            }
+            for item_id, quantity in quantities.items()
+            if stock.get(item_id, 0) < quantity
+        ]
+
+    def _get_item_name(self, item):
+        """
+        Helper method to get the name of the item based on its type.
+        """
+        if hasattr(item, 'vegName'):
+            return item.vegName
+        return f"{item.boxSize} Premade Box"
 
 class OrderLine(db.Model):
     """
@@ -127,6 +324,11 @@ class OrderLine(db.Model):
     Each order can have multiple order lines.
     """
     __tablename__ = 'order_lines'
+    __table_args__ = (
+        # Support loading an order's lines and an item's sales
+        Index('ix_order_lines_order', 'order_id'),
+        Index('ix_order_lines_item', 'item_id'),
+    )
 
     id = Column(Integer, primary_key=True)
     order_id = Column(Integer, ForeignKey('orders.id'))
@@ -142,3 +344,16 @@ class OrderLine(db.Model):
         self.item = item
         self.quantity = quantity
         self.subtotal = item.calculate_subtotal(quantity)
+
+
+def _first_order_number(conn):
+    """
+    Start the order number sequence after the highest existing order number.
+    Order numbers are stored as strings, so they are compared as integers.
+    """
+    max_order_number = conn.execute(select(func.max(cast(Order.orderNumber, Integer)))).scalar()
+    return max((max_order_number or 0) + 1, app.config['ORDER_NUMBER_START'])
+
+order_numbers = BlockAllocator('order_number',
+                               block_size=app.config['ORDER_NUMBER_BLOCK_SIZE'],
+                               seed=_first_order_number)
@@ -1,5 +1,5 @@
 from orderapp import db
-from sqlalchemy import Boolean, Column, Integer, String, Float, ForeignKey, Date
+from sqlalchemy import Boolean, Column, Integer, String, Float, ForeignKey, Date, Index
 from sqlalchemy.orm import relationship
 from datetime import date
 from orderapp.models.order import Order
@@ -9,6 +9,10 @@ class Payment(db.Model):
     Base class for all payment types.
     """
     __tablename__ = 'payments'
+    __table_args__ = (
+        # Supports a customer's payment history
+        Index('ix_payments_customer', 'customer_id'),
+    )
 
     id = Column(Integer, primary_key=True)
     paymentAmount = Column(Float, nullable=False)
@@ -89,7 +93,8 @@ class AccountPayment(Payment):
     def process_payment(self):
         """
         Process the payment by adding the payment amount to the customer's balance.
+        The balance is saved when the payment is committed.
         """
-        self.customer.add_to_balance(self.paymentAmount)
+        self.customer.custBalance += self.paymentAmount
         return True
 
@@ -0,0 +1,385 @@
+from orderapp import db
+from sqlalchemy import Column, Date, ForeignKey, Index, Integer, String, Float, and_, case, delete, event, extract, func, insert, select, update
+from sqlalchemy.orm import relationship, selectinload, with_polymorphic
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from datetime import date, timedelta
+from collections import defaultdict, namedtuple
+from orderapp.models.item import Item
+from orderapp.models.order import Order, OrderLine
+from orderapp.models.payment import Payment
+from orderapp.versions import mark_content_changed
+
+
+def increment_row(table, keys, values):
+    """
+    Add the values to the counters of the row with the given keys, creating the row if needed.
+    Uses the database's own upsert so concurrent writers can't lose an increment.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'mysql':
+        statement = mysql_insert(table).values(**keys, **values)
+        db.session.execute(statement.on_duplicate_key_update(
+            {name: table.c[name] + statement.inserted[name] for name in values}))
+    elif dialect == 'sqlite':
+        statement = sqlite_insert(table).values(**keys, **values)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={name: table.c[name] + statement.excluded[name] for name in values}))
+    else:
+        match = and_(*(table.c[name] == value for name, value in keys.items()))
+        result = db.session.execute(update(table).where(match).values(
+            {name: table.c[name] + value for name, value in values.items()}))
+        if result.rowcount == 0:
+            db.session.execute(insert(table).values(**keys, **values))
+
+
+def order_totals(paid_only=False, start_date=None, end_date=None):
+    """
+    Build a subquery with the date and total of each order.
+    Paid orders use their stored total. For the others the corporate discount and the delivery fee
+    are applied in SQL the same way as Order.calculate_total.
+    Use paid_only to skip unpaid and cancelled orders.
+    """
+    # The users table is used directly, the user models import this module
+    users = db.metadata.tables['users']
+
+    subtotal = func.coalesce(func.sum(OrderLine.subtotal), 0)
+    calculated = case((users.c.type == 'corporate_customer', subtotal * 0.9), else_=subtotal) + \
+        case((Order.deliveryMethod == 'Delivery', 10.00), else_=0)
+    total = func.coalesce(Order.totalAmount, calculated)
+
+    query = select(Order.orderDate.label('orderDate'), total.label('total')).\
+        join(users, users.c.id == Order.customer_id).\
+        outerjoin(OrderLine, OrderLine.order_id == Order.id).\
+        group_by(Order.id, Order.orderDate, Order.deliveryMethod, Order.totalAmount, users.c.type)
+
+    if paid_only:
+        query = query.join(Payment, Payment.order_id == Order.id).where(Order.orderStatus != 'Cancelled')
+    if start_date is not None and end_date is not None:
+        query = query.where(Order.orderDate.between(start_date, end_date))
+    return query.subquery()
+
+def weekly_order_totals(orders):
+    """
+    Build a query that sums an order_totals subquery by year, month and week of the month.
+    Rows are year, month, week, total sales and number of orders, in date order.
+    """
+    year = extract('year', orders.c.orderDate)
+    month = extract('month', orders.c.orderDate)
+    week = (extract('day', orders.c.orderDate) - 1) // 7 + 1
+    return select(year, month, week, func.sum(orders.c.total), func.count()).\
+        group_by(year, month, week).\
+        order_by(year, month, week)
+
+class SalesRollup(db.Model):
+    """
+    Precomputed sales total for a week, month or year.
+    Period: 'week', 'month' or 'year'. Month and week are 0 when the period doesn't use them.
+    Week: Week of the month (1-5), the same numbering as the staff report.
+    Only paid orders that haven't been cancelled are counted.
+    """
+    __tablename__ = 'sales_rollups'
+
+    period = Column(String(10), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    month = Column(Integer, primary_key=True, default=0)
+    week = Column(Integer, primary_key=True, default=0)
+    total = Column(Float, nullable=False, default=0.0)
+    orderCount = Column(Integer, nullable=False, default=0)
+
+    @staticmethod
+    def _period_keys(order_date):
+        """
+        Return the keys of the week, month and year rollups an order date falls in.
+        """
+        week_number = (order_date.day - 1) // 7 + 1
+        return [
+            {'period': 'week', 'year': order_date.year, 'month': order_date.month, 'week': week_number},
+            {'period': 'month', 'year': order_date.year, 'month': order_date.month, 'week': 0},
+            {'period': 'year', 'year': order_date.year, 'month': 0, 'week': 0},
+        ]
+
+    @classmethod
+    def record_order(cls, order, sign=1):
+        """
+        Add a paid order's total to its week, month and year.
+        Use sign=-1 to take a cancelled order back out. The caller is responsible for committing.
+        """
+        amount = order.total * sign
+        for keys in cls._period_keys(order.orderDate):
+            increment_row(cls.__table__, keys, {'total': amount, 'orderCount': sign})
+
+    @classmethod
+    def weekly_sales(cls):
+        """
+        Get total sales for each week of each month across all years.
+        Return a dictionary with the week number, month, and year as the key, and the total sales as the value.
+        """
+        rollups = db.session.query(cls).filter(cls.period == 'week', cls.orderCount > 0).\
+            order_by(cls.year, cls.month, cls.week).all()
+        return {f"week{r.week}/{r.month:02d}/{r.year}": r.total for r in rollups}
+
+    @classmethod
+    def monthly_sales(cls, year=None):
+        """
+        Get total sales for each month of the year, the current year by default.
+        Return a dictionary with the month and year as the key, and the total sales as the value.
+        """
+        year = year or date.today().year
+        rollups = db.session.query(cls).filter(cls.period == 'month', cls.year == year, cls.orderCount > 0).\
+            order_by(cls.month).all()
+        return {f"{r.month:02d}/{r.year}": r.total for r in rollups}
+
+    @classmethod
+    def yearly_sales(cls, year=None):
+        """
+        Get total sales for the year, the current year by default.
+        Return a dictionary with the year as the key, and the total sales as the value.
+        """
+        year = year or date.today().year
+        rollup = db.session.get(cls, ('year', year, 0, 0))
+        return {str(year): rollup.total if rollup else 0}
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Recompute all the rollups from the order history.
+        Return the number of orders counted.
+        """
+        totals = defaultdict(float)
+        counts = defaultdict(int)
+
+        # Sum the paid orders by week in SQL, then roll the weeks up into months and years
+        weeks = db.session.execute(weekly_order_totals(order_totals(paid_only=True))).all()
+        for year, month, week, total, order_count in weeks:
+            year, month, week = int(year), int(month), int(week)
+            for key in [('week', year, month, week), ('month', year, month, 0), ('year', year, 0, 0)]:
+                totals[key] += total
+                counts[key] += order_count
+
+        db.session.execute(delete(cls))
+        if totals:
+            db.session.execute(insert(cls), [
+                {'period': period, 'year': year, 'month': month, 'week': week,
+                 'total': total, 'orderCount': counts[(period, year, month, week)]}
+                for (period, year, month, week), total in totals.items()
+            ])
+        # The cached sales pages are keyed by the orders version
+        mark_content_changed(db.session, 'orders')
+        db.session.commit()
+        return sum(count for (period, *_), count in counts.items() if period == 'year')
+
+
+# Popularity rankings, by the counter column they sort on
+POPULARITY_METRICS = {'orders': 'orderCount', 'units': 'unitsSold', 'revenue': 'revenue'}
+
+ItemPopularity = namedtuple('ItemPopularity', ['item', 'orderCount', 'unitsSold', 'revenue'])
+
+def _metric_column(metric):
+    if metric not in POPULARITY_METRICS:
+        raise ValueError(f"Invalid popularity metric: {metric}")
+    return POPULARITY_METRICS[metric]
+
+def _order_item_sales(order):
+    """
+    Sum a paid order's lines by item.
+    Return a dictionary of item id to units sold and revenue.
+    """
+    sales = defaultdict(lambda: [0.0, 0.0])
+    for order_line in order.order_lines:
+        sales[order_line.item_id][0] += order_line.quantity
+        sales[order_line.item_id][1] += order_line.subtotal
+    return sales
+
+def _paid_item_sales(*group_by):
+    """
+    Build a query summing the lines of paid orders that haven't been cancelled by item and the given columns.
+    """
+    return select(OrderLine.item_id, *group_by,
+                  func.count(func.distinct(OrderLine.order_id)).label('orderCount'),
+                  func.sum(OrderLine.quantity).label('unitsSold'),
+                  func.sum(OrderLine.subtotal).label('revenue')).\
+        join(Order, Order.id == OrderLine.order_id).\
+        join(Payment, Payment.order_id == Order.id).\
+        where(Order.orderStatus != 'Cancelled').\
+        group_by(OrderLine.item_id, *group_by)
+
+class ItemSales(db.Model):
+    """
+    Sales counters of an item: the number of orders it is in, units sold and revenue.
+    Every item has a row, created with the item, so the least popular items include those never ordered.
+    Only paid orders that haven't been cancelled are counted.
+    """
+    __tablename__ = 'item_sales'
+    __table_args__ = (
+        # Supports the most and least popular items by each metric as index scans
+        Index('ix_item_sales_order_count', 'orderCount', 'item_id'),
+        Index('ix_item_sales_units_sold', 'unitsSold', 'item_id'),
+        Index('ix_item_sales_revenue', 'revenue', 'item_id'),
+    )
+
+    item_id = Column(Integer, ForeignKey('items.id'), primary_key=True)
+    orderCount = Column(Integer, nullable=False, default=0)
+    unitsSold = Column(Float, nullable=False, default=0.0)
+    revenue = Column(Float, nullable=False, default=0.0)
+
+    item = relationship('Item')
+
+    @classmethod
+    def record_order(cls, order, sign=1):
+        """
+        Add a paid order's lines to the counters of their items.
+        Use sign=-1 to take a cancelled order back out. The caller is responsible for committing.
+        """
+        for item_id, (quantity, subtotal) in _order_item_sales(order).items():
+            increment_row(cls.__table__, {'item_id': item_id},
+                          {'orderCount': sign, 'unitsSold': quantity * sign, 'revenue': subtotal * sign})
+
+    @classmethod
+    def _with_items(cls):
+        """
+        Query the counters, loading their items of every type by primary key in a second query.
+        """
+        return db.session.query(cls).options(selectinload(cls.item.of_type(with_polymorphic(Item, '*'))))
+
+    @classmethod
+    def most_popular(cls, metric='orders', limit=5):
+        """
+        List the counters of the items ranked highest by the metric: 'orders', 'units' or 'revenue'.
+        Only items in a paid order are listed.
+        """
+        column = getattr(cls, _metric_column(metric))
+        return cls._with_items().filter(cls.orderCount > 0).\
+            order_by(column.desc(), cls.item_id.desc()).limit(limit).all()
+
+    @classmethod
+    def least_popular(cls, metric='orders', limit=5):
+        """
+        List the counters of the items ranked lowest by the metric, including those never ordered.
+        """
+        column = getattr(cls, _metric_column(metric))
+        return cls._with_items().order_by(column, cls.item_id).limit(limit).all()
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Recompute all the counters from the order history.
+        Return the number of items.
+        """
+        paid_lines = _paid_item_sales().subquery()
+
+        db.session.execute(delete(cls))
+        result = db.session.execute(insert(cls).from_select(
+            ['item_id', 'orderCount', 'unitsSold', 'revenue'],
+            select(Item.id,
+                   func.coalesce(paid_lines.c.orderCount, 0),
+                   func.coalesce(paid_lines.c.unitsSold, 0),
+                   func.coalesce(paid_lines.c.revenue, 0)).
+            outerjoin(paid_lines, paid_lines.c.item_id == Item.id)))
+        # The cached sales pages are keyed by the orders version
+        mark_content_changed(db.session, 'orders')
+        db.session.commit()
+        return result.rowcount
+
+class ItemDailySales(db.Model):
+    """
+    Sales counters of an item for one order date, for the popularity over the last few days.
+    A window of N days reads at most N rows per item.
+    Only paid orders that haven't been cancelled are counted.
+    """
+    __tablename__ = 'item_daily_sales'
+
+    # The day comes first so a window is a range scan of the primary key
+    day = Column(Date, primary_key=True)
+    item_id = Column(Integer, ForeignKey('items.id'), primary_key=True)
+    orderCount = Column(Integer, nullable=False, default=0)
+    unitsSold = Column(Float, nullable=False, default=0.0)
+    revenue = Column(Float, nullable=False, default=0.0)
+
+    @classmethod
+    def record_order(cls, order, sign=1):
+        """
+        Add a paid order's lines to their items' counters for the order date.
+        Use sign=-1 to take a cancelled order back out. The caller is responsible for committing.
+        """
+        for item_id, (quantity, subtotal) in _order_item_sales(order).items():
+            increment_row(cls.__table__, {'day': order.orderDate, 'item_id': item_id},
+                          {'orderCount': sign, 'unitsSold': quantity * sign, 'revenue': subtotal * sign})
+
+    @classmethod
+    def _window(cls, days):
+        """
+        Build a subquery summing the counters of each item sold in the last days, today included.
+        Items whose orders in the window were all cancelled are left out.
+        """
+        first_day = date.today() - timedelta(days=days - 1)
+        return select(cls.item_id,
+                      func.sum(cls.orderCount).label('orderCount'),
+                      func.sum(cls.unitsSold).label('unitsSold'),
+                      func.sum(cls.revenue).label('revenue')).\
+            where(cls.day >= first_day).\
+            group_by(cls.item_id).\
+            having(func.sum(cls.orderCount) > 0).subquery()
+
+    @classmethod
+    def _ranked(cls, days, metric, limit, least):
+        window = cls._window(days)
+        items = with_polymorphic(Item, '*')
+        counters = {name: func.coalesce(window.c[name], 0) for name in ['orderCount', 'unitsSold', 'revenue']}
+        rank = counters[_metric_column(metric)]
+
+        query = db.session.query(items, *counters.values())
+        if least:
+            # Every item, those not sold in the window count as zero
+            query = query.outerjoin(window, window.c.item_id == items.id).order_by(rank, items.id)
+        else:
+            query = query.join(window, window.c.item_id == items.id).order_by(rank.desc(), items.id.desc())
+        return [ItemPopularity(*row) for row in query.limit(limit)]
+
+    @classmethod
+    def most_popular(cls, days, metric='orders', limit=5):
+        """
+        List the items sold in the last days ranked highest by the metric: 'orders', 'units' or 'revenue'.
+        Return a list of ItemPopularity tuples.
+        """
+        return cls._ranked(days, metric, limit, least=False)
+
+    @classmethod
+    def least_popular(cls, days, metric='orders', limit=5):
+        """
+        List the items ranked lowest by the metric over the last days, including those not sold.
+        Return a list of ItemPopularity tuples.
+        """
+        return cls._ranked(days, metric, limit, least=True)
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Recompute all the daily counters from the order history.
+        Return the number of counters.
+        """
+        db.session.execute(delete(cls))
+        result = db.session.execute(insert(cls).from_select(
+            ['item_id', 'day', 'orderCount', 'unitsSold', 'revenue'],
+            _paid_item_sales(Order.orderDate)))
+        # The cached sales pages are keyed by the orders version
+        mark_content_changed(db.session, 'orders')
+        db.session.commit()
+        return result.rowcount
+
+def record_order_sales(order, sign=1):
+    """
+    Add a paid order to the sales rollups and item counters.
+    Use sign=-1 to take a cancelled order back out. The caller is responsible for committing.
+    """
+    SalesRollup.record_order(order, sign=sign)
+    ItemSales.record_order(order, sign=sign)
+    ItemDailySales.record_order(order, sign=sign)
+
+@event.listens_for(Item, 'after_insert', propagate=True)
+def _create_item_sales(mapper, connection, item):
+    """
+    Start every new item with empty sales counters.
+    """
+    connection.execute(insert(ItemSales.__table__).values(item_id=item.id, orderCount=0, unitsSold=0.0, revenue=0.0))
@@ -0,0 +1,69 @@
+from orderapp import db
+from sqlalchemy import Column, Integer, String, insert, select, update
+from sqlalchemy.exc import IntegrityError
+import threading
+
+class IdSequence(db.Model):
+    """
+    Named counter that hands out blocks of numbers.
+    NextValue: The first number that has not been handed out yet.
+    """
+    __tablename__ = 'id_sequences'
+
+    name = Column(String(50), primary_key=True)
+    nextValue = Column(Integer, nullable=False)
+
+class BlockAllocator:
+    """
+    Allocate unique numbers from a named sequence.
+    Each process reserves a block of numbers at a time in a short transaction of its own,
+    so most allocations don't touch the database and workers on different nodes never
+    hand out the same number. Numbers left in a block when a process stops are skipped.
+    """
+
+    def __init__(self, name, block_size=20, seed=None):
+        self.name = name
+        self.block_size = block_size
+        self.seed = seed
+        self._next = 0
+        self._limit = 0
+        self._lock = threading.Lock()
+
+    def allocate(self):
+        """
+        Return the next number, reserving a new block when the current one runs out.
+        """
+        with self._lock:
+            if self._next >= self._limit:
+                self._next, self._limit = self._reserve_block()
+            number = self._next
+            self._next += 1
+            return number
+
+    def _reserve_block(self, retry=True):
+        """
+        Move the sequence on by one block and return the reserved range.
+        """
+        sequences = IdSequence.__table__
+        try:
+            with db.session.get_bind().begin() as conn:
+                # The UPDATE locks the sequence row until the block is read back
+                result = conn.execute(
+                    update(sequences).
+                    where(sequences.c.name == self.name).
+                    values(nextValue=sequences.c.nextValue + self.block_size))
+
+                if result.rowcount == 0:
+                    start = self.seed(conn) if self.seed else 1
+                    conn.execute(insert(sequences).values(name=self.name, nextValue=start + self.block_size))
+                    return start, start + self.block_size
+
+                end = conn.execute(
+                    select(sequences.c.nextValue).where(sequences.c.name == self.name)).scalar_one()
+                return end - self.block_size, end
+
+        except IntegrityError:
+            # Another process created the sequence first, take a block from it instead
+            if retry:
+                return self._reserve_block(retry=False)
+            raise
@@ -1,13 +1,15 @@
-from orderapp import db, hashing, app
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Date, desc, func
-from sqlalchemy.orm import relationship
+from orderapp import db, app
+from orderapp.passwords import password_hashing
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Date, desc, extract, func, select
+from sqlalchemy.orm import joinedload, relationship, selectinload
 from datetime import date, timedelta
 from .item import Item, PackVeggie, PremadeBox, UnitPriceVeggie, Veggie, WeightedVeggie
-from .order import Order, OrderLine
+from .order import Order, OrderLine, order_numbers
 from .payment import Payment, CreditCardPayment, DebitCardPayment, AccountPayment
+from .report import ItemDailySales, ItemSales, order_totals, record_order_sales, weekly_order_totals
+from orderapp.pricing import resolve_cart_items
 from sqlalchemy.orm import column_property
 from sqlalchemy import join
-from collections import defaultdict
 
 class User(db.Model):
     """
@@ -35,15 +37,20 @@ class User(db.Model):
   
     def set_password(self, password):
         """
-        Hash password.
+        Hash password with the configured password hasher.
         """
-        self.password_hash = hashing.hash_value(password, salt=app.config['PASSWORD_SALT'])
+        self.password_hash = password_hashing.hash(password)
 
     def check_password(self, password):
         """
         Check password, return True if correct.
+        A correct password with an outdated hash is hashed again, the caller is responsible for committing.
         """
-        return hashing.check_value(self.password_hash, password, salt=app.config['PASSWORD_SALT'])
+        if not password_hashing.verify(password, self.password_hash):
+            return False
+        if password_hashing.needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
     
     def __str__(self):
         return f"{self.firstname} {self.lastname} ({self.username})"
@@ -76,7 +83,38 @@ class Staff(User):
         """
         orders = db.session.query(Order).order_by(
             desc(Order.orderDate)).all()
-        return [{'order': order, 'total': order.calculate_total()} for order in orders]
+        return [{'order': order, 'total': order.total} for order in orders]
+
+    def list_orders(self, after=None, limit=None, status=None, start_date=None, end_date=None,
+                    delivery_method=None, customer_id=None):
+        """
+        List one page of orders, newest first, with optional filters.
+        After: cursor of the last order on the previous page, from Order.cursor.
+        Return a dictionary with the orders and totals, and the cursor of the next page or None on the last page.
+        """
+        limit = limit or app.config['ORDERS_PAGE_SIZE']
+        query = db.session.query(Order).options(joinedload(Order.customer), selectinload(Order.order_lines))
+
+        if status:
+            query = query.filter(Order.orderStatus == status)
+        if delivery_method:
+            query = query.filter(Order.deliveryMethod == delivery_method)
+        if customer_id:
+            query = query.filter(Order.customer_id == customer_id)
+        if start_date:
+            query = query.filter(Order.orderDate >= start_date)
+        if end_date:
+            query = query.filter(Order.orderDate <= end_date)
+        if after:
+            query = query.filter(Order.before_cursor(after))
+
+        # Fetch one extra order to find out if there is another page
+        orders = query.order_by(desc(Order.orderDate), desc(Order.id)).limit(limit + 1).all()
+        next_cursor = orders[limit - 1].cursor if len(orders) > limit else None
+        return {
+            'orders': [{'order': order, 'total': order.total} for order in orders[:limit]],
+            'next_cursor': next_cursor,
+        }
     
     @property
     def premadeBoxes(self):
@@ -105,6 +143,9 @@ class Staff(User):
         """
         order = db.session.query(Order).filter(Order.id == order_id).first()
         if order:
+            # Keep the sales rollups and item counters in step when a paid order is cancelled or restored
+            if order.payment is not None and (order.orderStatus == 'Cancelled') != (new_status == 'Cancelled'):
+                record_order_sales(order, sign=-1 if new_status == 'Cancelled' else 1)
             order.orderStatus = new_status
             db.session.commit()
         return order
@@ -113,33 +154,13 @@ class Staff(User):
         """
         Get total sales for each week of each month across all years.
         Return a dictionary with the week number, month, and year as the key, and the total sales as the value.
+        The totals are summed in SQL and come back in date order.
         """
-        weekly_sales = defaultdict(float)
-
-        # Get all orders
-        orders = Order.query.all()
-
-        for order in orders:
-            year = order.orderDate.year
-            month = order.orderDate.month
-            day = order.orderDate.day
-            
-            # Calculate the week number (1-5)
-            week_number = (day - 1) // 7 + 1
-            
-            # Create a key for this week
-            week_key = f"week{week_number}/{month:02d}/{year}"
-            
-            # Add the order total to the appropriate week
-            weekly_sales[week_key] += order.calculate_total()
-
-        # Sort the dictionary by date
-        sorted_weekly_sales = dict(sorted(weekly_sales.items(), 
-                                          key=lambda x: (int(x[0].split('/')[-1]),  # year
-                                                         int(x[0].split('/')[1]),   # month
-                                                         int(x[0].split('week')[1].split('/')[0]))))  # week
-
-        return sorted_weekly_sales
+        weeks = db.session.execute(weekly_order_totals(order_totals())).all()
+        return {
+            f"week{int(week)}/{int(month):02d}/{int(year)}": total
+            for year, month, week, total, order_count in weeks
+        }
 
     def get_monthly_sales(self):
         """
@@ -150,14 +171,12 @@ class Staff(User):
         start_date = date(current_year, 1, 1)
         end_date = date(current_year, 12, 31)
 
-        orders = Order.query.filter(Order.orderDate.between(start_date, end_date)).all()
+        orders = order_totals(start_date=start_date, end_date=end_date)
+        month = extract('month', orders.c.orderDate)
+        months = db.session.execute(
+            select(month, func.sum(orders.c.total)).group_by(month).order_by(month)).all()
 
-        monthly_sales = defaultdict(float)
-        for order in orders:
-            month_key = f"{order.orderDate.month:02d}/{current_year}"
-            monthly_sales[month_key] += order.calculate_total()
-
-        return dict(monthly_sales)
+        return {f"{int(month):02d}/{current_year}": total for month, total in months}
 
     def get_yearly_sales(self):
         """
@@ -168,49 +187,42 @@ class Staff(User):
         start_date = date(current_year, 1, 1)
         end_date = date(current_year, 12, 31)
 
-        orders = Order.query.filter(Order.orderDate.between(start_date, end_date)).all()
-        total_sales = sum(order.calculate_total() for order in orders)
+        orders = order_totals(start_date=start_date, end_date=end_date)
+        total_sales = db.session.execute(select(func.sum(orders.c.total))).scalar()
 
-        return {str(current_year): total_sales}
+        return {str(current_year): total_sales or 0}
 
-    def get_popular_items(self):
+    def get_popular_items(self, days=None, metric='orders'):
         """
-        List the most popular items based on order count.
+        List the most popular items, ranked by the number of paid orders they are in,
+        units sold or revenue, over the last days or all time.
+        Metric: 'orders', 'units' or 'revenue'.
         """
-        popular_items = db.session.query(Item, func.count(OrderLine.id).label('order_count')).\
-                        join(OrderLine).group_by(Item.id).order_by(desc('order_count')).limit(5).all()
-    
-        return [
-            {
-                'item': item,
-                'item_name': self._get_item_name(item),
-                'order_count': order_count
-            }
-            for item, order_count in popular_items
-        ]
+        if days is None:
+            counters = ItemSales.most_popular(metric=metric)
+        else:
+            counters = ItemDailySales.most_popular(days, metric=metric)
+        return [self._item_popularity(item_counters) for item_counters in counters]
 
-    def get_unpopular_items(self):
+    def get_unpopular_items(self, days=None, metric='orders'):
         """
-        List the least popular items, including those never ordered.
+        List the least popular items over the last days or all time, including those not ordered.
+        Metric: 'orders', 'units' or 'revenue'.
         """
-        subquery = db.session.query(
-            Item.id,
-            func.count(OrderLine.id).label('order_count')
-        ).outerjoin(OrderLine).group_by(Item.id).subquery()
-
-        unpopular_items = db.session.query(Item, func.coalesce(subquery.c.order_count, 0).label('order_count')).\
-            outerjoin(subquery, Item.id == subquery.c.id).\
-            order_by(func.coalesce(subquery.c.order_count, 0), Item.id).\
-            limit(5).all()
+        if days is None:
+            counters = ItemSales.least_popular(metric=metric)
+        else:
+            counters = ItemDailySales.least_popular(days, metric=metric)
+        return [self._item_popularity(item_counters) for item_counters in counters]
 
-        return [
-            {
-                'item': item,
-                'item_name': self._get_item_name(item),
-                'order_count': order_count
-            }
-            for item, order_count in unpopular_items
-        ]
+    def _item_popularity(self, counters):
+        return {
+            'item': counters.item,
+            'item_name': self._get_item_name(counters.item),
+            'order_count': counters.orderCount,
+            'units_sold': counters.unitsSold,
+            'revenue': counters.revenue,
+        }
     
     def _get_item_name(self, item):
         """
@@ -263,12 +275,17 @@ class Customer(User):
     def view_veggies(self):
         """
         View all the available vegetables.
-        """
-        return {
-            'weighted': self.view_weighted_veggies(),
-            'pack': self.view_pack_veggies(),
-            'unit_price': self.view_unit_price_veggies()
-        }
+        All veggie subtypes are fetched in one query and grouped by type.
+        """
+        catalog = {'weighted': [], 'pack': [], 'unit_price': []}
+        for veggie in Veggie.load_in_stock():
+            if isinstance(veggie, WeightedVeggie):
+                catalog['weighted'].append(self._weighted_veggie_details(veggie))
+            elif isinstance(veggie, PackVeggie):
+                catalog['pack'].append(self._pack_veggie_details(veggie))
+            elif isinstance(veggie, UnitPriceVeggie):
+                catalog['unit_price'].append(self._unit_price_veggie_details(veggie))
+        return catalog
     
     def view_weighted_veggies(self):
         """
@@ -276,40 +293,58 @@ class Customer(User):
         Return a list of dictionaries with the id, name, weight, weight per kilo, and stock.
         """
         weighted_veggies = db.session.query(WeightedVeggie).filter(WeightedVeggie.stock > 0).all()
-        return [{
+        return [self._weighted_veggie_details(veggie) for veggie in weighted_veggies]
+
+    def view_pack_veggies(self):
+        """
+        View all available pack vegetables.
+        Return a list of dictionaries with the id, name, number of packs, price per pack, and stock.
+        """
+        pack_veggies = db.session.query(PackVeggie).filter(PackVeggie.stock > 0).all()
+        return [self._pack_veggie_details(veggie) for veggie in pack_veggies]
+
+    def view_unit_price_veggies(self):
+        """
+        View all available unit price vegetables.
+        Return a list of dictionaries with the id, name, price per unit, and stock.
+        """
+        unit_price_veggies = db.session.query(UnitPriceVeggie).filter(UnitPriceVeggie.stock > 0).all()
+        return [self._unit_price_veggie_details(veggie) for veggie in unit_price_veggies]
+
+    def _weighted_veggie_details(self, veggie):
+        """
+        Helper method to get the details of a weighted veggie.
+        """
+        return {
             'id': veggie.id,
             'vegName': veggie.vegName,
             'weight': veggie.weight,
             'weightPerKilo': veggie.weightPerKilo,
             'stock': veggie.stock
-        } for veggie in weighted_veggies]
+        }
 
-    def view_pack_veggies(self):
+    def _pack_veggie_details(self, veggie):
         """
-        View all available pack vegetables.
-        Return a list of dictionaries with the id, name, number of packs, price per pack, and stock.
+        Helper method to get the details of a pack veggie.
         """
-        pack_veggies = db.session.query(PackVeggie).filter(PackVeggie.stock > 0).all()
-        return [{
+        return {
             'id': veggie.id,
             'vegName': veggie.vegName,
             'numOfPack': veggie.numOfPack,
             'pricePerPack': veggie.pricePerPack,
             'stock': veggie.stock
-        } for veggie in pack_veggies]
+        }
 
-    def view_unit_price_veggies(self):
+    def _unit_price_veggie_details(self, veggie):
         """
-        View all available unit price vegetables.
-        Return a list of dictionaries with the id, name, price per unit, and stock.
+        Helper method to get the details of a unit price veggie.
         """
-        unit_price_veggies = db.session.query(UnitPriceVeggie).filter(UnitPriceVeggie.stock > 0).all()
-        return [{
+        return {
             'id': veggie.id,
             'vegName': veggie.vegName,
             'pricePerUnit': veggie.pricePerUnit,
             'stock': veggie.stock
-        } for veggie in unit_price_veggies]
+        }
     
     def view_premade_boxes(self):
         """
@@ -321,13 +356,16 @@ class Customer(User):
             PremadeBox.isCustom == False  
         ).all()
 
+        # Resolve the contents of every box in one query
+        contents = PremadeBox.get_contents_for_boxes([box.id for box in boxes])
+
         return [{
             'id': box.id,
             'boxSize': box.boxSize,
             'numOfBoxes': box.numOfBoxes,
             'stock': box.stock, 
             'price': box.get_price(),
-            'contents': [veggie.vegName for veggie in box.get_contents()]
+            'contents': contents[box.id]
         } for box in boxes]
     
     def place_order(self, delivery_method, payment_method):
@@ -336,25 +374,55 @@ class Customer(User):
         Return the new order if successful.
         """
 
-        # Get the maximum order number from the database and increment it
-        max_order_number = db.session.query(func.max(Order.orderNumber)).scalar() or 999
-        new_order_number = max(int(max_order_number) + 1, 1000)
+        order = self._new_order(delivery_method, payment_method)
+        db.session.commit()
+
+        return order
+
+    def checkout(self, delivery_method, payment_method, cart):
+        """
+        Place an order for every item in the cart in a single transaction.
+        Cart: list of dictionaries with the item id, type and quantity.
+        Return the new order if successful. Nothing is saved if any item can't be ordered.
+        """
+        if not cart:
+            raise ValueError("Your cart is empty")
+
+        try:
+            # Resolve all the cart items in one query
+            order_items = [(item, line['quantity']) for line, item in resolve_cart_items(cart)]
+
+            order = self._new_order(delivery_method, payment_method)
+            db.session.flush()
+            order.add_items(order_items)
+            db.session.commit()
+            return order
+
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def _new_order(self, delivery_method, payment_method):
+        """
+        Create a new order object with the next order number and add it to the session.
+        """
+        # Take the next order number from this process's reserved block
+        new_order_number = order_numbers.allocate()
 
-        # Create a new order
         order = Order(orderNumber=str(new_order_number), 
                       customer=self, 
                       deliveryMethod=delivery_method, 
                       paymentMethod=payment_method)
         
         db.session.add(order)
-        db.session.commit()
-
         return order
 
     def make_payment(self, amount, payment_method, order=None, **kwargs):
         """
         Make a payment for the order or the balance.
         Use **kwargs to accept additional parameters for different payment methods.
+        An order's stock is taken in the same transaction, InsufficientStockError is raised
+        and nothing is saved if any item falls short.
         Return True if successful.
         """
 
@@ -385,6 +453,14 @@ class Customer(User):
             raise ValueError(f"Invalid payment method: {payment_method}")
         
         db.session.add(payment)
+
+        # Store the paid order's totals, add it to the sales rollups and item counters and take its stock
+        # in the same transaction, so a stock shortfall rolls back the whole payment
+        if order is not None:
+            order.record_totals()
+            record_order_sales(order)
+            order.take_stock()
+
         db.session.commit()
         return True  
 
@@ -400,34 +476,39 @@ class Customer(User):
     def view_order_history(self):
         """
         View the order history for a specific customer.
+        Only paid orders are listed, unpaid orders are left for the reaper to delete.
         Order by orderDate in descending order.
         Return a list of dictionaries with the order and total.
         """
 
-        # Join Order and Payment tables
-        query = db.session.query(Order, Payment).\
+        # Join Order and Payment tables, only keep orders with a payment
+        query = db.session.query(Order).\
             outerjoin(Payment, Order.id == Payment.order_id).\
-            filter(Order.customer_id == self.id).\
-            order_by(Order.orderDate.desc()) 
-        
-        # Initialize lists to store valid orders and orders to delete
-        valid_orders = []
-        orders_to_delete = []
-        
-        # Only order with payment is valid, otherwise delete
-        for order, payment in query:
-            if payment:
-                valid_orders.append({'order': order, 'total': order.calculate_total()})
-            else:
-                orders_to_delete.append(order)
-
-        # Remove orders without payments
-        for order in orders_to_delete:
-            db.session.delete(order)
-
-        # Commit the changes to the database
-        db.session.commit()
-        return valid_orders
+            filter(Order.customer_id == self.id, Payment.id.isnot(None)).\
+            order_by(Order.orderDate.desc())
+
+        return [{'order': order, 'total': order.total} for order in query]
+
+    def list_orders(self, after=None, limit=None):
+        """
+        List one page of the customer's paid orders, newest first.
+        After: cursor of the last order on the previous page, from Order.cursor.
+        Return a dictionary with the orders and totals, and the cursor of the next page or None on the last page.
+        """
+        limit = limit or app.config['ORDERS_PAGE_SIZE']
+        query = db.session.query(Order).\
+            join(Payment, Order.id == Payment.order_id).\
+            filter(Order.customer_id == self.id)
+        if after:
+            query = query.filter(Order.before_cursor(after))
+
+        # Fetch one extra order to find out if there is another page
+        orders = query.order_by(desc(Order.orderDate), desc(Order.id)).limit(limit + 1).all()
+        next_cursor = orders[limit - 1].cursor if len(orders) > limit else None
+        return {
+            'orders': [{'order': order, 'total': order.total} for order in orders[:limit]],
+            'next_cursor': next_cursor,
+        }
 
     def cancel_order(self, order_id):
         """
@@ -446,10 +527,14 @@ class Customer(User):
 
                 # Refund the customer's balance if the payment method is Account
                 if order.paymentMethod == 'Account':
-                    refund_amount = order.calculate_total()
+                    refund_amount = order.total
                     # Ensure the balance doesn't go below 0
                     self.custBalance = round(max(0, self.custBalance - refund_amount), 2)
 
+                # Take a paid order back out of the sales rollups and item counters
+                if order.payment is not None:
+                    record_order_sales(order, sign=-1)
+
                 db.session.commit()
                 return True
             
@@ -0,0 +1,178 @@
+import hashlib
+import hmac
+import secrets
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from orderapp import app, hashing
+
+class PasswordHashingBusy(Exception):
+    """
+    Raised when too many passwords are waiting to be hashed.
+    """
+
+class LegacyHasher:
+    """
+    Hashes made by flask_hashing with the single PASSWORD_SALT.
+    Kept so existing users can still log in, their hash is replaced at their next login.
+    """
+    name = 'legacy'
+
+    def __init__(self, salt):
+        self.salt = salt
+
+    def hash(self, password):
+        return hashing.hash_value(password, salt=self.salt)
+
+    def verify(self, password, stored):
+        return hashing.check_value(stored, password, salt=self.salt)
+
+    def needs_rehash(self, stored):
+        return True
+
+class Pbkdf2Hasher:
+    """
+    PBKDF2-HMAC-SHA256 with a salt for each password.
+    Stored as pbkdf2_sha256$iterations$salt$hash.
+    """
+    name = 'pbkdf2_sha256'
+
+    def __init__(self, iterations=600000):
+        self.iterations = iterations
+
+    def _digest(self, password, salt, iterations):
+        return hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), iterations).hex()
+
+    def hash(self, password):
+        salt = secrets.token_hex(16)
+        return f"{self.name}${self.iterations}${salt}${self._digest(password, salt, self.iterations)}"
+
+    def verify(self, password, stored):
+        _, iterations, salt, digest = stored.split('$')
+        return hmac.compare_digest(self._digest(password, salt, int(iterations)), digest)
+
+    def needs_rehash(self, stored):
+        return int(stored.split('$')[1]) != self.iterations
+
+class ScryptHasher:
+    """
+    Scrypt with a salt for each password, memory-hard as well as slow.
+    Stored as scrypt$n$r$p$salt$hash.
+    """
+    name = 'scrypt'
+
+    def __init__(self, n=2 ** 14, r=8, p=1):
+        self.n = n
+        self.r = r
+        self.p = p
+
+    def _digest(self, password, salt, n, r, p):
+        return hashlib.scrypt(password.encode(), salt=salt.encode(), n=n, r=r, p=p,
+                              maxmem=256 * n * r * p, dklen=32).hex()
+
+    def hash(self, password):
+        salt = secrets.token_hex(16)
+        digest = self._digest(password, salt, self.n, self.r, self.p)
+        return f"{self.name}${self.n}${self.r}${self.p}${salt}${digest}"
+
+    def verify(self, password, stored):
+        _, n, r, p, salt, digest = stored.split('$')
+        return hmac.compare_digest(self._digest(password, salt, int(n), int(r), int(p)), digest)
+
+    def needs_rehash(self, stored):
+        return [int(value) for value in stored.split('$')[1:4]] != [self.n, self.r, self.p]
+
+class HashingPool:
+    """
+    Run password hashing on a bounded thread or process pool.
+    Hashing in hashlib releases the GIL, so a thread pool hashes in parallel while other
+    requests keep running. A process pool also covers hashers that hold the GIL.
+    At most max_pending hashes can be running or waiting at once, more are refused
+    straight away with PasswordHashingBusy instead of queueing without limit.
+    """
+
+    def __init__(self, kind='thread', workers=4, max_pending=32, timeout=10):
+        self.kind = kind
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Started on first use, so importing the app doesn't start workers
+        with self._lock:
+            if self._executor is None:
+                executor_class = ProcessPoolExecutor if self.kind == 'process' else ThreadPoolExecutor
+                self._executor = executor_class(max_workers=self.workers)
+            return self._executor
+
+    def run(self, function, *args):
+        """
+        Run the function on the pool and return its result.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHashingBusy("Too many logins at once, please try again")
+        try:
+            return self._get_executor().submit(function, *args).result(timeout=self.timeout)
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+class PasswordHashing:
+    """
+    Hash new passwords with the configured hasher, and check passwords against a hash made by any hasher.
+    """
+
+    def __init__(self, config):
+        self.pool = None
+        self.configure(config)
+
+    def configure(self, config):
+        """
+        Set up the hashers and the pool from the configuration.
+        """
+        self.hashers = {hasher.name: hasher for hasher in [
+            LegacyHasher(config['PASSWORD_SALT']),
+            Pbkdf2Hasher(config['PASSWORD_PBKDF2_ITERATIONS']),
+            ScryptHasher(config['PASSWORD_SCRYPT_N']),
+        ]}
+        self.default = self.hashers[config['PASSWORD_HASHER']]
+
+        if self.pool is not None:
+            self.pool.shutdown()
+        self.pool = HashingPool(config['PASSWORD_HASH_POOL'],
+                                workers=config['PASSWORD_HASH_WORKERS'],
+                                max_pending=config['PASSWORD_HASH_MAX_PENDING']) \
+            if config['PASSWORD_HASH_POOL'] else None
+
+    def _run(self, function, *args):
+        if self.pool is None:
+            return function(*args)
+        return self.pool.run(function, *args)
+
+    def hasher_for(self, stored):
+        """
+        Return the hasher that made the stored hash. Legacy hashes have no prefix.
+        """
+        name = stored.split('$', 1)[0] if '$' in stored else LegacyHasher.name
+        return self.hashers[name]
+
+    def hash(self, password):
+        return self._run(self.default.hash, password)
+
+    def verify(self, password, stored):
+        return self._run(self.hasher_for(stored).verify, password, stored)
+
+    def needs_rehash(self, stored):
+        """
+        Return True if the hash wasn't made by the configured hasher with its current cost.
+        """
+        hasher = self.hasher_for(stored)
+        return hasher is not self.default or hasher.needs_rehash(stored)
+
+password_hashing = PasswordHashing(app.config)
@@ -0,0 +1,171 @@
+import logging
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+class PoolStats:
+    """
+    Connection pool counters, to size the pool against real load.
+    In use, connects and invalidations come from the pool events, checkout waits from TimedQueuePool.
+    """
+
+    def __init__(self, slow_wait=0.1):
+        self.slow_wait = slow_wait
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.checkouts = 0
+            self.in_use = 0
+            self.peak_in_use = 0
+            self.connects = 0
+            self.invalidations = 0
+            self.timeouts = 0
+            self.slow_waits = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+
+    def record_checkout(self):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def record_checkin(self):
+        with self._lock:
+            self.in_use -= 1
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def record_invalidation(self):
+        with self._lock:
+            self.invalidations += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def record_wait(self, seconds):
+        """
+        Add how long a checkout waited for a connection.
+        """
+        with self._lock:
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if seconds > self.slow_wait:
+                self.slow_waits += 1
+        if seconds > self.slow_wait:
+            logger.warning("Waited %.3fs for a database connection", seconds)
+
+    def stats(self, pool=None):
+        """
+        Return the counters, with the pool's current size when a queue pool is given.
+        """
+        with self._lock:
+            waits = self.checkouts + self.timeouts
+            stats = {
+                'checkouts': self.checkouts,
+                'in_use': self.in_use,
+                'peak_in_use': self.peak_in_use,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+                'timeouts': self.timeouts,
+                'slow_waits': self.slow_waits,
+                'average_wait': round(self.wait_total / waits, 6) if waits else 0.0,
+                'max_wait': round(self.wait_max, 6),
+            }
+        if isinstance(pool, QueuePool):
+            stats.update({'size': pool.size(), 'idle': pool.checkedin(), 'overflow': pool.overflow()})
+        return stats
+
+class EnginePoolStats:
+    """
+    Connection pool counters of each engine by name, such as the primary and the read replica,
+    so the pools can be sized separately.
+    """
+
+    def __init__(self, slow_wait=0.1):
+        self.slow_wait = slow_wait
+        self._engines = {}
+        self._lock = threading.Lock()
+
+    def track(self, name, engine):
+        """
+        Start counting the pool of the engine under the name, and return its counters.
+        """
+        pool_stats = PoolStats(self.slow_wait)
+        with self._lock:
+            self._engines[name] = (engine, pool_stats)
+
+        # Listeners on the engine move to the new pool when the engine is disposed
+        @event.listens_for(engine, 'checkout')
+        def _checkout(dbapi_connection, connection_record, connection_proxy):
+            pool_stats.record_checkout()
+
+        @event.listens_for(engine, 'checkin')
+        def _checkin(dbapi_connection, connection_record):
+            pool_stats.record_checkin()
+
+        @event.listens_for(engine, 'connect')
+        def _connect(dbapi_connection, connection_record):
+            pool_stats.record_connect()
+
+        @event.listens_for(engine, 'invalidate')
+        def _invalidate(dbapi_connection, connection_record, exception):
+            # Connections thrown away, such as ones the server closed that failed the pre-ping
+            pool_stats.record_invalidation()
+
+        if isinstance(engine.pool, TimedQueuePool):
+            engine.pool.pool_stats = pool_stats
+        return pool_stats
+
+    def get(self, name):
+        with self._lock:
+            return self._engines[name][1]
+
+    def clear(self):
+        with self._lock:
+            for engine, pool_stats in self._engines.values():
+                pool_stats.clear()
+
+    def stats(self):
+        """
+        Return the counters of each engine's pool, with the pool's current size.
+        """
+        with self._lock:
+            engines = dict(self._engines)
+        return {name: pool_stats.stats(engine.pool) for name, (engine, pool_stats) in sorted(engines.items())}
+
+pool_stats = EnginePoolStats()
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waited for a connection into the counters of its engine.
+    The wait includes opening a new connection when the pool has none idle.
+    """
+
+    pool_stats = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except TimeoutError:
+            if self.pool_stats is not None:
+                self.pool_stats.record_timeout()
+            raise
+        finally:
+            if self.pool_stats is not None:
+                self.pool_stats.record_wait(time.perf_counter() - started)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.pool_stats = self.pool_stats
+        return pool
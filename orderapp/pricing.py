@@ -0,0 +1,56 @@
+from orderapp.models.item import CART_ITEM_TYPES, Item
+
+DELIVERY_FEE = 10.00
+
+def cart_item_name(item):
+    """
+    Return the name an item is shown with in the cart.
+    """
+    return item.vegName if hasattr(item, 'vegName') else f"{item.boxSize} Premade Box"
+
+def resolve_cart_items(cart_lines):
+    """
+    Load the items of every cart line in one polymorphic query.
+    Return a list of (line, item) tuples in cart order.
+    Raise ValueError if an item doesn't exist or isn't the type the cart line says it is.
+    """
+    items = Item.load_many([line['id'] for line in cart_lines])
+
+    resolved = []
+    for line in cart_lines:
+        item = items.get(line['id'])
+        if item is None or item.type != CART_ITEM_TYPES.get(line['type']):
+            raise ValueError(f"Invalid item in cart: {line['id']}")
+        resolved.append((line, item))
+    return resolved
+
+def price_cart(customer, cart_lines, delivery_method=None):
+    """
+    Price the cart from the current item prices, ignoring the prices saved in the cart.
+    The customer's discount and the delivery fee for the delivery method are applied to the subtotal.
+    Return a dictionary with the priced lines, subtotal, discount, delivery fee and total.
+    """
+    lines = []
+    for line, item in resolve_cart_items(cart_lines):
+        lines.append({
+            'id': item.id,
+            'type': line['type'],
+            'name': cart_item_name(item),
+            'price': float(item.get_price()),
+            'quantity': line['quantity'],
+            'subtotal': round(float(item.calculate_subtotal(line['quantity'])), 2),
+            'stock': item.stock,
+        })
+
+    subtotal = round(sum(line['subtotal'] for line in lines), 2)
+    # Only corporate customers have a discount
+    discounted = customer.apply_discount(subtotal) if hasattr(customer, 'apply_discount') else subtotal
+    delivery_fee = DELIVERY_FEE if delivery_method == 'Delivery' else 0.0
+
+    return {
+        'lines': lines,
+        'subtotal': subtotal,
+        'discount': round(subtotal - discounted, 2),
+        'deliveryFee': delivery_fee,
+        'total': round(discounted + delivery_fee, 2),
+    }
@@ -0,0 +1,60 @@
+import threading
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from orderapp import app
+
+class RouteQueryStats:
+    """
+    Count the SQL statements each route sends to the database.
+    """
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, queries):
+        """
+        Add one request to the endpoint's counters.
+        """
+        with self._lock:
+            requests, total, most = self._routes.get(endpoint, (0, 0, 0))
+            self._routes[endpoint] = (requests + 1, total + queries, max(most, queries))
+
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+
+    def stats(self):
+        """
+        Return the counters of each endpoint, with the average and most queries per request.
+        """
+        with self._lock:
+            return {
+                endpoint: {
+                    'requests': requests,
+                    'queries': total,
+                    'average': round(total / requests, 2),
+                    'max': most,
+                }
+                for endpoint, (requests, total, most) in sorted(self._routes.items())
+            }
+
+route_query_stats = RouteQueryStats()
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    """
+    Count the statements executed while handling a request.
+    """
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+@app.after_request
+def _record_route_queries(response):
+    """
+    Add the request's statement count to its route.
+    """
+    if request.endpoint:
+        route_query_stats.record(request.endpoint, g.get('query_count', 0))
+    return response
@@ -0,0 +1,98 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import delete, exists, select
+from orderapp import app, db
+from orderapp.models.order import Order, OrderLine
+from orderapp.models.payment import Payment
+from orderapp.versions import mark_content_changed
+
+logger = logging.getLogger(__name__)
+
+def reap_unpaid_orders(grace=None, batch_size=None, now=None):
+    """
+    Delete the orders left unpaid for longer than the grace period in seconds, with their order lines.
+    Each batch is deleted in its own short transaction. An order paid after it was selected is kept,
+    the deletes only match orders that still have no payment.
+    Return the number of orders deleted.
+    """
+    grace = app.config['UNPAID_ORDER_GRACE'] if grace is None else grace
+    batch_size = batch_size or app.config['UNPAID_ORDER_REAP_BATCH']
+    cutoff = (now or datetime.now()) - timedelta(seconds=grace)
+    unpaid = ~exists().where(Payment.order_id == Order.id)
+
+    deleted = 0
+    while True:
+        order_ids = db.session.scalars(
+            select(Order.id).where(Order.createdAt < cutoff, unpaid).order_by(Order.id).limit(batch_size)).all()
+        if not order_ids:
+            break
+
+        try:
+            db.session.execute(
+                delete(OrderLine).where(OrderLine.order_id.in_(select(Order.id).where(Order.id.in_(order_ids), unpaid))),
+                execution_options={'synchronize_session': False})
+            result = db.session.execute(
+                delete(Order).where(Order.id.in_(order_ids), unpaid),
+                execution_options={'synchronize_session': False})
+            if result.rowcount:
+                mark_content_changed(db.session, 'orders')
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        deleted += result.rowcount
+        if len(order_ids) < batch_size:
+            break
+    return deleted
+
+class UnpaidOrderReaper:
+    """
+    Background thread that reaps unpaid orders every interval seconds.
+    Running the reaper in several processes is safe, each order is only deleted once.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='unpaid-order-reaper', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with app.app_context():
+                try:
+                    deleted = reap_unpaid_orders()
+                    if deleted:
+                        logger.info("Deleted %d unpaid orders", deleted)
+                except Exception:
+                    logger.exception("Reaping unpaid orders failed")
+
+# The reaper of this process, started with its first request
+_reaper = None
+_reaper_lock = threading.Lock()
+
+@app.before_request
+def start_reaper():
+    """
+    Start this process's reaper with its first request, every UNPAID_ORDER_REAP_INTERVAL seconds.
+    Every process serving requests reaps, under a WSGI server and flask run alike, while the debug
+    reloader's watcher process and CLI commands, which serve no requests, don't.
+    """
+    global _reaper
+    interval = app.config['UNPAID_ORDER_REAP_INTERVAL']
+    if _reaper is not None or not interval:
+        return
+    with _reaper_lock:
+        if _reaper is None:
+            _reaper = UnpaidOrderReaper(interval)
+            _reaper.start()
@@ -0,0 +1,35 @@
+import time
+from flask import current_app, g, has_app_context, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql.dml import UpdateBase
+
+class RoutingSession(Session):
+    """
+    Session that sends the queries of views marked with readFromReplica to the read replica.
+    Writes stay on the primary, and so does every query after the session has flushed,
+    so a view reads its own writes. Queries executed with bind_arguments={'primary': True},
+    such as the content versions that must not lag their content, always go to the primary.
+    Without a 'replica' bind in SQLALCHEMY_BINDS every query goes to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, primary=False, **kwargs):
+        if bind is None and not primary and self._reads_from_replica(clause):
+            return self._db.engines['replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_from_replica(self, clause):
+        if self._flushing or isinstance(clause, UpdateBase):
+            return False
+        return has_app_context() and g.get('read_replica', False) and 'replica' in self._db.engines
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _read_from_primary_after_write(session_, flush_context):
+    """
+    Keep the rest of the request on the primary, and the user's next requests too
+    until the replica has had time to catch up.
+    """
+    if has_app_context():
+        g.read_replica = False
+    if has_request_context():
+        session['read_primary_until'] = time.time() + current_app.config['REPLICA_LAG']
@@ -0,0 +1,117 @@
+import pytest
+from unittest.mock import patch
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import scoped_session, sessionmaker
+from orderapp import db
+from orderapp.cache import fragment_cache
+import orderapp.models.user  # noqa: F401 - register every model on the metadata
+
+@pytest.fixture(scope='function')
+def sqlite_engine():
+    """In-memory SQLite engine with all the tables created"""
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine)
+    # Fragments rendered from another test's database must not be reused
+    fragment_cache.clear()
+    yield engine
+    engine.dispose()
+
+@pytest.fixture(scope='function')
+def sqlite_session(sqlite_engine):
+    """Real database session on SQLite, standing in for db.session"""
+    session = scoped_session(sessionmaker(bind=sqlite_engine))
+    with patch('orderapp.db.session', session):
+        yield session
+    session.remove()
+
+class QueryCounter:
+    """Count the SQL statements sent to an engine"""
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def reset(self):
+        self.statements.clear()
+
+@pytest.fixture(scope='function')
+def query_counter(sqlite_engine):
+    """Count the queries executed against the SQLite engine"""
+    counter = QueryCounter()
+    event.listen(sqlite_engine, 'before_cursor_execute', counter)
+    yield counter
+    event.remove(sqlite_engine, 'before_cursor_execute', counter)
+
+@pytest.fixture(scope='function')
+def seed_data(sqlite_session):
+    """Seed the SQLite database with customers, veggies and premade boxes"""
+    from orderapp.models.user import Staff, Customer, CorporateCustomer
+    from orderapp.models.item import WeightedVeggie, PackVeggie, UnitPriceVeggie, PremadeBox
+
+    staff = Staff(firstname='Lucy', lastname='Baker', username='staff', password='123', deptName='Sales')
+    customer = Customer(firstname='Ying', lastname='Zheng', username='ying', password='123',
+                        address='23 Kingsland Road, Auckland', balance=0.0, maxOwing=100.0)
+    corporate = CorporateCustomer(firstname='Hello', lastname='Fresh', username='fresh', password='123',
+                                  address='23 Commerce St, Wellington', balance=0.0, maxCredit=500.0)
+    veggies = [
+        WeightedVeggie(vegName='Kumara', weight=1.0, weightPerKilo=3.99, stock=100),
+        WeightedVeggie(vegName='Pumpkin', weight=1.0, weightPerKilo=2.99, stock=80),
+        PackVeggie(vegName='Celery', numOfPack=1, pricePerPack=3.99, stock=75),
+        PackVeggie(vegName='Cabbage', numOfPack=1, pricePerPack=4.50, stock=0),
+        UnitPriceVeggie(vegName='Feijoa', quantity=1, pricePerUnit=0.99, stock=200),
+        UnitPriceVeggie(vegName='Avocado', quantity=1, pricePerUnit=1.99, stock=150),
+    ]
+    boxes = [
+        PremadeBox(boxSize='Small', numOfBoxes=1, stock=30),
+        PremadeBox(boxSize='Medium', numOfBoxes=1, stock=25),
+        PremadeBox(boxSize='Large', numOfBoxes=1, stock=20),
+    ]
+    sqlite_session.add_all([staff, customer, corporate] + veggies + boxes)
+    boxes[0].set_contents(veggies[:2])
+    boxes[1].set_contents(veggies[:4])
+    boxes[2].set_contents(veggies)
+    sqlite_session.commit()
+
+    return {
+        'staff': staff,
+        'customer': customer,
+        'corporate': corporate,
+        'veggies': veggies,
+        'boxes': boxes,
+    }
+
+@pytest.fixture(scope='function')
+def place_order(sqlite_session):
+    """
+    Return a function that places an order for a customer with the given (item, quantity) lines,
+    paid by debit card unless paid is False. Other order columns, such as orderDate, are given as keywords.
+    """
+    from orderapp.models.order import Order, OrderLine
+
+    def place(customer, lines, paid=True, deliveryMethod='Pickup', paymentMethod='Debit Card', **order_fields):
+        order = Order(orderNumber=str(1000 + sqlite_session.query(Order).count()), customer=customer,
+                      deliveryMethod=deliveryMethod, paymentMethod=paymentMethod)
+        for name, value in order_fields.items():
+            setattr(order, name, value)
+        sqlite_session.add(order)
+        with sqlite_session.no_autoflush:
+            for item, quantity in lines:
+                sqlite_session.add(OrderLine(order=order, item=item, quantity=quantity))
+        sqlite_session.commit()
+        if paid:
+            customer.make_payment(order.calculate_total(), 'Debit Card', order,
+                                  bankName='ANZ', debitCardNumber='1234567890123456')
+        return order
+    return place
+
+@pytest.fixture(scope='function')
+def cart_line():
+    """Return a function that builds a session cart line for an item"""
+    def line(item, item_type, quantity, subtotal=0.0):
+        return {'id': item.id, 'type': item_type, 'quantity': quantity, 'subtotal': subtotal}
+    return line
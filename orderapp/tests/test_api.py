@@ -0,0 +1,189 @@
+import pytest
+from datetime import date
+from decimal import Decimal
+from sqlalchemy import update
+from orderapp import app
+from orderapp.cache import catalog_cache
+from orderapp.json_provider import IsoDateJSONProvider, OrjsonProvider, json_provider
+from orderapp.models.item import Item, PremadeBox
+from orderapp.models.user import Customer
+from orderapp.versions import content_versions
+
+@pytest.fixture(scope='function')
+def api_ids(seed_data, sqlite_session):
+    """Ids of the seeded users and items, with the objects cleared from the session"""
+    ids = {
+        'staff': seed_data['staff'].id,
+        'customer': seed_data['customer'].id,
+        'corporate': seed_data['corporate'].id,
+        'kumara': seed_data['veggies'][0].id,
+        'feijoa': seed_data['veggies'][4].id,
+        'small_box': seed_data['boxes'][0].id,
+    }
+    sqlite_session.expunge_all()
+    catalog_cache.clear()
+    return ids
+
+def _login(username):
+    client = app.test_client()
+    response = client.post('/api/v1/login', json={'username': username, 'password': '123'})
+    assert response.status_code == 200
+    return client
+
+def _place_paid_order(client, lines):
+    """Add the (item id, type, quantity) lines to the cart, then place and pay for the order"""
+    for item_id, item_type, quantity in lines:
+        assert client.post('/api/v1/cart', json={'item_id': item_id, 'item_type': item_type,
+                                                 'quantity': quantity}).status_code == 201
+    order = client.post('/api/v1/orders', json={'delivery_method': 'Pickup',
+                                                'payment_method': 'Debit Card'}).get_json()
+    response = client.post(f"/api/v1/orders/{order['id']}/payment",
+                           json={'bank_name': 'ANZ Bank', 'debit_card_number': '9876543210987654'})
+    assert response.status_code == 200
+    return response.get_json()
+
+def test_login_required(api_ids):
+    client = app.test_client()
+    assert client.get('/api/v1/catalog').status_code == 401
+    assert client.post('/api/v1/login', json={'username': 'ying', 'password': 'wrong'}).status_code == 401
+
+def test_staff_only_reports(api_ids):
+    client = _login('ying')
+    response = client.get('/api/v1/reports/sales')
+    assert response.status_code == 403
+    assert response.get_json() == {'error': 'Access Denied'}
+
+def test_catalog_field_selection(api_ids):
+    client = _login('ying')
+    catalog = client.get('/api/v1/catalog?fields=id,vegName').get_json()
+
+    assert catalog['veggies']['weighted'] == [{'id': api_ids['kumara'], 'vegName': 'Kumara'},
+                                              {'id': api_ids['kumara'] + 1, 'vegName': 'Pumpkin'}]
+    assert catalog['premade_boxes'][0] == {'id': api_ids['small_box']}
+
+def test_catalog_follows_other_process_changes(api_ids, sqlite_session, sqlite_engine):
+    client = _login('ying')
+    catalog = client.get('/api/v1/catalog?fields=stock').get_json()
+    assert catalog['veggies']['weighted'][0] == {'stock': 100}
+
+    # Another process sells some stock and moves the shared catalog version on
+    with sqlite_engine.begin() as conn:
+        conn.execute(update(Item).where(Item.id == api_ids['kumara']).values(stock=42))
+    content_versions.bump(sqlite_session, ['catalog'])
+
+    catalog = client.get('/api/v1/catalog?fields=stock').get_json()
+    assert catalog['veggies']['weighted'][0] == {'stock': 42}
+
+def test_cart_checkout_and_order_details(api_ids):
+    client = _login('fresh')
+    client.post('/api/v1/cart', json={'item_id': api_ids['kumara'], 'item_type': 'weighted', 'quantity': 2})
+    cart = client.post('/api/v1/cart', json={'item_id': api_ids['small_box'], 'item_type': 'premade_box',
+                                             'quantity': 1}).get_json()
+    assert [line['name'] for line in cart['lines']] == ['Kumara', 'Small Premade Box']
+    assert cart['lines'][1]['contents'] == ['Kumara', 'Pumpkin']
+    assert cart['discount'] == round(cart['subtotal'] * 0.1, 2)
+
+    order = client.post('/api/v1/orders', json={'delivery_method': 'Delivery',
+                                                'payment_method': 'Credit Card'}).get_json()
+    assert order['orderStatus'] == 'Pending'
+    assert order['total'] == round(cart['subtotal'] - cart['discount'] + 10, 2)
+
+    response = client.post(f"/api/v1/orders/{order['id']}/payment",
+                           json={'card_type': 'Visa', 'card_number': '1234567890123456',
+                                 'card_expiry_date': '2030-01-31'})
+    assert response.status_code == 200
+    assert client.get('/api/v1/cart').get_json()['lines'] == []
+
+    details = client.get(f"/api/v1/orders/{order['id']}").get_json()
+    assert details['orderDate'] == date.today().isoformat()
+    assert [item['name'] for item in details['items']] == ['Kumara', 'Small Premade Box']
+    assert details['customer']['type'] == 'corporate_customer'
+
+def test_pay_rejects_missing_details_and_repeat_payment(api_ids):
+    client = _login('ying')
+    client.post('/api/v1/cart', json={'item_id': api_ids['feijoa'], 'item_type': 'unit_price', 'quantity': 3})
+    order = client.post('/api/v1/orders', json={'delivery_method': 'Pickup',
+                                                'payment_method': 'Debit Card'}).get_json()
+
+    response = client.post(f"/api/v1/orders/{order['id']}/payment", json={'bank_name': 'ANZ Bank'})
+    assert response.status_code == 400
+    assert 'debitCardNumber' in response.get_json()['error']
+
+    paid = {'bank_name': 'ANZ Bank', 'debit_card_number': '9876543210987654'}
+    assert client.post(f"/api/v1/orders/{order['id']}/payment", json=paid).status_code == 200
+    assert client.post(f"/api/v1/orders/{order['id']}/payment", json=paid).status_code == 409
+
+def test_default_box_contents_survive_a_purchase(api_ids, sqlite_session):
+    _place_paid_order(_login('ying'), [(api_ids['small_box'], 'premade_box', 1)])
+
+    small_box = sqlite_session.get(PremadeBox, api_ids['small_box'])
+    assert [veggie.vegName for veggie in small_box.get_default_contents()] == ['Kumara', 'Pumpkin']
+
+def test_account_payment_within_limit(api_ids, sqlite_session):
+    """Test an account payment is refused when it would take the balance past the customer's limit"""
+    client = _login('ying')
+
+    def place_account_order(quantity):
+        client.post('/api/v1/cart', json={'item_id': api_ids['feijoa'], 'item_type': 'unit_price',
+                                          'quantity': quantity})
+        return client.post('/api/v1/orders', json={'delivery_method': 'Pickup',
+                                                   'payment_method': 'Account'}).get_json()
+
+    order = place_account_order(150)
+    response = client.post(f"/api/v1/orders/{order['id']}/payment", json={})
+    assert response.status_code == 402
+    assert 'limit of $100.0' in response.get_json()['error']
+    assert sqlite_session.get(Customer, api_ids['customer']).custBalance == 0.0
+
+    client.delete('/api/v1/cart')
+    order = place_account_order(10)
+    assert client.post(f"/api/v1/orders/{order['id']}/payment", json={}).status_code == 200
+    sqlite_session.expire_all()
+    assert sqlite_session.get(Customer, api_ids['customer']).custBalance == pytest.approx(9.9)
+
+def test_customers_only_see_their_own_orders(api_ids):
+    order = _place_paid_order(_login('ying'), [(api_ids['feijoa'], 'unit_price', 3)])
+
+    assert _login('fresh').get(f"/api/v1/orders/{order['id']}").status_code == 404
+    assert _login('fresh').get('/api/v1/orders').get_json()['orders'] == []
+    assert _login('staff').get(f"/api/v1/orders/{order['id']}?fields=orderNumber").get_json() == {
+        'orderNumber': order['orderNumber']}
+
+def test_order_pages(api_ids):
+    client = _login('ying')
+    order_ids = [_place_paid_order(client, [(api_ids['feijoa'], 'unit_price', 1)])['id'] for _ in range(3)]
+
+    first = client.get('/api/v1/orders?limit=2&fields=id').get_json()
+    assert first['orders'] == [{'id': order_ids[2]}, {'id': order_ids[1]}]
+    second = client.get(f"/api/v1/orders?limit=2&fields=id&after={first['next_cursor']}").get_json()
+    assert second == {'orders': [{'id': order_ids[0]}], 'next_cursor': None}
+
+    staff_page = _login('staff').get(f"/api/v1/orders?customer_id={api_ids['customer']}").get_json()
+    assert [order['id'] for order in staff_page['orders']] == order_ids[::-1]
+    assert staff_page['orders'][0]['customer']['firstName'] == 'Ying'
+
+def test_popularity_report(api_ids):
+    _place_paid_order(_login('ying'), [(api_ids['feijoa'], 'unit_price', 3)])
+    client = _login('staff')
+
+    report = client.get('/api/v1/reports/popularity?days=7&metric=units&fields=item_name,units_sold').get_json()
+    assert report['popular'] == [{'item_name': 'Feijoa', 'units_sold': 3}]
+    assert client.get('/api/v1/reports/popularity?days=3').status_code == 400
+
+def test_orjson_provider(api_ids):
+    """Test the orjson provider writes ISO dates and falls back to Flask's conversions"""
+    assert isinstance(app.json, OrjsonProvider)
+    with app.app_context():
+        response = app.json.response({'day': date(2024, 5, 7), 'amount': Decimal('1.50'), 1: 'one'})
+    assert response.get_json() == {'day': '2024-05-07', 'amount': '1.50', '1': 'one'}
+
+def test_json_serializer_setting(api_ids):
+    app.config['JSON_SERIALIZER'] = 'json'
+    try:
+        provider = json_provider(app)
+        assert type(provider) is IsoDateJSONProvider
+        with app.app_context():
+            assert provider.dumps({'day': date(2024, 5, 7), 'amount': Decimal('1.50')}) == \
+                '{"amount": "1.50", "day": "2024-05-07"}'
+    finally:
+        app.config['JSON_SERIALIZER'] = 'orjson'
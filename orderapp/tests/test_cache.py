@@ -0,0 +1,206 @@
+import pytest
+from sqlalchemy import update
+from unittest.mock import Mock, patch
+from orderapp import app
+from orderapp.cache import CatalogCache, FragmentCache, catalog_cache, fragment_cache
+from orderapp.models.item import Item, WeightedVeggie
+from orderapp.versions import content_versions
+
+@pytest.fixture(scope='function')
+def test_cache():
+    """Create a small catalog cache for testing"""
+    return CatalogCache(max_entries=2, ttl=60)
+
+def test_cache_hit_and_miss(test_cache):
+    loader = Mock(return_value=['Kumara'])
+
+    assert test_cache.get_or_load('veggies', loader) == ['Kumara']
+    assert test_cache.get_or_load('veggies', loader) == ['Kumara']
+
+    loader.assert_called_once()
+    stats = test_cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['size'] == 1
+
+def test_cache_bump_version_invalidates_entries(test_cache):
+    loader = Mock(side_effect=[['Kumara'], ['Kumara', 'Pumpkin']])
+    test_cache.get_or_load('veggies', loader)
+
+    assert test_cache.bump_version() == 1
+    assert test_cache.get_or_load('veggies', loader) == ['Kumara', 'Pumpkin']
+    assert loader.call_count == 2
+
+def test_cache_evicts_least_recently_used(test_cache):
+    test_cache.get_or_load('a', lambda: 1)
+    test_cache.get_or_load('b', lambda: 2)
+    test_cache.get_or_load('a', lambda: 1)
+    test_cache.get_or_load('c', lambda: 3)
+
+    loader = Mock(return_value=2)
+    test_cache.get_or_load('b', loader)
+
+    # 'b' was the least recently used entry so it had to be loaded again
+    loader.assert_called_once()
+    assert test_cache.stats()['size'] == 2
+
+def test_cache_entries_expire_after_ttl(test_cache):
+    loader = Mock(return_value=['Kumara'])
+    with patch('orderapp.cache.time.monotonic', return_value=1000.0):
+        test_cache.get_or_load('veggies', loader)
+    with patch('orderapp.cache.time.monotonic', return_value=1061.0):
+        test_cache.get_or_load('veggies', loader)
+
+    assert loader.call_count == 2
+
+def test_cache_ignores_value_loaded_during_version_bump(test_cache):
+    def loader():
+        test_cache.bump_version()
+        return ['stale']
+
+    test_cache.get_or_load('veggies', loader)
+    assert test_cache.stats()['size'] == 0
+
+def test_stock_change_commit_bumps_catalog_version(seed_data, sqlite_session):
+    """Test committing a stock change moves the catalog to a new version"""
+    version = catalog_cache.version
+    veggie = seed_data['veggies'][0]
+
+    veggie.stock -= 1
+    sqlite_session.commit()
+    assert catalog_cache.version == version + 1
+
+    # Commits that don't touch items keep the version
+    customer = seed_data['customer']
+    customer.custBalance += 10
+    sqlite_session.commit()
+    assert catalog_cache.version == version + 1
+
+def test_rolled_back_stock_change_keeps_catalog_version(seed_data, sqlite_session):
+    """Test a rolled back stock change doesn't move the catalog version"""
+    version = catalog_cache.version
+    veggie = seed_data['veggies'][0]
+
+    veggie.stock -= 1
+    sqlite_session.flush()
+    sqlite_session.rollback()
+    sqlite_session.commit()
+
+    assert catalog_cache.version == version
+
+def test_custom_box_commit_bumps_catalog_version(seed_data, sqlite_session):
+    """Test creating a custom box moves the catalog to a new version"""
+    version = catalog_cache.version
+    box = seed_data['boxes'][0]
+    veggie_ids = [veggie.id for veggie in seed_data['veggies'][:2]]
+
+    box.create_custom_box(veggie_ids, seed_data['customer'].id)
+    sqlite_session.commit()
+
+    assert catalog_cache.version == version + 1
+
+@pytest.fixture(scope='function')
+def test_fragments():
+    """Create a small fragment cache for testing"""
+    return FragmentCache(max_entries=3, max_size=10, ttl=60)
+
+def test_fragment_cache_evicts_past_size_limit(test_fragments):
+    test_fragments.get_or_render('a', lambda: 'aaaa')
+    test_fragments.get_or_render('b', lambda: 'bbbb')
+    test_fragments.get_or_render('a', lambda: 'aaaa')
+    test_fragments.get_or_render('c', lambda: 'cccc')
+
+    # 'b' was the least recently used fragment, evicted to keep within 10 characters
+    render = Mock(return_value='bbbb')
+    test_fragments.get_or_render('b', render)
+    render.assert_called_once()
+    stats = test_fragments.stats()
+    assert stats['size'] <= 10
+    assert stats['evictions'] == 2
+
+def test_fragment_cache_skips_oversized_fragment(test_fragments):
+    render = Mock(return_value='x' * 11)
+    test_fragments.get_or_render('big', render)
+    test_fragments.get_or_render('big', render)
+
+    assert render.call_count == 2
+    assert test_fragments.stats()['entries'] == 0
+
+def test_fragment_cache_expires_after_ttl(test_fragments):
+    render = Mock(return_value='aaaa')
+    with patch('orderapp.cache.time.monotonic', return_value=1000.0):
+        test_fragments.get_or_render('a', render)
+    with patch('orderapp.cache.time.monotonic', return_value=1061.0):
+        test_fragments.get_or_render('a', render)
+
+    assert render.call_count == 2
+    assert test_fragments.stats()['size'] == 4
+
+def test_cache_tag_renders_block_once_per_key():
+    fragment_cache.clear()
+    template = app.jinja_env.from_string(
+        "Hi {{ name }}: {% cache 'greeting', version %}{{ load() }}{% endcache %}")
+    load = Mock(side_effect=['<b>v1</b>', 'v2'])
+
+    assert template.render(name='Ying', version=1, load=load) == 'Hi Ying: &lt;b&gt;v1&lt;/b&gt;'
+    assert template.render(name='Harry', version=1, load=load) == 'Hi Harry: &lt;b&gt;v1&lt;/b&gt;'
+    assert template.render(name='Harry', version=2, load=load) == 'Hi Harry: v2'
+    assert load.call_count == 2
+
+def test_report_page_is_rendered_once_for_all_staff(seed_data, sqlite_session, query_counter):
+    staff_id = seed_data['staff'].id
+    sqlite_session.expunge_all()
+    client = app.test_client()
+    with client.session_transaction() as client_session:
+        client_session.update({'loggedin': True, 'id': staff_id, 'role': 'staff'})
+
+    first = client.get('/report').get_data(as_text=True)
+    query_counter.reset()
+    second = client.get('/report').get_data(as_text=True)
+
+    assert second == first
+    # Only the orders version is read, the rollups aren't
+    assert not any('sales_rollups' in statement for statement in query_counter.statements)
+    assert fragment_cache.stats()['hits'] == 1
+
+def test_catalog_change_renders_veggies_again(seed_data, sqlite_session):
+    customer_id = seed_data['customer'].id
+    kumara_id = seed_data['veggies'][0].id
+    client = app.test_client()
+    with client.session_transaction() as client_session:
+        client_session.update({'loggedin': True, 'id': customer_id, 'role': 'private_customer'})
+    assert 'Stock: 100' in client.get('/view_veggies').get_data(as_text=True)
+
+    sqlite_session.get(WeightedVeggie, kumara_id).stock = 42
+    sqlite_session.commit()
+
+    assert 'Stock: 42' in client.get('/view_veggies').get_data(as_text=True)
+
+def test_other_process_catalog_change_renders_veggies_again(seed_data, sqlite_session, sqlite_engine):
+    """Test a catalog change made by another process isn't hidden by this process's caches"""
+    customer_id = seed_data['customer'].id
+    kumara_id = seed_data['veggies'][0].id
+    client = app.test_client()
+    with client.session_transaction() as client_session:
+        client_session.update({'loggedin': True, 'id': customer_id, 'role': 'private_customer'})
+    assert 'Stock: 100' in client.get('/view_veggies').get_data(as_text=True)
+
+    # Another process sells some stock and moves the shared catalog version on
+    with sqlite_engine.begin() as conn:
+        conn.execute(update(Item).where(Item.id == kumara_id).values(stock=42))
+    content_versions.bump(sqlite_session, ['catalog'])
+
+    assert 'Stock: 42' in client.get('/view_veggies').get_data(as_text=True)
+
+def test_all_veggies_loads_box_contents_in_one_query(seed_data, sqlite_session, query_counter):
+    staff_id = seed_data['staff'].id
+    sqlite_session.expunge_all()
+    client = app.test_client()
+    with client.session_transaction() as client_session:
+        client_session.update({'loggedin': True, 'id': staff_id, 'role': 'staff'})
+
+    query_counter.reset()
+    page = client.get('/view_all_veggies').get_data(as_text=True)
+
+    assert 'Kumara, Pumpkin, Celery, Feijoa, Avocado' in page
+    assert sum('box_contents' in statement for statement in query_counter.statements) == 1
@@ -0,0 +1,96 @@
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from flask import session
+from orderapp import app
+from orderapp.cart_store import (Cart, DatabaseCartStore, MemoryCartStore,
+                                 discard_session_cart, load_session_cart, save_session_cart)
+from orderapp.models.cart import SavedCart
+
+@pytest.fixture(scope='function')
+def test_cart():
+    """Create a cart with a veggie and a premade box"""
+    cart = Cart()
+    cart.add(1, 'weighted', 'Kumara', 3.99, 2.0, 7.98)
+    cart.add(7, 'premade_box', 'Small Premade Box', 10.0, 1.0, 10.0)
+    return cart
+
+def test_cart_add_to_existing_line(test_cart):
+    test_cart.add(1, 'weighted', 'Kumara', 3.99, 1.5, 5.99)
+
+    assert len(test_cart) == 2
+    assert test_cart.lines[0]['quantity'] == 3.5
+    assert test_cart.lines[0]['subtotal'] == 13.97
+    assert test_cart.subtotal == pytest.approx(23.97)
+
+def test_cart_same_id_different_type(test_cart):
+    """Test an item id is only the same line when the cart item type matches too"""
+    test_cart.add(1, 'premade_box', 'Small Premade Box', 10.0, 1.0, 10.0)
+    assert len(test_cart) == 3
+
+def test_cart_lines_are_copies(test_cart):
+    test_cart.lines[0]['contents'] = ['Kumara']
+    assert 'contents' not in test_cart.lines[0]
+
+def test_cart_json_round_trip(test_cart):
+    assert Cart.from_json(test_cart.to_json()).lines == test_cart.lines
+
+@pytest.fixture(scope='function', params=['memory', 'database'])
+def cart_store(request, seed_data):
+    """Each cart store, the database store on SQLite"""
+    if request.param == 'memory':
+        return MemoryCartStore(ttl=60)
+    return DatabaseCartStore(ttl=60)
+
+def test_cart_store_save_and_load(cart_store, seed_data, test_cart):
+    customer = seed_data['customer']
+    assert cart_store.load('cart1', customer.id) is None
+
+    cart_store.save('cart1', customer.id, test_cart)
+    test_cart.add(2, 'pack', 'Celery', 3.99, 1, 3.99)
+    cart_store.save('cart1', customer.id, test_cart)
+
+    assert cart_store.load('cart1', customer.id).lines == test_cart.lines
+
+def test_cart_store_only_loads_own_cart(cart_store, seed_data, test_cart):
+    cart_store.save('cart1', seed_data['customer'].id, test_cart)
+    assert cart_store.load('cart1', seed_data['corporate'].id) is None
+
+def test_cart_store_delete(cart_store, seed_data, test_cart):
+    cart_store.save('cart1', seed_data['customer'].id, test_cart)
+    cart_store.delete('cart1')
+    assert cart_store.load('cart1', seed_data['customer'].id) is None
+
+def test_memory_cart_store_expires_carts(test_cart):
+    store = MemoryCartStore(ttl=60)
+    with patch('orderapp.cart_store.time.monotonic', return_value=1000.0):
+        store.save('cart1', 1, test_cart)
+    with patch('orderapp.cart_store.time.monotonic', return_value=1061.0):
+        assert store.load('cart1', 1) is None
+        assert store.purge() == 1
+
+def test_database_cart_store_purges_expired_carts(seed_data, sqlite_session, test_cart):
+    store = DatabaseCartStore(ttl=60)
+    store.save('old', seed_data['customer'].id, test_cart)
+    store.save('new', seed_data['corporate'].id, test_cart)
+    sqlite_session.get(SavedCart, 'old').updatedAt = datetime.now() - timedelta(seconds=120)
+    sqlite_session.commit()
+
+    assert store.load('old', seed_data['customer'].id) is None
+    assert store.purge() == 1
+    assert sqlite_session.query(SavedCart).count() == 1
+
+def test_session_cart_keeps_only_id_in_session(test_cart):
+    """Test the session holds the cart id and the lines stay in the store"""
+    store = MemoryCartStore(ttl=60)
+    with patch('orderapp.cart_store.cart_store', store), app.test_request_context():
+        session['id'] = 1
+        assert len(load_session_cart()) == 0
+
+        save_session_cart(test_cart)
+        assert set(session.keys()) == {'id', 'cart_id'}
+        assert load_session_cart().lines == test_cart.lines
+
+        discard_session_cart()
+        assert 'cart_id' not in session
+        assert len(load_session_cart()) == 0
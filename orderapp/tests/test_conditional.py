@@ -0,0 +1,152 @@
+import pytest
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+from orderapp import app
+from orderapp.cache import catalog_cache
+from orderapp.conditional import conditional_stats
+from orderapp.models.order import Order
+from orderapp.models.user import Staff
+from orderapp.reaper import reap_unpaid_orders
+from orderapp.versions import content_versions
+
+@pytest.fixture(scope='function')
+def ids(seed_data, sqlite_session):
+    """Ids of the seeded users and a paid order, with the objects cleared from the session"""
+    customer = seed_data['customer']
+    order = customer.checkout('Pickup', 'Debit Card', [{'id': seed_data['veggies'][0].id, 'type': 'weighted',
+                                                        'quantity': 2}])
+    customer.make_payment(round(order.total, 2), 'Debit Card', order,
+                          bankName='ANZ Bank', debitCardNumber='9876543210987654')
+    ids = {'staff': seed_data['staff'].id, 'customer': customer.id,
+           'corporate': seed_data['corporate'].id, 'order': order.id}
+    sqlite_session.expunge_all()
+    catalog_cache.clear()
+    conditional_stats.clear()
+    return ids
+
+def _client(user_id, role):
+    client = app.test_client()
+    with client.session_transaction() as client_session:
+        client_session.update({'loggedin': True, 'id': user_id, 'role': role})
+    return client
+
+def test_catalog_not_modified_skips_the_page(ids, sqlite_session, query_counter):
+    client = _client(ids['customer'], 'private_customer')
+    response = client.get('/view_veggies')
+    etag = response.headers['ETag']
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] in ('private, no-cache', 'no-cache, private')
+
+    catalog_cache.clear()
+    query_counter.reset()
+    response = client.get('/view_veggies', headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.get_data() == b''
+    assert response.headers['ETag'] == etag
+    # Only the customer and the catalog version are read, the catalog isn't loaded
+    assert query_counter.count == 2
+    assert catalog_cache.stats()['misses'] == 0
+
+def test_catalog_change_moves_the_etag(ids, sqlite_session):
+    client = _client(ids['customer'], 'private_customer')
+    etag = client.get('/view_veggies').headers['ETag']
+
+    # Another process sells some stock
+    sqlite_session.get(Order, ids['order']).update_stock()
+
+    response = client.get('/view_veggies', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert content_versions.get('catalog') >= 1
+
+def test_etag_is_per_user(ids):
+    customer_etag = _client(ids['customer'], 'private_customer').get('/api/v1/catalog').headers['ETag']
+    corporate = _client(ids['corporate'], 'corporate_customer')
+
+    assert corporate.get('/api/v1/catalog', headers={'If-None-Match': customer_etag}).status_code == 200
+
+def test_order_page_etag_follows_status(ids, sqlite_session):
+    client = _client(ids['customer'], 'private_customer')
+    path = f"/order_details/{ids['order']}"
+    response = client.get(path)
+    etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+
+    assert client.get(path, headers={'If-None-Match': etag}).status_code == 304
+    assert client.get(path, headers={'If-Modified-Since': last_modified}).status_code == 304
+
+    sqlite_session.get(Staff, ids['staff']).update_order_status(ids['order'], 'Processed')
+
+    response = client.get(path, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+def test_order_validators_only_for_the_owner(ids):
+    path = f"/order_details/{ids['order']}"
+    etag = _client(ids['customer'], 'private_customer').get(path).headers['ETag']
+    other = _client(ids['corporate'], 'corporate_customer')
+
+    response = other.get(path, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 'Access Denied' in response.get_data(as_text=True)
+    assert 'ETag' not in response.headers and 'Last-Modified' not in response.headers
+
+    response = other.get(f"/api/v1/orders/{ids['order']}", headers={'If-None-Match': etag})
+    assert response.status_code == 404
+    assert 'ETag' not in response.headers
+    # Staff can view every order
+    assert _client(ids['staff'], 'staff').get(path).headers.get('ETag')
+
+def test_order_last_modified_is_utc(ids, sqlite_session, monkeypatch):
+    """Test an order page's Last-Modified is in UTC whatever the server's time zone"""
+    client = _client(ids['customer'], 'private_customer')
+    monkeypatch.setenv('TZ', 'NZST-12')
+    time.tzset()
+    try:
+        sqlite_session.get(Staff, ids['staff']).update_order_status(ids['order'], 'Processed')
+        response = client.get(f"/order_details/{ids['order']}")
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+    assert abs(response.last_modified - datetime.now(timezone.utc)) < timedelta(minutes=1)
+
+def test_order_list_etag_follows_new_and_reaped_orders(ids, sqlite_session):
+    client = _client(ids['staff'], 'staff')
+    etag = client.get('/view_all_orders').headers['ETag']
+    assert client.get('/view_all_orders', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/view_all_orders?status=Pending', headers={'If-None-Match': etag}).status_code == 200
+
+    # An unpaid order is placed, then reaped
+    order = Order(orderNumber='2000', customer=sqlite_session.get(Order, ids['order']).customer,
+                  deliveryMethod='Pickup', paymentMethod='Account')
+    sqlite_session.add(order)
+    sqlite_session.commit()
+    etag_with_unpaid = client.get('/view_all_orders', headers={'If-None-Match': etag}).headers['ETag']
+    assert etag_with_unpaid != etag
+
+    assert reap_unpaid_orders(grace=0, now=datetime.now() + timedelta(seconds=1)) == 1
+    assert client.get('/view_all_orders', headers={'If-None-Match': etag_with_unpaid}).status_code == 200
+
+def test_error_page_and_missing_order_are_not_tagged(ids):
+    client = _client(ids['customer'], 'private_customer')
+
+    with patch.object(Order, 'get_order_details', side_effect=RuntimeError('Database unavailable')):
+        response = client.get(f"/order_details/{ids['order']}")
+    assert 'Database unavailable' in response.get_data(as_text=True)
+    assert 'ETag' not in response.headers
+
+    response = client.get('/order_details/999')
+    assert 'Not Found' in response.get_data(as_text=True)
+    assert 'ETag' not in response.headers
+
+def test_conditional_get_stats(ids):
+    client = _client(ids['customer'], 'private_customer')
+    etag = client.get('/view_veggies').headers['ETag']
+    for _ in range(3):
+        client.get('/view_veggies', headers={'If-None-Match': etag})
+
+    staff = _client(ids['staff'], 'staff')
+    assert staff.get('/stats').get_json()['conditional_get']['view_veggies'] == {
+        'requests': 4, 'not_modified': 3, 'hit_rate': 0.75}
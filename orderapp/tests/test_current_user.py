@@ -0,0 +1,52 @@
+import pytest
+from flask import g, session
+from orderapp import app
+from orderapp.current_user import load_current_user
+
+@pytest.fixture(scope='function')
+def logins(seed_data, sqlite_session):
+    """Ids and roles of the seeded users, with the users cleared from the session"""
+    logins = {name: (seed_data[name].id, seed_data[name].type) for name in ['staff', 'customer', 'corporate']}
+    sqlite_session.expunge_all()
+    return logins
+
+def _load_for(path, login=None):
+    """Run the current user loader for a request to the path, logged in with the id and role"""
+    with app.test_request_context(path):
+        if login is not None:
+            session.update({'loggedin': True, 'id': login[0], 'role': login[1]})
+        load_current_user()
+        user = g.user
+        return user, user.discountRate if hasattr(user, 'discountRate') else None
+
+def test_load_current_user_with_role_model(logins, query_counter):
+    """Test a corporate customer is loaded with their corporate columns in one query"""
+    query_counter.reset()
+    user, discount_rate = _load_for('/view_cart', logins['corporate'])
+
+    assert discount_rate == 0.10
+    assert query_counter.count == 1
+
+def test_routes_without_current_user_skip_loading(logins, query_counter):
+    query_counter.reset()
+    assert _load_for('/clear_cart', logins['customer'])[0] is None
+    assert _load_for('/', logins['customer'])[0] is None
+    assert query_counter.count == 0
+
+def test_current_user_not_loaded_for_other_roles(logins, query_counter):
+    """Test staff aren't loaded for customer routes, and customers aren't loaded for staff routes"""
+    query_counter.reset()
+    assert _load_for('/profile', logins['staff'])[0] is None
+    assert _load_for('/view_all_orders', logins['customer'])[0] is None
+    assert query_counter.count == 0
+
+def test_current_user_not_loaded_when_logged_out(logins):
+    assert _load_for('/profile')[0] is None
+
+def test_route_without_current_user_returns_404(logins):
+    """Test a staff member opening a customer route gets a 404"""
+    client = app.test_client()
+    with client.session_transaction() as client_session:
+        client_session.update({'loggedin': True, 'id': logins['staff'][0], 'role': 'staff'})
+
+    assert client.get('/profile').status_code == 404
@@ -0,0 +1,101 @@
+import pytest
+from unittest.mock import patch
+from orderapp.directory import CustomerDirectory, CustomerEntry
+
+@pytest.fixture(scope='function')
+def test_directory():
+    """Create a customer directory with a few customers"""
+    directory = CustomerDirectory(reload_interval=None)
+    directory.build([
+        CustomerEntry(1, 'Ying', 'Zheng', 'ying', 'private_customer'),
+        CustomerEntry(2, 'Harry', 'Potter', 'harry', 'private_customer'),
+        CustomerEntry(3, 'Peter', 'Wu', 'peter', 'private_customer'),
+        CustomerEntry(4, 'Hello', 'Fresh', 'fresh', 'corporate_customer'),
+        CustomerEntry(5, 'Pat', 'Harrison', 'pharrison', 'private_customer'),
+    ])
+    return directory
+
+@pytest.fixture(scope='function')
+def loaded_directory(seed_data):
+    """Replace the global customer directory with one loaded from the SQLite database"""
+    directory = CustomerDirectory(reload_interval=None)
+    with patch('orderapp.directory.customer_directory', directory):
+        directory.load()
+        yield directory
+
+def _ids(page):
+    return [customer.id for customer in page['customers']]
+
+def test_search_by_prefix(test_directory):
+    """Test a prefix matches usernames, first names and last names, ignoring case"""
+    assert _ids(test_directory.search('har')) == [5, 2]
+    assert _ids(test_directory.search('P')) == [5, 3, 2]
+    assert _ids(test_directory.search('zheng')) == [1]
+    assert _ids(test_directory.search('x')) == []
+
+def test_search_lists_each_customer_once(test_directory):
+    """Test a customer whose names all match is only listed once"""
+    assert _ids(test_directory.search('')) == [4, 5, 2, 3, 1]
+    assert _ids(test_directory.search('peter')) == [3]
+
+def test_search_pages(test_directory):
+    first_page = test_directory.search('', limit=2)
+    second_page = test_directory.search('', after=first_page['next_cursor'], limit=2)
+    last_page = test_directory.search('', after=second_page['next_cursor'], limit=2)
+
+    assert _ids(first_page) + _ids(second_page) + _ids(last_page) == [4, 5, 2, 3, 1]
+    assert last_page['next_cursor'] is None
+
+def test_search_invalid_cursor(test_directory):
+    with pytest.raises(ValueError, match="Invalid page cursor"):
+        test_directory.search('', after='nope')
+
+def test_put_and_remove(test_directory):
+    test_directory.put(CustomerEntry(6, 'Harriet', 'Jones', 'hjones', 'private_customer'))
+    assert _ids(test_directory.search('harri')) == [6, 5]
+
+    # Renaming a customer replaces their old names
+    test_directory.put(CustomerEntry(2, 'Harold', 'Potter', 'harold', 'private_customer'))
+    assert _ids(test_directory.search('harry')) == []
+    assert _ids(test_directory.search('harold')) == [2]
+
+    test_directory.remove(6)
+    assert _ids(test_directory.search('harri')) == [5]
+    assert test_directory.stats()['customers'] == 5
+
+def test_load_only_customers(seed_data, loaded_directory):
+    """Test staff are not loaded into the directory"""
+    assert _ids(loaded_directory.search('')) == [seed_data['corporate'].id, seed_data['customer'].id]
+
+def test_committed_customer_changes_update_directory(seed_data, loaded_directory, sqlite_session):
+    from orderapp.models.user import Customer
+    customer = Customer(firstname='Harry', lastname='Potter', username='harry', password='123',
+                        address='3 North Road, Wellington', balance=0.0, maxOwing=100.0)
+    sqlite_session.add(customer)
+    sqlite_session.commit()
+    assert _ids(loaded_directory.search('pot')) == [customer.id]
+
+    seed_data['customer'].lastname = 'Wu'
+    sqlite_session.commit()
+    assert _ids(loaded_directory.search('zheng')) == []
+    assert _ids(loaded_directory.search('wu')) == [seed_data['customer'].id]
+
+    sqlite_session.delete(customer)
+    sqlite_session.commit()
+    assert _ids(loaded_directory.search('pot')) == []
+
+def test_rolled_back_customer_changes_are_ignored(seed_data, loaded_directory, sqlite_session):
+    seed_data['customer'].lastname = 'Wu'
+    sqlite_session.flush()
+    sqlite_session.rollback()
+
+    assert _ids(loaded_directory.search('wu')) == []
+    assert _ids(loaded_directory.search('zheng')) == [seed_data['customer'].id]
+
+def test_other_customer_changes_leave_directory(seed_data, loaded_directory, sqlite_session):
+    """Test a balance change doesn't touch the directory"""
+    with patch.object(loaded_directory, 'put') as mock_put:
+        seed_data['customer'].custBalance += 10
+        sqlite_session.commit()
+
+    mock_put.assert_not_called()
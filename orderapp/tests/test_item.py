@@ -189,4 +189,24 @@ def test_create_custom_box(test_premade_box, test_weighted_veggie, test_pack_veg
         mock_db_session.flush.assert_called_once()
         
         # Verify box_contents insertion was called
-        assert mock_db_session.execute.call_count == 3  # Once for each veggie
\ No newline at end of file
+        assert mock_db_session.execute.call_count == 3  # Once for each veggie
+
+def test_get_contents_for_boxes(seed_data, query_counter):
+    """Test the contents of several boxes are resolved in one query"""
+    boxes = seed_data['boxes']
+    box_ids = [box.id for box in boxes]
+
+    query_counter.reset()
+    contents = PremadeBox.get_contents_for_boxes(box_ids)
+
+    assert query_counter.count == 1
+    assert contents[box_ids[0]] == ['Kumara', 'Pumpkin']
+    assert contents[box_ids[1]] == ['Kumara', 'Pumpkin', 'Celery']
+    assert len(contents[box_ids[2]]) == 5
+    for box in boxes:
+        assert sorted(contents[box.id]) == sorted(v.vegName for v in box.get_contents())
+
+def test_get_contents_for_boxes_empty(mock_db_session):
+    """Test no query is made when there are no boxes"""
+    assert PremadeBox.get_contents_for_boxes([]) == {}
+    mock_db_session.query.assert_not_called()
@@ -1,7 +1,7 @@
 import pytest
 from unittest.mock import MagicMock, patch
 from datetime import date
-from orderapp.models.order import Order, OrderLine
+from orderapp.models.order import Order, OrderLine, InsufficientStockError
 
 @pytest.fixture(scope='function')
 def mock_db_session():
@@ -99,13 +99,15 @@ def test_update_stock(test_order, mock_item, mock_db_session):
     """Test updating the stock of items after receiving the payment"""
     test_order.add_item(mock_item, 2)
     mock_db_session.reset_mock() 
+    mock_db_session.execute.return_value.rowcount = 1
     
     test_order.update_stock()
 
-    # Verify database interactions
-    assert mock_item.stock == 8
-    mock_db_session.add.assert_called_once_with(mock_item)
+    # Verify the guarded decrement was sent as one batch and committed
+    mock_db_session.execute.assert_called_once()
+    assert mock_db_session.execute.call_args[0][1] == [{'item_id': mock_item.id, 'quantity': 2}]
     mock_db_session.commit.assert_called_once()
+    mock_db_session.rollback.assert_not_called()
 
 def test_private_customer_pickup_calculate_total(test_order, mock_item):
     """Test calculating the total price of the order for private customer pickup"""
@@ -139,6 +141,37 @@ def test_corporate_customer_delivery_calculate_total(test_order, mock_item):
 
     assert test_order.calculate_total() == 3.98 * 0.9 + 10
 
+def test_record_totals(test_order, mock_item):
+    """Test storing the total, discount and delivery fee of a corporate delivery order"""
+    test_order.customer.type = 'corporate_customer'
+    test_order.deliveryMethod = 'Delivery'
+    test_order.order_lines = [OrderLine(order=test_order, item=mock_item, quantity=2)]
+
+    assert test_order.record_totals() == test_order.calculate_total()
+    assert test_order.totalAmount == 3.98 * 0.9 + 10
+    assert test_order.discountAmount == pytest.approx(0.398)
+    assert test_order.deliveryFee == 10.00
+
+def test_total_uses_stored_total(test_order, mock_item):
+    """Test the total is calculated until it is stored, then read without the order lines"""
+    test_order.order_lines = [OrderLine(order=test_order, item=mock_item, quantity=2)]
+    assert test_order.total == 3.98
+
+    test_order.record_totals()
+    test_order.order_lines = []
+    assert test_order.total == 3.98
+
+def test_verify_total(test_order, mock_item):
+    """Test a stored total that no longer matches the order lines is detected"""
+    test_order.order_lines = [OrderLine(order=test_order, item=mock_item, quantity=2)]
+    assert test_order.verify_total() is True
+
+    test_order.record_totals()
+    assert test_order.verify_total() is True
+
+    test_order.totalAmount = 5.00
+    assert test_order.verify_total() is False
+
 def test_get_order_details(test_order, mock_item):
     """Test getting the order details"""
     order_lines = [OrderLine(order=test_order, item=mock_item, quantity=2)]
@@ -159,3 +192,116 @@ def test_get_order_details(test_order, mock_item):
     assert details['customer']['firstName'] == test_order.customer.firstname
     assert details['customer']['lastName'] == test_order.customer.lastname
     assert details['customer']['custAddress'] == test_order.customer.custAddress
+
+def test_update_stock_guarded_decrement(seed_data, place_order, query_counter):
+    """Test all the lines of an order are decremented in one batch"""
+    kumara, pumpkin = seed_data['veggies'][:2]
+    box = seed_data['boxes'][0]
+    order = place_order(seed_data['customer'], [(kumara, 2), (pumpkin, 3), (kumara, 1), (box, 1)], paid=False)
+    order.order_lines
+
+    query_counter.reset()
+    order.update_stock()
+
+    updates = [statement for statement in query_counter.statements if statement.startswith('UPDATE items')]
+    assert len(updates) == 1
+    assert kumara.stock == 97
+    assert pumpkin.stock == 77
+    assert box.stock == 29
+
+def test_update_stock_rejects_whole_order(seed_data, place_order):
+    """Test no stock is taken when any line falls short"""
+    kumara, pumpkin, celery = seed_data['veggies'][:3]
+    order = place_order(seed_data['customer'], [(kumara, 2), (pumpkin, 81), (celery, 80)], paid=False)
+
+    with pytest.raises(InsufficientStockError) as exc_info:
+        order.update_stock()
+
+    assert exc_info.value.shortfalls == [
+        {'item_id': pumpkin.id, 'name': 'Pumpkin', 'available': 80, 'requested': 81},
+        {'item_id': celery.id, 'name': 'Celery', 'available': 75, 'requested': 80},
+    ]
+    assert str(exc_info.value) == ("Not enough stock for Pumpkin (Available: 80.0, Ordered: 81.0), "
+                                   "Celery (Available: 75.0, Ordered: 80.0)")
+    assert kumara.stock == 100
+    assert pumpkin.stock == 80
+    assert celery.stock == 75
+
+def test_update_stock_concurrent_orders_do_not_oversell(seed_data, place_order):
+    """Test the second of two orders for the last stock is rejected"""
+    pumpkin = seed_data['veggies'][1]
+    first = place_order(seed_data['customer'], [(pumpkin, 50)], paid=False)
+    second = place_order(seed_data['corporate'], [(pumpkin, 50)], paid=False)
+
+    # Both orders were placed while there was enough stock
+    first.update_stock()
+    with pytest.raises(InsufficientStockError):
+        second.update_stock()
+
+    assert pumpkin.stock == 30
+
+def test_payment_rolled_back_on_stock_shortfall(seed_data, sqlite_session, place_order):
+    """Test a payment for an order that can't be filled saves nothing, not even the balance charge"""
+    from orderapp.models.payment import Payment
+    from orderapp.models.report import ItemDailySales, ItemSales, SalesRollup
+    kumara, pumpkin = seed_data['veggies'][:2]
+    customer = seed_data['customer']
+    order = place_order(customer, [(kumara, 2), (pumpkin, 81)], paid=False, paymentMethod='Account')
+
+    with pytest.raises(InsufficientStockError):
+        customer.make_payment(round(order.calculate_total(), 2), 'Account', order)
+
+    sqlite_session.expire_all()
+    assert sqlite_session.query(Payment).count() == 0
+    assert customer.custBalance == 0.0
+    assert order.totalAmount is None
+    assert sqlite_session.query(SalesRollup).count() == 0
+    assert sqlite_session.query(ItemSales).filter(ItemSales.orderCount > 0).count() == 0
+    assert sqlite_session.query(ItemDailySales).count() == 0
+    assert kumara.stock == 100
+
+def test_order_details_fixed_query_count(seed_data, sqlite_session, place_order, query_counter):
+    """Test an order's details cost the same number of queries however many lines it has"""
+    kumara, pumpkin, celery, cabbage, feijoa = seed_data['veggies'][:5]
+    small, medium, large = seed_data['boxes']
+    small_order = place_order(seed_data['customer'], [(kumara, 1), (small, 1)])
+    large_order = place_order(seed_data['corporate'],
+                              [(kumara, 2), (pumpkin, 1), (celery, 1), (feijoa, 6),
+                               (small, 1), (medium, 1), (large, 2)])
+    order_ids = [small_order.id, large_order.id]
+
+    counts = []
+    for order_id in order_ids:
+        sqlite_session.expunge_all()
+        query_counter.reset()
+        order = sqlite_session.get(Order, order_id, options=Order.details_options())
+        details = order.get_order_details()
+        counts.append(query_counter.count)
+
+    # Order and customer, order lines, items, box contents
+    assert counts == [4, 4]
+    assert details['customer']['type'] == 'corporate_customer'
+    assert [item['name'] for item in details['items']] == [
+        'Kumara', 'Pumpkin', 'Celery', 'Feijoa', 'Small Premade Box', 'Medium Premade Box', 'Large Premade Box']
+    assert details['items'][4]['contents'] == ['Kumara', 'Pumpkin']
+
+def test_details_for_several_orders(seed_data, sqlite_session, place_order, query_counter):
+    """Test the details of several orders are loaded with the same fixed number of queries"""
+    kumara, pumpkin = seed_data['veggies'][:2]
+    small, medium = seed_data['boxes'][:2]
+    order_ids = [place_order(customer, lines).id
+                 for customer, lines in [(seed_data['customer'], [(kumara, 1), (small, 1)]),
+                                         (seed_data['corporate'], [(pumpkin, 2), (medium, 1)]),
+                                         (seed_data['customer'], [(small, 3)])]]
+    sqlite_session.expunge_all()
+
+    query_counter.reset()
+    orders = sqlite_session.query(Order).options(*Order.details_options()).\
+        filter(Order.id.in_(order_ids)).order_by(Order.id).all()
+    details = Order.get_details_for_orders(orders)
+
+    assert query_counter.count == 4
+    assert [order['id'] for order in details] == order_ids
+    assert [[item['name'] for item in order['items']] for order in details] == [
+        ['Kumara', 'Small Premade Box'], ['Pumpkin', 'Medium Premade Box'], ['Small Premade Box']]
+    assert details[1]['items'][1]['contents'] == ['Kumara', 'Pumpkin', 'Celery']
@@ -0,0 +1,84 @@
+import threading
+import pytest
+from orderapp import app, hashing
+from orderapp.models.user import Customer
+from orderapp.passwords import (HashingPool, PasswordHashing, PasswordHashingBusy,
+                                Pbkdf2Hasher, ScryptHasher, password_hashing)
+
+@pytest.mark.parametrize('hasher', [Pbkdf2Hasher(iterations=1000), ScryptHasher(n=2 ** 4)])
+def test_hasher_round_trip(hasher):
+    stored = hasher.hash('123')
+
+    assert stored.startswith(hasher.name + '$')
+    assert hasher.verify('123', stored)
+    assert not hasher.verify('1234', stored)
+    assert not hasher.needs_rehash(stored)
+
+def test_each_password_has_own_salt():
+    hasher = Pbkdf2Hasher(iterations=1000)
+    assert hasher.hash('123') != hasher.hash('123')
+
+def test_needs_rehash_when_cost_changes():
+    stored = Pbkdf2Hasher(iterations=1000).hash('123')
+    assert Pbkdf2Hasher(iterations=2000).needs_rehash(stored)
+    # A hash made with the old cost can still be checked
+    assert Pbkdf2Hasher(iterations=2000).verify('123', stored)
+
+def test_verify_any_hasher():
+    """Test a password is checked with the hasher that made its hash"""
+    scrypt_hash = password_hashing.hashers['scrypt'].hash('123')
+    legacy_hash = hashing.hash_value('123', salt=app.config['PASSWORD_SALT'])
+
+    assert password_hashing.verify('123', scrypt_hash)
+    assert password_hashing.verify('123', legacy_hash)
+    assert not password_hashing.verify('1234', legacy_hash)
+    assert password_hashing.needs_rehash(scrypt_hash)
+    assert password_hashing.needs_rehash(legacy_hash)
+    assert not password_hashing.needs_rehash(password_hashing.hash('123'))
+
+def test_check_password_rehashes_legacy_hash():
+    customer = Customer(firstname='Ying', lastname='Zheng', username='ying', password='123',
+                        address='23 Kingsland Road, Auckland', balance=0.0, maxOwing=100.0)
+    customer.password_hash = hashing.hash_value('123', salt=app.config['PASSWORD_SALT'])
+
+    assert not customer.check_password('1234')
+    assert '$' not in customer.password_hash
+
+    assert customer.check_password('123')
+    assert customer.password_hash.startswith('pbkdf2_sha256$')
+    assert customer.check_password('123')
+
+@pytest.mark.parametrize('kind', ['thread', 'process'])
+def test_hashing_on_pool(kind):
+    config = dict(app.config, PASSWORD_PBKDF2_ITERATIONS=1000, PASSWORD_HASH_POOL=kind,
+                  PASSWORD_HASH_WORKERS=2)
+    pooled = PasswordHashing(config)
+    try:
+        stored = pooled.hash('123')
+        assert pooled.verify('123', stored)
+        assert not pooled.verify('1234', stored)
+    finally:
+        pooled.pool.shutdown()
+
+def test_pool_sheds_load_when_full():
+    """Test a hash waiting behind a full queue is refused rather than queued without limit"""
+    pool = HashingPool('thread', workers=1, max_pending=1)
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow_hash():
+        started.set()
+        release.wait()
+        return 'done'
+
+    worker = threading.Thread(target=pool.run, args=(slow_hash,))
+    worker.start()
+    started.wait()
+    try:
+        with pytest.raises(PasswordHashingBusy):
+            pool.run(str, 'next')
+    finally:
+        release.set()
+        worker.join()
+    assert pool.run(str, 'next') == 'next'
+    pool.shutdown()
@@ -0,0 +1,107 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError
+from orderapp import app
+from orderapp.config import ProductionConfig, TestingConfig, engine_options, get_config
+from orderapp.pool_stats import EnginePoolStats, TimedQueuePool, pool_stats
+
+def _pooled_engine(path):
+    """SQLite file engine with a timed pool of one connection and no overflow"""
+    return create_engine(f"sqlite:///{path}", poolclass=TimedQueuePool,
+                         pool_size=1, max_overflow=0, pool_timeout=0.05)
+
+@pytest.fixture(scope='function')
+def engine_stats():
+    """Pool counters of the test engines, kept apart from the app's"""
+    return EnginePoolStats(slow_wait=app.config['DB_POOL_SLOW_WAIT'])
+
+@pytest.fixture(scope='function')
+def pooled_engine(tmp_path, engine_stats):
+    """Timed pool engine counted as 'primary'"""
+    engine = _pooled_engine(tmp_path / 'pool.db')
+    engine_stats.track('primary', engine)
+    yield engine
+    engine.dispose()
+
+def test_pool_counts_checkouts(pooled_engine, engine_stats):
+    with pooled_engine.connect() as conn:
+        conn.execute(text('select 1'))
+        assert engine_stats.get('primary').stats()['in_use'] == 1
+
+    with pooled_engine.connect() as conn:
+        conn.execute(text('select 1'))
+
+    stats = engine_stats.stats()['primary']
+    assert stats['checkouts'] == 2
+    assert stats['in_use'] == 0
+    assert stats['peak_in_use'] == 1
+    assert stats['connects'] == 1
+    assert stats['size'] == 1
+    assert stats['idle'] == 1
+
+def test_pool_counts_timeouts(pooled_engine, engine_stats):
+    with pooled_engine.connect():
+        with pytest.raises(TimeoutError):
+            pooled_engine.connect()
+
+    stats = engine_stats.get('primary').stats()
+    assert stats['timeouts'] == 1
+    assert stats['slow_waits'] == 0
+    assert stats['max_wait'] >= 0.05
+
+def test_pool_slow_wait_from_config(pooled_engine, engine_stats):
+    assert pool_stats.slow_wait == app.config['DB_POOL_SLOW_WAIT']
+    assert pool_stats.get('primary').slow_wait == app.config['DB_POOL_SLOW_WAIT']
+
+    engine_stats.get('primary').slow_wait = 0.01
+    with pooled_engine.connect():
+        with pytest.raises(TimeoutError):
+            pooled_engine.connect()
+    assert engine_stats.get('primary').stats()['slow_waits'] == 1
+
+def test_pool_counts_invalidations(pooled_engine, engine_stats):
+    with pooled_engine.connect() as conn:
+        conn.invalidate()
+    assert engine_stats.get('primary').stats()['invalidations'] == 1
+
+def test_pools_counted_per_engine(pooled_engine, engine_stats, tmp_path):
+    """Test the replica's connections are counted apart from the primary's"""
+    replica = _pooled_engine(tmp_path / 'replica.db')
+    engine_stats.track('replica', replica)
+
+    with replica.connect():
+        with pytest.raises(TimeoutError):
+            replica.connect()
+    with pooled_engine.connect() as conn:
+        conn.execute(text('select 1'))
+    replica.dispose()
+    # A disposed engine's new pool keeps counting into the same counters
+    with replica.connect() as conn:
+        conn.execute(text('select 1'))
+
+    stats = engine_stats.stats()
+    assert list(stats) == ['primary', 'replica']
+    assert stats['primary']['checkouts'] == 1
+    assert stats['primary']['timeouts'] == 0
+    assert stats['replica']['checkouts'] == 2
+    assert stats['replica']['connects'] == 2
+    assert stats['replica']['timeouts'] == 1
+    replica.dispose()
+
+def test_get_config_profiles(monkeypatch):
+    assert get_config('test') is TestingConfig
+    assert get_config('prod') is ProductionConfig
+    monkeypatch.setenv('ORDERAPP_ENV', 'prod')
+    assert get_config() is ProductionConfig
+    with pytest.raises(ValueError, match="Unknown configuration profile"):
+        get_config('staging')
+
+def test_engine_options_from_environment(monkeypatch):
+    monkeypatch.setenv('DB_POOL_SIZE', '20')
+    monkeypatch.setenv('DB_POOL_PRE_PING', 'false')
+    options = engine_options(pool_size=5, max_overflow=5, pool_timeout=10, pool_recycle=280, pool_pre_ping=True)
+
+    assert options['pool_size'] == 20
+    assert options['pool_pre_ping'] is False
+    assert options['pool_recycle'] == 280
+    assert options['poolclass'] is TimedQueuePool
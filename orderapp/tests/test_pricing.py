@@ -0,0 +1,55 @@
+import pytest
+from orderapp.pricing import price_cart, resolve_cart_items
+
+@pytest.fixture(scope='function')
+def cart_lines(seed_data, cart_line):
+    """Cart lines for a weighted veggie, a pack veggie, a unit price veggie and a premade box"""
+    veggies, boxes = seed_data['veggies'], seed_data['boxes']
+    return [
+        cart_line(veggies[0], 'weighted', 2),
+        cart_line(veggies[2], 'pack', 1),
+        cart_line(veggies[4], 'unit_price', 10),
+        cart_line(boxes[0], 'premade_box', 1),
+    ]
+
+def test_price_cart_private_customer(seed_data, cart_lines, query_counter):
+    query_counter.reset()
+    priced = price_cart(seed_data['customer'], cart_lines, 'Pickup')
+
+    assert [line['subtotal'] for line in priced['lines']] == [7.98, 3.99, 9.9, 10.0]
+    assert [line['name'] for line in priced['lines']] == ['Kumara', 'Celery', 'Feijoa', 'Small Premade Box']
+    assert priced['subtotal'] == 31.87
+    assert priced['discount'] == 0
+    assert priced['deliveryFee'] == 0
+    assert priced['total'] == 31.87
+    # Every line is resolved with one polymorphic query
+    assert query_counter.count == 1
+
+def test_price_cart_corporate_customer_delivery(seed_data, cart_lines):
+    priced = price_cart(seed_data['corporate'], cart_lines, 'Delivery')
+
+    assert priced['discount'] == pytest.approx(3.19)
+    assert priced['deliveryFee'] == 10.00
+    assert priced['total'] == pytest.approx(round(31.87 * 0.9 + 10.00, 2))
+
+def test_price_cart_ignores_saved_prices(seed_data, cart_line):
+    """Test the subtotal saved in the cart is replaced with the current price"""
+    kumara = seed_data['veggies'][0]
+    priced = price_cart(seed_data['customer'], [cart_line(kumara, 'weighted', 1, subtotal=0.01)])
+
+    assert priced['lines'][0]['subtotal'] == 3.99
+    assert priced['total'] == 3.99
+
+def test_price_empty_cart(seed_data, query_counter):
+    query_counter.reset()
+    assert price_cart(seed_data['customer'], [])['total'] == 0
+    assert query_counter.count == 0
+
+def test_resolve_cart_items_rejects_wrong_type(seed_data, cart_line):
+    """Test a cart line must match the type of the item it refers to"""
+    kumara = seed_data['veggies'][0]
+
+    with pytest.raises(ValueError, match="Invalid item in cart"):
+        resolve_cart_items([cart_line(kumara, 'pack', 1)])
+    with pytest.raises(ValueError, match="Invalid item in cart"):
+        resolve_cart_items([{'id': 9999, 'type': 'weighted', 'quantity': 1}])
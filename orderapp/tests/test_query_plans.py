@@ -0,0 +1,89 @@
+import re
+import pytest
+from datetime import date, timedelta
+from sqlalchemy import event
+from orderapp.models.item import PremadeBox
+from orderapp.models.order import Order
+from orderapp.models.report import ItemDailySales
+
+# A table read in full. SQLite reports index scans as "SCAN table USING INDEX ...",
+# and scans of subquery results (anon_N) are not table scans
+FULL_SCAN = re.compile(r'^SCAN (?!anon_)(\w+)$')
+
+@pytest.fixture(scope='function')
+def order_history(seed_data, place_order):
+    """Paid orders of both customers over a few weeks, and a customized box"""
+    customers = [seed_data['customer'], seed_data['corporate']]
+    items = seed_data['veggies'][:3] + seed_data['boxes'][:1]
+    for number in range(20):
+        place_order(customers[number % 2], [(items[number % len(items)], 1)],
+                    orderDate=date.today() - timedelta(days=number))
+    seed_data['boxes'][0].create_custom_box([seed_data['veggies'][0].id], seed_data['customer'].id)
+    return seed_data
+
+@pytest.fixture(scope='function')
+def query_plans(sqlite_engine):
+    """Run a function and return the EXPLAIN QUERY PLAN lines of each SELECT it executed"""
+    def explain(function, *args):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT'):
+                statements.append((statement, parameters))
+
+        event.listen(sqlite_engine, 'before_cursor_execute', record)
+        try:
+            function(*args)
+        finally:
+            event.remove(sqlite_engine, 'before_cursor_execute', record)
+
+        with sqlite_engine.connect() as conn:
+            return [[row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+                    for statement, parameters in statements]
+    return explain
+
+def _full_scans(plans):
+    return [line for plan in plans for line in plan if FULL_SCAN.match(line)]
+
+def _uses_index(plans, index):
+    return any(index in line for plan in plans for line in plan)
+
+def test_order_history_plan(order_history, query_plans):
+    plans = query_plans(order_history['customer'].view_order_history)
+    assert _full_scans(plans) == []
+    assert _uses_index(plans, 'ix_orders_customer_date')
+
+def test_payment_history_plan(order_history, query_plans, sqlite_session):
+    customer = order_history['customer']
+    sqlite_session.expire(customer, ['payments'])
+    plans = query_plans(lambda: customer.payments)
+    assert _full_scans(plans) == []
+    assert _uses_index(plans, 'ix_payments_customer')
+
+def test_order_lines_plan(order_history, query_plans, sqlite_session):
+    order = sqlite_session.query(Order).first()
+    plans = query_plans(lambda: order.order_lines)
+    assert _full_scans(plans) == []
+    assert _uses_index(plans, 'ix_order_lines_order')
+
+def test_box_contents_plan(order_history, query_plans):
+    box = order_history['boxes'][0]
+    plans = query_plans(box.get_contents) + query_plans(PremadeBox.get_contents_for_boxes, [box.id])
+    assert _full_scans(plans) == []
+    assert _uses_index(plans, 'ix_box_contents_box')
+
+def test_premade_boxes_plan(order_history, query_plans):
+    plans = query_plans(order_history['customer'].view_premade_boxes)
+    assert _full_scans(plans) == []
+    assert _uses_index(plans, 'ix_premade_boxes_custom')
+
+def test_popular_items_plan(order_history, query_plans):
+    staff = order_history['staff']
+    plans = query_plans(staff.get_popular_items) + query_plans(staff.get_unpopular_items)
+    assert _full_scans(plans) == []
+    assert _uses_index(plans, 'ix_item_sales_order_count')
+
+def test_popularity_window_plan(order_history, query_plans):
+    """Test a window reads a range of the daily counters"""
+    plans = query_plans(ItemDailySales.most_popular, 7)
+    assert _full_scans(plans) == []
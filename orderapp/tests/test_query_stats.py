@@ -0,0 +1,29 @@
+from orderapp import app
+from orderapp.query_stats import RouteQueryStats, route_query_stats
+
+def test_route_query_stats():
+    stats = RouteQueryStats()
+    stats.record('view_cart', 4)
+    stats.record('view_cart', 6)
+    stats.record('profile', 1)
+
+    assert stats.stats() == {
+        'profile': {'requests': 1, 'queries': 1, 'average': 1.0, 'max': 1},
+        'view_cart': {'requests': 2, 'queries': 10, 'average': 5.0, 'max': 6},
+    }
+
+def test_requests_record_their_queries(seed_data):
+    """Test a request's statements are counted against its route"""
+    customer_id = seed_data['customer'].id
+    route_query_stats.clear()
+    client = app.test_client()
+    with client.session_transaction() as client_session:
+        client_session.update({'loggedin': True, 'id': customer_id, 'role': 'private_customer'})
+
+    client.get('/profile')
+    client.get('/logout')
+
+    stats = route_query_stats.stats()
+    assert stats['profile']['requests'] == 1
+    assert stats['profile']['queries'] >= 1
+    assert stats['logout']['queries'] == 0
@@ -0,0 +1,60 @@
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from orderapp import app, reaper
+from orderapp.models.order import Order, OrderLine
+from orderapp.reaper import reap_unpaid_orders
+
+@pytest.fixture(scope='function')
+def orders(seed_data, place_order):
+    """Ids of old unpaid orders, a recent unpaid order and an old paid order"""
+    customer = seed_data['customer']
+    box = seed_data['boxes'][0]
+    old = datetime.now() - timedelta(hours=3)
+    return {
+        'abandoned': [place_order(customer, [(box, 1)], paid=False, createdAt=old - timedelta(minutes=minutes)).id
+                      for minutes in range(5)],
+        'recent': place_order(customer, [(box, 1)], paid=False, createdAt=datetime.now() - timedelta(minutes=5)).id,
+        'paid': place_order(customer, [(box, 1)], createdAt=old).id,
+    }
+
+def test_reap_unpaid_orders_in_batches(orders, sqlite_session, query_counter):
+    query_counter.reset()
+    assert reap_unpaid_orders(grace=3600, batch_size=2) == 5
+
+    remaining = {order.id for order in sqlite_session.query(Order)}
+    assert remaining == {orders['recent'], orders['paid']}
+    assert {line.order_id for line in sqlite_session.query(OrderLine)} == remaining
+    # Three batches of a select and two deletes
+    assert sum(statement.startswith('DELETE') for statement in query_counter.statements) == 6
+
+def test_reap_keeps_orders_in_grace_period(orders, sqlite_session):
+    assert reap_unpaid_orders(grace=4 * 3600) == 0
+    assert sqlite_session.query(Order).count() == 7
+
+    assert reap_unpaid_orders(grace=60) == 6
+    assert [order.id for order in sqlite_session.query(Order)] == [orders['paid']]
+
+def test_view_order_history_is_a_read(seed_data, orders, query_counter):
+    """Test the history only lists paid orders and leaves unpaid ones in place"""
+    query_counter.reset()
+    history = seed_data['customer'].view_order_history()
+
+    assert [entry['order'].id for entry in history] == [orders['paid']]
+    assert all(statement.startswith('SELECT') for statement in query_counter.statements)
+
+def test_reaper_starts_with_first_request(monkeypatch):
+    """Test each process starts one reaper, from the first request it serves"""
+    monkeypatch.setattr(reaper, '_reaper', None)
+    client = app.test_client()
+    with patch('orderapp.reaper.UnpaidOrderReaper') as mock_reaper:
+        # Not configured, so only the reap-unpaid-orders command reaps
+        client.get('/login')
+        mock_reaper.assert_not_called()
+
+        monkeypatch.setitem(app.config, 'UNPAID_ORDER_REAP_INTERVAL', 60)
+        client.get('/login')
+        client.get('/login')
+
+    mock_reaper.assert_called_once_with(60)
+    mock_reaper.return_value.start.assert_called_once()
@@ -0,0 +1,211 @@
+import pytest
+from datetime import date, timedelta
+from unittest.mock import patch
+from orderapp import app, db
+from orderapp.models.report import ItemDailySales, ItemSales, SalesRollup
+
+@pytest.fixture(scope='function')
+def paid_orders(seed_data, place_order):
+    """Paid orders across a few weeks, months and years"""
+    customer = seed_data['customer']
+    corporate = seed_data['corporate']
+    box = seed_data['boxes'][0]
+    this_year = date.today().year
+    return [
+        place_order(customer, [(box, 1)], orderDate=date(this_year, 1, 1)),
+        place_order(customer, [(box, 2)], deliveryMethod='Delivery', orderDate=date(this_year, 1, 3)),
+        place_order(corporate, [(box, 1)], orderDate=date(this_year, 1, 8)),
+        place_order(corporate, [(box, 3)], deliveryMethod='Delivery',
+                    orderDate=date(this_year, 2, 29 if this_year % 4 == 0 else 28)),
+        place_order(customer, [(box, 1)], orderDate=date(this_year - 1, 12, 31)),
+    ]
+
+def test_payment_updates_rollups(paid_orders):
+    this_year = date.today().year
+    last_day_of_february = 29 if this_year % 4 == 0 else 28
+    february_week = (last_day_of_february - 1) // 7 + 1
+
+    assert SalesRollup.weekly_sales() == pytest.approx({
+        f"week5/12/{this_year - 1}": 10.0,
+        f"week1/01/{this_year}": 10.0 + 30.0,
+        f"week2/01/{this_year}": 9.0,
+        f"week{february_week}/02/{this_year}": 37.0,
+    })
+    assert list(SalesRollup.weekly_sales())[0] == f"week5/12/{this_year - 1}"
+    assert SalesRollup.monthly_sales() == pytest.approx({
+        f"01/{this_year}": 49.0,
+        f"02/{this_year}": 37.0,
+    })
+    assert SalesRollup.yearly_sales() == pytest.approx({str(this_year): 86.0})
+    assert SalesRollup.yearly_sales(this_year - 1) == pytest.approx({str(this_year - 1): 10.0})
+
+def test_payment_stores_order_totals(paid_orders):
+    corporate_delivery = paid_orders[3]
+
+    assert corporate_delivery.totalAmount == pytest.approx(37.0)
+    assert corporate_delivery.discountAmount == pytest.approx(3.0)
+    assert corporate_delivery.deliveryFee == 10.00
+    assert all(order.verify_total() for order in paid_orders)
+
+def test_cancelled_order_is_taken_out_of_rollups(paid_orders, seed_data):
+    this_year = date.today().year
+    customer = seed_data['customer']
+
+    assert customer.cancel_order(paid_orders[1].id) is True
+
+    assert SalesRollup.weekly_sales()[f"week1/01/{this_year}"] == pytest.approx(10.0)
+    assert SalesRollup.monthly_sales()[f"01/{this_year}"] == pytest.approx(19.0)
+    assert SalesRollup.yearly_sales() == pytest.approx({str(this_year): 56.0})
+
+def test_staff_cancel_and_restore_updates_rollups(paid_orders, seed_data):
+    this_year = date.today().year
+    staff = seed_data['staff']
+
+    staff.update_order_status(paid_orders[0].id, 'Cancelled')
+    assert SalesRollup.yearly_sales() == pytest.approx({str(this_year): 76.0})
+
+    # Changing to another cancelled status doesn't count twice
+    staff.update_order_status(paid_orders[0].id, 'Cancelled')
+    assert SalesRollup.yearly_sales() == pytest.approx({str(this_year): 76.0})
+
+    staff.update_order_status(paid_orders[0].id, 'Completed')
+    assert SalesRollup.yearly_sales() == pytest.approx({str(this_year): 86.0})
+
+def test_rollups_skip_empty_periods(paid_orders, seed_data):
+    """Test a period whose only order was cancelled is not reported"""
+    this_year = date.today().year
+    seed_data['staff'].update_order_status(paid_orders[2].id, 'Cancelled')
+
+    assert f"week2/01/{this_year}" not in SalesRollup.weekly_sales()
+
+def test_yearly_sales_without_orders(sqlite_session):
+    this_year = date.today().year
+    assert SalesRollup.yearly_sales() == {str(this_year): 0}
+    assert SalesRollup.weekly_sales() == {}
+
+def test_rebuild_matches_incremental_rollups(paid_orders, seed_data, place_order):
+    seed_data['customer'].cancel_order(paid_orders[1].id)
+    # An unpaid order is not counted
+    place_order(seed_data['customer'], [], paid=False, deliveryMethod='Delivery', paymentMethod='Account')
+
+    weekly, monthly, yearly = SalesRollup.weekly_sales(), SalesRollup.monthly_sales(), SalesRollup.yearly_sales()
+
+    assert SalesRollup.rebuild() == 4
+    assert SalesRollup.weekly_sales() == pytest.approx(weekly)
+    assert SalesRollup.monthly_sales() == pytest.approx(monthly)
+    assert SalesRollup.yearly_sales() == pytest.approx(yearly)
+
+def test_record_order_without_upsert_support(mock_order_for_rollup):
+    """Test other databases fall back to an update, then an insert for new rows"""
+    with patch('orderapp.db.session') as mock_session:
+        mock_session.get_bind.return_value.dialect.name = 'postgresql'
+        mock_session.execute.return_value.rowcount = 0
+
+        SalesRollup.record_order(mock_order_for_rollup)
+
+        # An update and an insert for each of the week, month and year
+        assert mock_session.execute.call_count == 6
+
+def _box_sales(box):
+    counters = db.session.get(ItemSales, box.id)
+    return counters.orderCount, counters.unitsSold, counters.revenue
+
+def test_payment_updates_item_sales(paid_orders, seed_data):
+    box = seed_data['boxes'][0]
+    assert _box_sales(box) == (5, 8, pytest.approx(80.0))
+    # Every other item has empty counters
+    assert ItemSales.query.filter(ItemSales.orderCount == 0).count() == len(seed_data['veggies']) + 2
+
+def test_cancel_and_restore_updates_item_sales(paid_orders, seed_data):
+    box = seed_data['boxes'][0]
+
+    seed_data['customer'].cancel_order(paid_orders[1].id)
+    assert _box_sales(box) == (4, 6, pytest.approx(60.0))
+
+    seed_data['staff'].update_order_status(paid_orders[0].id, 'Cancelled')
+    assert _box_sales(box) == (3, 5, pytest.approx(50.0))
+
+    seed_data['staff'].update_order_status(paid_orders[0].id, 'Completed')
+    assert _box_sales(box) == (4, 6, pytest.approx(60.0))
+
+def test_rebuild_matches_incremental_item_sales(paid_orders, seed_data, place_order):
+    seed_data['customer'].cancel_order(paid_orders[1].id)
+    # An unpaid order is not counted
+    place_order(seed_data['customer'], [(seed_data['veggies'][0], 1)], paid=False, paymentMethod='Account')
+
+    counters = {row.item_id: (row.orderCount, row.unitsSold, row.revenue) for row in ItemSales.query}
+
+    assert ItemSales.rebuild() == len(counters)
+    assert {row.item_id: (row.orderCount, row.unitsSold, row.revenue) for row in ItemSales.query} == counters
+
+@pytest.fixture(scope='function')
+def mock_order_for_rollup():
+    class MockOrder:
+        orderDate = date(2024, 5, 7)
+        total = 30.0
+    return MockOrder()
+
+@pytest.fixture(scope='function')
+def recent_orders(seed_data, place_order):
+    """Paid orders 2, 20, 60 and 120 days ago, with different items and quantities"""
+    customer = seed_data['customer']
+    kumara, feijoa, box = seed_data['veggies'][0], seed_data['veggies'][4], seed_data['boxes'][2]
+    today = date.today()
+    return [
+        place_order(customer, [(feijoa, 20)], orderDate=today - timedelta(days=2)),
+        place_order(customer, [(kumara, 1)], orderDate=today - timedelta(days=2)),
+        place_order(customer, [(kumara, 2)], orderDate=today - timedelta(days=20)),
+        place_order(customer, [(box, 1)], orderDate=today - timedelta(days=60)),
+        place_order(customer, [(box, 1)], orderDate=today - timedelta(days=120)),
+    ]
+
+def _names(rows):
+    return [row.item.vegName if hasattr(row.item, 'vegName') else row.item.boxSize for row in rows]
+
+def test_popularity_windows(recent_orders, query_counter):
+    query_counter.reset()
+    assert _names(ItemDailySales.most_popular(7)) == ['Feijoa', 'Kumara']
+    assert query_counter.count == 1
+
+    assert _names(ItemDailySales.most_popular(30)) == ['Kumara', 'Feijoa']
+    assert _names(ItemDailySales.most_popular(90)) == ['Kumara', 'Large', 'Feijoa']
+
+def test_popularity_metrics(recent_orders):
+    # In the last 90 days Feijoa sold 20 units for 19.80, Kumara 3 units for 11.97 and the Large box one for more
+    assert _names(ItemDailySales.most_popular(90, metric='units')) == ['Feijoa', 'Kumara', 'Large']
+    assert _names(ItemDailySales.most_popular(90, metric='revenue')) == ['Large', 'Feijoa', 'Kumara']
+    kumara = ItemDailySales.most_popular(30)[0]
+    assert (kumara.orderCount, kumara.unitsSold, kumara.revenue) == (2, 3, pytest.approx(11.97))
+
+    with pytest.raises(ValueError, match="Invalid popularity metric"):
+        ItemDailySales.most_popular(30, metric='stock')
+
+def test_least_popular_window_includes_items_not_sold(recent_orders, seed_data):
+    least = ItemDailySales.least_popular(7, limit=20)
+    assert len(least) == len(seed_data['veggies']) + len(seed_data['boxes'])
+    assert _names(least)[-2:] == ['Kumara', 'Feijoa']
+    assert all(row.orderCount == 0 for row in least[:-2])
+
+def test_cancelled_order_is_taken_out_of_window(recent_orders, seed_data):
+    assert seed_data['customer'].cancel_order(recent_orders[0].id) is True
+    assert _names(ItemDailySales.most_popular(7)) == ['Kumara']
+
+def test_rebuild_matches_incremental_daily_sales(recent_orders, sqlite_session):
+    counters = {(row.day, row.item_id): (row.orderCount, row.unitsSold, row.revenue)
+                for row in sqlite_session.query(ItemDailySales)}
+
+    assert ItemDailySales.rebuild() == len(counters) == 5
+    assert {(row.day, row.item_id): (row.orderCount, row.unitsSold, row.revenue)
+            for row in sqlite_session.query(ItemDailySales)} == counters
+
+def test_popularity_page_window(recent_orders, seed_data, sqlite_session):
+    staff_id = seed_data['staff'].id
+    sqlite_session.expunge_all()
+    client = app.test_client()
+    with client.session_transaction() as client_session:
+        client_session.update({'loggedin': True, 'id': staff_id, 'role': 'staff'})
+
+    page = client.get('/popularity?days=7&metric=units').get_data(as_text=True)
+    assert '<option value="7" selected>Last 7 Days</option>' in page
+    assert 'Feijoa - 1 orders, 20 units, $19.80' in page
+    assert 'Pumpkin - 0 orders, 0 units, $0.00' in page
@@ -0,0 +1,124 @@
+import time
+import pytest
+from unittest.mock import PropertyMock, patch
+from flask import g, session
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+from orderapp import app, db
+from orderapp.decorators import readFromReplica
+from orderapp.models.user import Customer
+from orderapp.routing import RoutingSession
+from orderapp.versions import content_versions
+
+def _create_database(path, lastname):
+    """SQLite file with one customer, whose last name tells the databases apart"""
+    engine = create_engine(f"sqlite:///{path}")
+    db.metadata.create_all(engine)
+    with Session(engine) as setup:
+        setup.add(Customer(firstname='Ying', lastname=lastname, username='ying', password='123',
+                           address='23 Kingsland Road, Auckland', balance=0.0, maxOwing=100.0))
+        setup.commit()
+    return engine
+
+class Statements:
+    """Statements sent to each engine, by name"""
+    def __init__(self, engines):
+        self.by_engine = {name: [] for name in engines}
+        for name, engine in engines.items():
+            event.listen(engine, 'before_cursor_execute', self._listener(name))
+
+    def _listener(self, name):
+        def record(conn, cursor, statement, parameters, context, executemany):
+            self.by_engine[name].append(statement)
+        return record
+
+@pytest.fixture(scope='function')
+def engines(tmp_path):
+    """Two SQLite files standing in for the primary and the read replica"""
+    engines = {
+        'primary': _create_database(tmp_path / 'primary.db', 'Primary'),
+        'replica': _create_database(tmp_path / 'replica.db', 'Replica'),
+    }
+    yield engines
+    for engine in engines.values():
+        engine.dispose()
+
+def _routing_session(bound_engines):
+    session_ = scoped_session(sessionmaker(class_=RoutingSession, db=db))
+    return session_, patch.object(SQLAlchemy, 'engines', new_callable=PropertyMock, return_value=bound_engines)
+
+@pytest.fixture(scope='function')
+def routing_session(engines):
+    """Routing session standing in for db.session, with the primary and replica binds"""
+    session_, patched_engines = _routing_session({None: engines['primary'], 'replica': engines['replica']})
+    with patched_engines, patch('orderapp.db.session', session_):
+        yield session_
+    session_.remove()
+
+def _lastname(session_):
+    return session_.execute(text('select lastname from users')).scalar_one()
+
+def test_reads_go_to_primary_by_default(routing_session):
+    with app.test_request_context():
+        assert _lastname(routing_session) == 'Primary'
+
+def test_replica_reads(routing_session):
+    with app.test_request_context():
+        g.read_replica = True
+        assert _lastname(routing_session) == 'Replica'
+        assert routing_session.query(Customer).one().lastname == 'Replica'
+
+def test_content_versions_read_from_primary(routing_session, engines):
+    """Test a replica view reads the content versions from the primary, where they are moved on"""
+    content_versions.bump(routing_session, ['catalog'])
+    with app.test_request_context():
+        g.read_replica = True
+        assert content_versions.get('catalog') == 1
+        assert _lastname(routing_session) == 'Replica'
+
+def test_writes_go_to_primary_and_stay_there(routing_session, engines):
+    """Test a write in a replica view goes to the primary, and the view then reads its own write"""
+    with app.test_request_context():
+        g.read_replica = True
+        customer = routing_session.query(Customer).one()
+        customer.firstname = 'Harry'
+        routing_session.flush()
+
+        assert _lastname(routing_session) == 'Primary'
+        assert session['read_primary_until'] > time.time()
+        routing_session.commit()
+
+    with Session(engines['primary']) as primary, Session(engines['replica']) as replica:
+        assert primary.query(Customer).one().firstname == 'Harry'
+        assert replica.query(Customer).one().firstname == 'Ying'
+
+def test_recent_writer_reads_from_primary(routing_session):
+    view = readFromReplica(lambda: _lastname(routing_session))
+    with app.test_request_context():
+        assert view() == 'Replica'
+    with app.test_request_context():
+        session['read_primary_until'] = time.time() + 5
+        assert view() == 'Primary'
+
+def test_without_replica_bind(engines):
+    session_, patched_engines = _routing_session({None: engines['primary']})
+    with patched_engines, app.test_request_context():
+        g.read_replica = True
+        assert _lastname(session_) == 'Primary'
+    session_.remove()
+
+def test_replica_route(routing_session, engines):
+    """Test the current user is loaded from the primary and the view's queries go to the replica"""
+    statements = Statements(engines)
+    customer_id = routing_session.query(Customer).one().id
+    routing_session.remove()
+    statements.by_engine['primary'].clear()
+
+    client = app.test_client()
+    with client.session_transaction() as client_session:
+        client_session.update({'loggedin': True, 'id': customer_id, 'role': 'private_customer'})
+
+    assert client.get('/payment_history').status_code == 200
+    assert len(statements.by_engine['primary']) == 1
+    assert any('payments' in statement for statement in statements.by_engine['replica'])
@@ -0,0 +1,53 @@
+import pytest
+from orderapp.models.sequence import BlockAllocator, IdSequence
+from orderapp.models.order import Order, order_numbers, _first_order_number
+
+def test_allocate_numbers_in_blocks(sqlite_session, query_counter):
+    allocator = BlockAllocator('test', block_size=5, seed=lambda conn: 1000)
+
+    numbers = [allocator.allocate() for _ in range(7)]
+
+    assert numbers == [1000, 1001, 1002, 1003, 1004, 1005, 1006]
+    # One round trip to create the sequence, and one more for the second block
+    writes = [s for s in query_counter.statements if s.startswith(('INSERT', 'UPDATE'))]
+    assert len(writes) == 3
+    assert sqlite_session.get(IdSequence, 'test').nextValue == 1010
+
+def test_allocators_in_different_processes_never_collide(sqlite_session):
+    """Test two allocators on the same sequence hand out disjoint numbers"""
+    first = BlockAllocator('test', block_size=3, seed=lambda conn: 1)
+    second = BlockAllocator('test', block_size=3, seed=lambda conn: 1)
+
+    numbers = []
+    for _ in range(5):
+        numbers.append(first.allocate())
+        numbers.append(second.allocate())
+
+    assert len(set(numbers)) == 10
+    # Each allocator takes its own block of three
+    assert sorted(numbers) == [1, 2, 3, 4, 5, 6, 7, 8, 10, 11]
+
+def test_first_order_number_compares_numbers_not_strings(seed_data, sqlite_session):
+    """Test the sequence starts after 10000, not after the lexicographically largest 9999"""
+    for number in ['9999', '10000', '999']:
+        sqlite_session.add(Order(orderNumber=number, customer=seed_data['customer'],
+                                 deliveryMethod='Pickup', paymentMethod='Account'))
+    sqlite_session.commit()
+
+    with sqlite_session.get_bind().connect() as conn:
+        assert _first_order_number(conn) == 10001
+
+def test_first_order_number_without_orders(sqlite_session):
+    with sqlite_session.get_bind().connect() as conn:
+        assert _first_order_number(conn) == 1000
+
+def test_place_order_uses_allocated_numbers(seed_data, sqlite_session, monkeypatch):
+    monkeypatch.setattr(order_numbers, '_next', 0)
+    monkeypatch.setattr(order_numbers, '_limit', 0)
+    customer = seed_data['customer']
+
+    first = customer.place_order('Pickup', 'Account')
+    second = customer.place_order('Delivery', 'Account')
+
+    assert first.orderNumber == '1000'
+    assert second.orderNumber == '1001'
@@ -184,11 +184,12 @@ def test_customer_view_premade_boxes(test_customer, mock_premade_boxes):
     
     assert boxes == [mock_premade_boxes]
 
+@patch('orderapp.models.user.order_numbers')
 @patch('orderapp.models.user.Order')
-def test_customer_place_order(mock_order, test_customer, mock_db_session):
+def test_customer_place_order(mock_order, mock_order_numbers, test_customer, mock_db_session):
     """Test the place_order method in Customer class"""
-    # Mock the scalar call for max order number
-    mock_db_session.query.return_value.scalar.return_value = 999
+    # Mock the allocator for the next order number
+    mock_order_numbers.allocate.return_value = 1000
 
     # Create a mock order instance
     mock_order_instance = Mock()
@@ -346,8 +347,8 @@ def test_staff_list_of_customers(test_staff, mock_db_session):
 def test_staff_list_of_orders(test_staff, mock_db_session):
     # Create mock orders
     mock_orders = [
-        Mock(id=1, orderDate=date(2024, 1, 1), calculate_total=lambda: 100.0),
-        Mock(id=2, orderDate=date(2024, 1, 2), calculate_total=lambda: 150.0)
+        Mock(id=1, orderDate=date(2024, 1, 1), total=100.0),
+        Mock(id=2, orderDate=date(2024, 1, 2), total=150.0)
     ]
     
     # Set up the mock query
@@ -361,6 +362,65 @@ def test_staff_list_of_orders(test_staff, mock_db_session):
     assert orders[1]['total'] == 150.0
     assert mock_db_session.query.called
 
+@pytest.fixture(scope='function')
+def many_orders(seed_data, sqlite_session):
+    """25 orders over 5 days, several orders on each day"""
+    from orderapp.models.order import Order
+    customers = [seed_data['customer'], seed_data['corporate']]
+    orders = []
+    for number in range(25):
+        order = Order(orderNumber=str(3000 + number), customer=customers[number % 2],
+                      deliveryMethod='Delivery' if number % 3 == 0 else 'Pickup', paymentMethod='Account',
+                      orderStatus='Completed' if number % 3 == 1 else 'Pending',
+                      orderDate=date(2024, 6, 1 + number % 5))
+        sqlite_session.add(order)
+        orders.append(order)
+    sqlite_session.commit()
+    return orders
+
+def test_staff_list_orders_pages(seed_data, many_orders, query_counter):
+    """Test paging through every order newest first, with the same number of queries for every page"""
+    staff = seed_data['staff']
+    expected = sorted(many_orders, key=lambda order: (order.orderDate, order.id), reverse=True)
+
+    listed, cursor, pages = [], None, 0
+    query_counter.reset()
+    while True:
+        page = staff.list_orders(after=cursor, limit=10)
+        listed.extend(item['order'] for item in page['orders'])
+        pages += 1
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    assert [order.id for order in listed] == [order.id for order in expected]
+    assert pages == 3
+    # One query for the orders and customers, one for the lines of unpaid orders
+    assert query_counter.count == 2 * pages
+
+def test_staff_list_orders_last_page_is_full(seed_data, many_orders):
+    """Test there is no next page when the last page is exactly full"""
+    page = seed_data['staff'].list_orders(limit=25)
+    assert len(page['orders']) == 25
+    assert page['next_cursor'] is None
+
+def test_staff_list_orders_filters(seed_data, many_orders):
+    staff = seed_data['staff']
+    corporate = seed_data['corporate']
+
+    page = staff.list_orders(status='Completed', delivery_method='Pickup', customer_id=corporate.id,
+                             start_date=date(2024, 6, 2), end_date=date(2024, 6, 4))
+
+    expected = {order.id for order in many_orders
+                if order.orderStatus == 'Completed' and order.deliveryMethod == 'Pickup'
+                and order.customer_id == corporate.id and date(2024, 6, 2) <= order.orderDate <= date(2024, 6, 4)}
+    assert {item['order'].id for item in page['orders']} == expected
+    assert expected
+
+def test_staff_list_orders_invalid_cursor(seed_data):
+    with pytest.raises(ValueError, match="Invalid page cursor"):
+        seed_data['staff'].list_orders(after='yesterday')
+
 def test_staff_veggies(test_staff, mock_db_session):
     """Test the veggies property"""
     # Create mock veggies
@@ -408,58 +468,224 @@ def test_staff_update_order_status(mock_order, test_staff, mock_db_session):
     assert mock_order_instance.orderStatus == 'Completed'
     assert mock_db_session.commit.called
 
-def test_staff_get_weekly_sales(test_staff):
-    with patch('orderapp.models.user.Order') as mock_order:
-        # Mock some orders with different dates
-        mock_order.query.all.return_value = [
-            Mock(orderDate=date(2024, 1, 1), calculate_total=lambda: 100),
-            Mock(orderDate=date(2024, 1, 8), calculate_total=lambda: 200)
-        ]
-        
-        weekly_sales = test_staff.get_weekly_sales()
-        assert len(weekly_sales) > 0
-        assert isinstance(weekly_sales, dict)
-
-def test_staff_get_popular_items(test_staff, mock_db_session):
-    """Test the get_popular_items method"""
-    # Create mock items with order counts
-    mock_items = [
-        (Mock(id=1, vegName='Carrot'), 10),
-        (Mock(id=2, vegName='Potato'), 8),
-        (Mock(id=3, vegName='Tomato'), 5)
+@pytest.fixture(scope='function')
+def sales_history(seed_data, place_order):
+    """Orders of every kind across several weeks, months and years"""
+    this_year = date.today().year
+    customer, corporate = seed_data['customer'], seed_data['corporate']
+    kumara, box = seed_data['veggies'][0], seed_data['boxes'][1]
+    history = [
+        (customer, 'Delivery', date(this_year, 1, 1), [(kumara, 1.5), (box, 1)]),
+        (customer, 'Pickup', date(this_year, 1, 7), [(kumara, 2)]),
+        (corporate, 'Delivery', date(this_year, 1, 8), [(box, 2)]),
+        (corporate, 'Pickup', date(this_year, 3, 31), [(kumara, 3), (box, 1)]),
+        (customer, 'Delivery', date(this_year, 3, 29), []),
+        (customer, 'Pickup', date(this_year - 1, 12, 30), [(box, 4)]),
+        (corporate, 'Delivery', date(this_year - 2, 6, 15), [(kumara, 0.5)]),
     ]
-    
-    # Set up the mock query
-    mock_db_session.query.return_value.join.return_value.group_by.return_value\
-        .order_by.return_value.limit.return_value.all.return_value = mock_items
-    
-    # Get popular items
-    popular_items = test_staff.get_popular_items()
-    
-    assert len(popular_items) == 3
-    assert popular_items[0]['order_count'] == 10
-    assert popular_items[1]['order_count'] == 8
-    assert popular_items[2]['order_count'] == 5
-
-def test_staff_get_unpopular_items(test_staff, mock_db_session):
-    """Test the get_unpopular_items method"""
-    # Create mock items with order counts
-    mock_items = [
-        (Mock(id=1, vegName='Carrot'), 0),
-        (Mock(id=2, vegName='Potato'), 1),
-        (Mock(id=3, vegName='Tomato'), 2)
+    return [place_order(who, lines, paid=False, deliveryMethod=delivery_method, paymentMethod='Account',
+                        orderDate=order_date)
+            for who, delivery_method, order_date, lines in history]
+
+def _legacy_sales(orders, key):
+    """Sum calculate_total by key the way the report methods used to"""
+    from collections import defaultdict
+    sales = defaultdict(float)
+    for order in orders:
+        if key(order) is not None:
+            sales[key(order)] += order.calculate_total()
+    return dict(sales)
+
+def test_staff_get_weekly_sales(seed_data, sales_history, query_counter):
+    test_staff = seed_data['staff']
+    expected = _legacy_sales(sales_history, lambda o: 
+        f"week{(o.orderDate.day - 1) // 7 + 1}/{o.orderDate.month:02d}/{o.orderDate.year}")
+
+    query_counter.reset()
+    weekly_sales = test_staff.get_weekly_sales()
+
+    assert query_counter.count == 1
+    assert weekly_sales == pytest.approx(expected)
+    this_year = date.today().year
+    # Returned in date order without sorting the key strings
+    assert list(weekly_sales) == [
+        f"week3/06/{this_year - 2}", f"week5/12/{this_year - 1}", f"week1/01/{this_year}",
+        f"week2/01/{this_year}", f"week5/03/{this_year}",
     ]
-    
-    # Set up the mock query
-    mock_db_session.query.return_value.outerjoin.return_value.group_by.return_value\
-        .subquery.return_value = Mock()
-    mock_db_session.query.return_value.outerjoin.return_value.order_by.return_value\
-        .limit.return_value.all.return_value = mock_items
-    
-    # Get unpopular items
-    unpopular_items = test_staff.get_unpopular_items()
-    
-    assert len(unpopular_items) == 3
-    assert unpopular_items[0]['order_count'] == 0
-    assert unpopular_items[1]['order_count'] == 1
-    assert unpopular_items[2]['order_count'] == 2
+
+def test_staff_get_monthly_sales(seed_data, sales_history, query_counter):
+    test_staff = seed_data['staff']
+    this_year = date.today().year
+    expected = _legacy_sales(sales_history, lambda o: 
+        f"{o.orderDate.month:02d}/{this_year}" if o.orderDate.year == this_year else None)
+
+    query_counter.reset()
+    monthly_sales = test_staff.get_monthly_sales()
+
+    assert query_counter.count == 1
+    assert monthly_sales == pytest.approx(expected)
+    assert list(monthly_sales) == [f"01/{this_year}", f"03/{this_year}"]
+
+def test_staff_get_yearly_sales(seed_data, sales_history, query_counter):
+    test_staff = seed_data['staff']
+    this_year = date.today().year
+    expected = _legacy_sales(sales_history, lambda o: 
+        str(this_year) if o.orderDate.year == this_year else None)
+
+    query_counter.reset()
+    yearly_sales = test_staff.get_yearly_sales()
+
+    assert query_counter.count == 1
+    assert yearly_sales == pytest.approx(expected)
+
+def test_staff_sales_without_orders(seed_data):
+    test_staff = seed_data['staff']
+    this_year = date.today().year
+    assert test_staff.get_weekly_sales() == {}
+    assert test_staff.get_monthly_sales() == {}
+    assert test_staff.get_yearly_sales() == {str(this_year): 0}
+
+def test_staff_get_popular_items(seed_data, place_order, query_counter):
+    """Test the most popular items are read from the item sales counters"""
+    veggies, boxes = seed_data['veggies'], seed_data['boxes']
+    place_order(seed_data['customer'], [(veggies[0], 2), (boxes[0], 1)])
+    place_order(seed_data['corporate'], [(veggies[0], 1)])
+    place_order(seed_data['customer'], [(veggies[4], 10)])
+
+    query_counter.reset()
+    popular_items = seed_data['staff'].get_popular_items()
+
+    # Items in the same number of orders are listed newest first
+    assert [item['item_name'] for item in popular_items[:3]] == ['Kumara', 'Small Premade Box', 'Feijoa']
+    assert popular_items[0]['order_count'] == 2
+    assert popular_items[0]['units_sold'] == 3
+    assert popular_items[0]['revenue'] == pytest.approx(11.97)
+    # The counters, then their items by primary key
+    assert query_counter.count == 2
+
+def test_staff_get_unpopular_items(seed_data, place_order, query_counter):
+    """Test the least popular items include those never ordered"""
+    veggies = seed_data['veggies']
+    # Restock the cabbage so it can be ordered
+    veggies[3].stock = 10
+    for veggie in veggies[:4]:
+        place_order(seed_data['customer'], [(veggie, 1)])
+
+    query_counter.reset()
+    unpopular_items = seed_data['staff'].get_unpopular_items()
+
+    assert [item['item_name'] for item in unpopular_items] == \
+        ['Feijoa', 'Avocado', 'Small Premade Box', 'Medium Premade Box', 'Large Premade Box']
+    assert all(item['order_count'] == 0 for item in unpopular_items)
+    assert query_counter.count == 2
+
+def test_customer_view_veggies_single_query(seed_data, query_counter):
+    """Test the catalog is loaded in one query instead of one per veggie type"""
+    customer = seed_data['customer']
+
+    query_counter.reset()
+    expected = {
+        'weighted': customer.view_weighted_veggies(),
+        'pack': customer.view_pack_veggies(),
+        'unit_price': customer.view_unit_price_veggies()
+    }
+    assert query_counter.count >= 3
+
+    query_counter.reset()
+    veggies = customer.view_veggies()
+    assert query_counter.count == 1
+
+    assert veggies == expected
+    assert [v['vegName'] for v in veggies['weighted']] == ['Kumara', 'Pumpkin']
+    assert [v['vegName'] for v in veggies['pack']] == ['Celery']
+    assert [v['vegName'] for v in veggies['unit_price']] == ['Feijoa', 'Avocado']
+
+def test_customer_view_premade_boxes_query_count(seed_data, query_counter, sqlite_session):
+    """Test the number of queries stays flat as the number of boxes grows"""
+    from orderapp.models.item import PremadeBox
+    customer = seed_data['customer']
+
+    query_counter.reset()
+    boxes = customer.view_premade_boxes()
+    queries_for_three_boxes = query_counter.count
+
+    assert [box['contents'] for box in boxes][0] == ['Kumara', 'Pumpkin']
+
+    extra_boxes = [PremadeBox(boxSize='Small', numOfBoxes=1, stock=5) for _ in range(5)]
+    sqlite_session.add_all(extra_boxes)
+    for box in extra_boxes:
+        box.set_contents(seed_data['veggies'][:3])
+    sqlite_session.commit()
+
+    query_counter.reset()
+    boxes = customer.view_premade_boxes()
+
+    assert len(boxes) == 8
+    assert query_counter.count == queries_for_three_boxes == 2
+
+@pytest.fixture(scope='function')
+def commit_counter(sqlite_session):
+    """Count the commits made on the SQLite session"""
+    from sqlalchemy import event
+    commits = []
+    listener = lambda session: commits.append(session)
+    event.listen(sqlite_session(), 'after_commit', listener)
+    yield commits
+    event.remove(sqlite_session(), 'after_commit', listener)
+
+def test_customer_checkout_single_transaction(seed_data, sqlite_session, cart_line, query_counter, commit_counter):
+    """Test the order and all its lines are saved with one commit"""
+    from orderapp.models.order import Order
+    kumara, pumpkin, celery = seed_data['veggies'][:3]
+    feijoa = seed_data['veggies'][4]
+    box = seed_data['boxes'][1]
+    cart = [
+        cart_line(kumara, 'weighted', 1.5),
+        cart_line(pumpkin, 'weighted', 2),
+        cart_line(celery, 'pack', 1),
+        cart_line(feijoa, 'unit_price', 10),
+        cart_line(box, 'premade_box', 1),
+    ]
+    customer = seed_data['customer']
+    customer.id
+
+    with patch('orderapp.models.user.order_numbers') as mock_order_numbers:
+        mock_order_numbers.allocate.return_value = 1000
+        query_counter.reset()
+        order = customer.checkout('Pickup', 'Account', cart)
+
+    assert len(commit_counter) == 1
+    # One query to resolve the items, one insert for the order and one bulk insert for the lines,
+    # then the orders version is moved on after the commit
+    statements = [s for s in query_counter.statements if 'id_sequences' not in s]
+    assert len(statements) == 3
+    assert [s.split()[0] for s in statements] == ['SELECT', 'INSERT', 'INSERT']
+
+    order = sqlite_session.get(Order, order.id)
+    assert order.orderNumber == '1000'
+    assert [(line.item_id, line.quantity) for line in order.order_lines] == \
+        [(kumara.id, 1.5), (pumpkin.id, 2), (celery.id, 1), (feijoa.id, 10), (box.id, 1)]
+    assert order.order_lines[0].subtotal == pytest.approx(3.99 * 1.5)
+    assert order.order_lines[4].subtotal == 25.0
+
+def test_customer_checkout_rolls_back_on_failure(seed_data, sqlite_session, cart_line):
+    """Test no order is left behind when a cart line can't be ordered"""
+    from orderapp.models.order import Order, OrderLine
+    kumara, pumpkin = seed_data['veggies'][:2]
+    customer = seed_data['customer']
+
+    # Not enough stock
+    with pytest.raises(ValueError):
+        customer.checkout('Pickup', 'Account', [cart_line(kumara, 'weighted', 1),
+                                                cart_line(pumpkin, 'weighted', 500)])
+    # Item type doesn't match the item
+    with pytest.raises(ValueError):
+        customer.checkout('Pickup', 'Account', [cart_line(kumara, 'pack', 1)])
+    # Item doesn't exist
+    with pytest.raises(ValueError):
+        customer.checkout('Pickup', 'Account', [{'id': 999, 'type': 'weighted', 'quantity': 1}])
+    with pytest.raises(ValueError):
+        customer.checkout('Pickup', 'Account', [])
+
+    assert sqlite_session.query(Order).count() == 0
+    assert sqlite_session.query(OrderLine).count() == 0
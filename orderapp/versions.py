@@ -0,0 +1,73 @@
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from orderapp import db
+from orderapp.models.sequence import IdSequence
+
+class ContentVersions:
+    """
+    Named version counters for content that pages are cached by, such as 'catalog' and 'orders'.
+    The counters are kept in the id_sequences table so every process sees the same version.
+    A counter is moved on in a short transaction of its own, after the transaction that changed
+    its content commits. Pages read the version before the content, so a page is never tagged
+    with a version newer than what it shows.
+    """
+
+    def get(self, name):
+        """
+        Return the current version of the content, 0 if it has never changed.
+        The version is read from the primary, where it is moved on, since one read from a lagging
+        replica could tag or cache new content with an old version.
+        """
+        version = db.session.execute(
+            select(IdSequence.nextValue).where(IdSequence.name == self._key(name)),
+            bind_arguments={'primary': True}).scalar()
+        return version or 0
+
+    def bump(self, session, names, retry=True):
+        """
+        Move on the versions of the named contents.
+        """
+        sequences = IdSequence.__table__
+        keys = sorted(self._key(name) for name in names)
+        statement = update(sequences).where(sequences.c.name.in_(keys)).values(nextValue=sequences.c.nextValue + 1)
+        try:
+            # Writes always go to the primary, even from a view that reads from the replica
+            with session.get_bind(clause=statement).begin() as conn:
+                if conn.execute(statement).rowcount < len(keys):
+                    existing = set(conn.execute(select(sequences.c.name).where(sequences.c.name.in_(keys))).scalars())
+                    conn.execute(insert(sequences), [{'name': key, 'nextValue': 1}
+                                                     for key in keys if key not in existing])
+        except IntegrityError:
+            # Another process created the counter first, move on from its version instead
+            if retry:
+                return self.bump(session, names, retry=False)
+            raise
+
+    def _key(self, name):
+        return f"{name}_version"
+
+content_versions = ContentVersions()
+
+def mark_content_changed(session, name):
+    """
+    Flag the session so the named content's version is moved on when it commits.
+    Use this for changes made with plain SQL statements, which the flush hook can't see.
+    """
+    session.info.setdefault('changed_content', set()).add(name)
+
+@event.listens_for(Session, 'after_commit')
+def _bump_content_versions(session):
+    """
+    Move on the versions of the contents changed by the committed transaction.
+    """
+    names = session.info.pop('changed_content', None)
+    if names:
+        content_versions.bump(session, names)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_content_changes(session):
+    """
+    Forget the content changes when the transaction is rolled back.
+    """
+    session.info.pop('changed_content', None)
@@ -0,0 +1,368 @@
+from flask import g, jsonify, request, session
+from orderapp import app, db
+from orderapp.cache import catalog_cache
+from orderapp.conditional import catalog_etag, order_etag
+from orderapp.cart_store import discard_session_cart, load_session_cart, save_session_cart
+from orderapp.decorators import isApiAuthorized, readFromReplica, withCurrentUser, withETag
+from orderapp.models.item import CART_ITEM_TYPES, PremadeBox, box_contents
+from orderapp.models.order import Order
+from orderapp.models.report import POPULARITY_METRICS, SalesRollup
+from orderapp.models.user import Customer, Staff, User
+from orderapp.passwords import PasswordHashingBusy
+from orderapp.pricing import cart_item_name, price_cart, resolve_cart_items
+from orderapp.versions import content_versions
+from orderapp.views.main import start_user_session
+from datetime import date
+
+API_PREFIX = '/api/v1'
+
+# Request fields for each payment method, and the make_payment argument they are passed as
+PAYMENT_FIELDS = {
+    'Credit Card': {'card_type': 'cardType', 'card_number': 'cardNumber', 'card_expiry_date': 'cardExpiryDate'},
+    'Debit Card': {'bank_name': 'bankName', 'debit_card_number': 'debitCardNumber'},
+    'Account': {},
+}
+
+def api_error(message, status=400):
+    """Return a JSON error response."""
+    return jsonify({'error': message}), status
+
+def requested_fields():
+    """
+    Return the set of fields asked for with ?fields=a,b, or None for every field.
+    """
+    fields = request.args.get('fields')
+    return {field.strip() for field in fields.split(',') if field.strip()} if fields else None
+
+def select_fields(record, fields):
+    """Return the record with only the requested fields."""
+    if fields is None:
+        return record
+    return {key: value for key, value in record.items() if key in fields}
+
+def requested_page_size():
+    """
+    Return the page size asked for with ?limit=, capped at API_MAX_PAGE_SIZE.
+    """
+    limit = request.args.get('limit', type=int) or app.config['ORDERS_PAGE_SIZE']
+    return max(1, min(limit, app.config['API_MAX_PAGE_SIZE']))
+
+def order_summary(order, total):
+    """Summary of an order for the order lists."""
+    return {
+        'id': order.id,
+        'orderNumber': order.orderNumber,
+        'orderDate': order.orderDate,
+        'deliveryMethod': order.deliveryMethod,
+        'paymentMethod': order.paymentMethod,
+        'orderStatus': order.orderStatus,
+        'total': total,
+        'customer': {
+            'id': order.customer.id,
+            'type': order.customer.type,
+            'firstName': order.customer.firstname,
+            'lastName': order.customer.lastname,
+        },
+    }
+
+def item_popularity(entry):
+    """An item's popularity from Staff.get_popular_items, with the item replaced by its id."""
+    return {
+        'item_id': entry['item'].id,
+        'item_name': entry['item_name'],
+        'order_count': entry['order_count'],
+        'units_sold': entry['units_sold'],
+        'revenue': entry['revenue'],
+    }
+
+def priced_session_cart(customer):
+    """
+    Price the customer's cart, with the contents of the premade boxes in it.
+    """
+    priced_cart = price_cart(customer, load_session_cart().lines)
+
+    # Fetch box contents for all premade boxes in one query, served from the catalog cache
+    box_ids = tuple(sorted({line['id'] for line in priced_cart['lines'] if line['type'] == 'premade_box'}))
+    contents = catalog_cache.get_or_load(('box_contents', box_ids),
+                                         lambda: PremadeBox.get_contents_for_boxes(box_ids))
+    for line in priced_cart['lines']:
+        if line['type'] == 'premade_box':
+            line['contents'] = contents[line['id']]
+    return priced_cart
+
+
+@app.route(API_PREFIX + '/login', methods=['POST'])
+def api_login():
+    """Log in with a JSON username and password, the session cookie authenticates the next requests."""
+    try:
+        data = request.get_json(silent=True) or {}
+        user = User.query.filter_by(username=data.get('username')).first()
+
+        if user and user.check_password(data.get('password', '')):
+            # Save the new hash if the password was hashed again
+            db.session.commit()
+            start_user_session(user)
+            return jsonify({'id': user.id, 'username': user.username, 'role': user.type})
+        return api_error('Incorrect username or password', 401)
+
+    except PasswordHashingBusy as e:
+        return api_error(str(e), 503)
+
+    except Exception as e:
+        return api_error(str(e), 500)
+
+
+@app.route(API_PREFIX + '/catalog')
+@isApiAuthorized(allowed_roles=['private_customer', 'corporate_customer'])
+@withCurrentUser(Customer)
+@withETag(catalog_etag)
+def api_catalog():
+    """List the available veggies by type and the premade boxes, with optional field selection."""
+    try:
+        customer = g.user
+        fields = requested_fields()
+
+        # Read the shared catalog version the ETag is built from before the catalog, then load the
+        # catalog at that version, from the same catalog cache entries as the veggies page
+        catalog_version = content_versions.get('catalog')
+        veggies = catalog_cache.get_or_load(('veggies', catalog_version), customer.view_veggies)
+        premade_boxes = catalog_cache.get_or_load(('premade_boxes', catalog_version), customer.view_premade_boxes)
+        return jsonify({
+            'veggies': {veggie_type: [select_fields(veggie, fields) for veggie in type_veggies]
+                        for veggie_type, type_veggies in veggies.items()},
+            'premade_boxes': [select_fields(box, fields) for box in premade_boxes],
+        })
+
+    except Exception as e:
+        return api_error(str(e), 500)
+
+
+@app.route(API_PREFIX + '/cart')
+@isApiAuthorized(allowed_roles=['private_customer', 'corporate_customer'])
+@withCurrentUser(Customer)
+def api_cart():
+    """View the cart priced from the current item prices."""
+    try:
+        return jsonify(priced_session_cart(g.user))
+
+    except ValueError as e:
+        return api_error(str(e))
+    except Exception as e:
+        return api_error(str(e), 500)
+
+
+@app.route(API_PREFIX + '/cart', methods=['POST'])
+@isApiAuthorized(allowed_roles=['private_customer', 'corporate_customer'])
+@withCurrentUser(Customer)
+def api_add_to_cart():
+    """Add an item to the cart, optionally as a customized premade box. Return the priced cart."""
+    try:
+        data = request.get_json(silent=True) or {}
+        item_type = data.get('item_type')
+        custom_veggie_ids = data.get('custom_veggies') or []
+        try:
+            item_id = int(data.get('item_id'))
+            quantity = float(data.get('quantity'))
+        except (TypeError, ValueError):
+            return api_error("Please enter a valid item and quantity")
+        if quantity <= 0:
+            return api_error("Please enter a valid quantity")
+        if item_type not in CART_ITEM_TYPES:
+            return api_error("Invalid item type")
+
+        # Get the item from the database with one polymorphic query
+        [(line, item)] = resolve_cart_items([{'id': item_id, 'type': item_type}])
+
+        # Create a customized premade box if custom veggies are given for a premade box
+        if item_type == 'premade_box' and custom_veggie_ids:
+            item = item.create_custom_box(custom_veggie_ids, g.user.id)
+            db.session.commit()
+
+        cart = load_session_cart()
+        cart.add(item.id, item_type, cart_item_name(item), item.get_price(),
+                 quantity, item.calculate_subtotal(quantity))
+        save_session_cart(cart)
+        return jsonify(priced_session_cart(g.user)), 201
+
+    except ValueError as e:
+        return api_error(str(e))
+    except Exception as e:
+        return api_error(str(e), 500)
+
+
+@app.route(API_PREFIX + '/cart', methods=['DELETE'])
+@isApiAuthorized(allowed_roles=['private_customer', 'corporate_customer'])
+def api_clear_cart():
+    """Empty the cart."""
+    discard_session_cart()
+    return '', 204
+
+
+@app.route(API_PREFIX + '/orders')
+@isApiAuthorized()
+@withCurrentUser(User)
+@readFromReplica
+def api_orders():
+    """
+    List one page of orders, newest first, with optional field selection.
+    Customers list their paid orders, staff list every order with the same filters as the order list page.
+    """
+    try:
+        user = g.user
+        limit = requested_page_size()
+        if isinstance(user, Staff):
+            start_date = request.args.get('start_date')
+            end_date = request.args.get('end_date')
+            customer_id = request.args.get('customer_id', type=int)
+            page = user.list_orders(after=request.args.get('after'),
+                                    limit=limit,
+                                    status=request.args.get('status') or None,
+                                    start_date=date.fromisoformat(start_date) if start_date else None,
+                                    end_date=date.fromisoformat(end_date) if end_date else None,
+                                    delivery_method=request.args.get('delivery_method') or None,
+                                    customer_id=customer_id)
+        else:
+            page = user.list_orders(after=request.args.get('after'), limit=limit)
+
+        fields = requested_fields()
+        return jsonify({
+            'orders': [select_fields(order_summary(entry['order'], entry['total']), fields)
+                       for entry in page['orders']],
+            'next_cursor': page['next_cursor'],
+        })
+
+    except ValueError as e:
+        return api_error(str(e))
+    except Exception as e:
+        return api_error(str(e), 500)
+
+
+@app.route(API_PREFIX + '/orders', methods=['POST'])
+@isApiAuthorized(allowed_roles=['private_customer', 'corporate_customer'])
+@withCurrentUser(Customer)
+def api_place_order():
+    """Place an order for everything in the cart, to be paid with the payment endpoint."""
+    try:
+        data = request.get_json(silent=True) or {}
+        payment_method = data.get('payment_method')
+        if payment_method not in PAYMENT_FIELDS:
+            return api_error(f"Invalid payment method: {payment_method}")
+
+        # Place an order for all the items in the cart in one transaction
+        order = g.user.checkout(data.get('delivery_method'), payment_method, load_session_cart().lines)
+        return jsonify(order_summary(order, round(order.total, 2))), 201
+
+    except ValueError as e:
+        return api_error(str(e))
+    except Exception as e:
+        return api_error(str(e), 500)
+
+
+@app.route(API_PREFIX + '/orders/<int:order_id>/payment', methods=['POST'])
+@isApiAuthorized(allowed_roles=['private_customer', 'corporate_customer'])
+@withCurrentUser(Customer)
+def api_pay_order(order_id):
+    """Pay for an order with the payment method it was placed with, then empty the cart."""
+    try:
+        customer = g.user
+        order = db.session.get(Order, order_id)
+        if order is None or order.customer_id != customer.id:
+            return api_error("Order not found", 404)
+        if order.payment is not None:
+            return api_error("Order is already paid", 409)
+
+        # Map the payment details to the payment's arguments
+        data = request.get_json(silent=True) or {}
+        details = {argument: data[field] for field, argument in PAYMENT_FIELDS[order.paymentMethod].items()
+                   if field in data}
+        if 'cardExpiryDate' in details:
+            details['cardExpiryDate'] = date.fromisoformat(details['cardExpiryDate'])
+
+        # The price to pay comes from the order lines, the stock of the items is taken in the same transaction
+        total_price = round(order.total, 2)
+        if order.paymentMethod == 'Account' and customer.custBalance + total_price > customer.maxOwing:
+            return api_error(f"Charging ${total_price} would take the account past its limit "
+                             f"of ${customer.maxOwing}", 402)
+        customer.make_payment(total_price, order.paymentMethod, order, **details)
+
+        # Link the customer's custom box contents to the order, the default contents are shared
+        box_ids = [line.item_id for line in order.order_lines if isinstance(line.item, PremadeBox)]
+        if box_ids:
+            db.session.execute(
+                box_contents.update()
+                .where(box_contents.c.box_id.in_(box_ids),
+                       box_contents.c.customer_id == customer.id,
+                       box_contents.c.order_id == None)
+                .values(order_id=order_id)
+            )
+        db.session.commit()
+
+        discard_session_cart()
+        return jsonify(order_summary(order, order.total))
+
+    except ValueError as e:
+        return api_error(str(e))
+    except Exception as e:
+        return api_error(str(e), 500)
+
+
+@app.route(API_PREFIX + '/orders/<int:order_id>')
+@isApiAuthorized()
+@withETag(order_etag)
+def api_order_details(order_id):
+    """View the details of an order, customers can only view their own orders."""
+    try:
+        # Get the order with its customer, order lines and items
+        order = db.session.get(Order, order_id, options=Order.details_options())
+        if order is None or (session.get('role') != 'staff' and order.customer_id != session['id']):
+            return api_error("Order not found", 404)
+        return jsonify(select_fields(order.get_order_details(), requested_fields()))
+
+    except Exception as e:
+        return api_error(str(e), 500)
+
+
+@app.route(API_PREFIX + '/reports/sales')
+@isApiAuthorized(allowed_roles=['staff'])
+@readFromReplica
+def api_sales_report():
+    """Get the weekly, monthly and yearly sales from the precomputed rollups."""
+    try:
+        return jsonify({
+            'weekly': SalesRollup.weekly_sales(),
+            'monthly': SalesRollup.monthly_sales(),
+            'yearly': SalesRollup.yearly_sales(),
+        })
+
+    except Exception as e:
+        return api_error(str(e), 500)
+
+
+@app.route(API_PREFIX + '/reports/popularity')
+@isApiAuthorized(allowed_roles=['staff'])
+@withCurrentUser(Staff)
+@readFromReplica
+def api_popularity():
+    """Get the popular and unpopular items, all time or over a rolling window, by orders, units or revenue."""
+    try:
+        days = request.args.get('days', type=int)
+        if days is not None and days not in app.config['POPULARITY_WINDOWS']:
+            return api_error(f"Invalid window, choose one of {app.config['POPULARITY_WINDOWS']}")
+        metric = request.args.get('metric', 'orders')
+        if metric not in POPULARITY_METRICS:
+            return api_error(f"Invalid metric, choose one of {list(POPULARITY_METRICS)}")
+
+        # Get the popular and unpopular items
+        staff = g.user
+        fields = requested_fields()
+        return jsonify({
+            'days': days,
+            'metric': metric,
+            'popular': [select_fields(item_popularity(entry), fields)
+                        for entry in staff.get_popular_items(days=days, metric=metric)],
+            'unpopular': [select_fields(item_popularity(entry), fields)
+                          for entry in staff.get_unpopular_items(days=days, metric=metric)],
+        })
+
+    except Exception as e:
+        return api_error(str(e), 500)
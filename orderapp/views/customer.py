@@ -1,18 +1,24 @@
-from flask import Flask, abort, render_template, request, url_for, redirect, session
+from flask import Flask, abort, g, render_template, request, url_for, redirect, session
 from orderapp import app, db
-from orderapp.decorators import isLoggedIn
-from orderapp.models.item import PackVeggie, PremadeBox, box_contents, UnitPriceVeggie, WeightedVeggie
+from orderapp.cache import catalog_cache
+from orderapp.conditional import catalog_etag, order_etag
+from orderapp.cart_store import discard_session_cart, load_session_cart, save_session_cart
+from orderapp.decorators import isLoggedIn, readFromReplica, withCurrentUser, withETag
+from orderapp.models.item import CART_ITEM_TYPES, PremadeBox, box_contents
 from orderapp.models.order import Order
 from orderapp.models.user import Customer
+from orderapp.pricing import cart_item_name, price_cart, resolve_cart_items
+from orderapp.versions import content_versions
 from datetime import datetime
 
 @app.route('/profile')
 @isLoggedIn
+@withCurrentUser(Customer)
 def profile():
     """Return the user's profile details."""
     try:
-        # Query the database to get the Customer instance
-        customer = Customer.query.get_or_404(session['id'])
+        # Get the Customer instance loaded for this request
+        customer = g.user
         
         if customer:
             # Retrieve the profile data
@@ -27,15 +33,22 @@ def profile():
 
 @app.route('/view_veggies')
 @isLoggedIn
+@withCurrentUser(Customer)
+@withETag(catalog_etag)
 def view_veggies():
     """View all the available vegetables and premade boxes."""
     try:
-        customer = Customer.query.get_or_404(session['id'])
+        customer = g.user
 
-        # Get all the available veggies and premade boxes
-        veggies = customer.view_veggies()
-        premade_boxes = customer.view_premade_boxes()
-        return render_template('veggies.html', veggies=veggies, premade_boxes=premade_boxes)
+        # The catalog's rendered fragment is cached by the shared catalog version, the same one
+        # the page's ETag is built from, read it before the catalog
+        catalog_version = content_versions.get('catalog')
+
+        # Get all the available veggies and premade boxes at that version, served from the catalog cache
+        veggies = catalog_cache.get_or_load(('veggies', catalog_version), customer.view_veggies)
+        premade_boxes = catalog_cache.get_or_load(('premade_boxes', catalog_version), customer.view_premade_boxes)
+        return render_template('veggies.html', veggies=veggies, premade_boxes=premade_boxes,
+                               catalog_version=catalog_version)
     
     except Exception as e:
         return render_template('error.html', error=str(e))
@@ -60,57 +73,29 @@ def add_to_cart():
         except ValueError:
             return redirect(url_for('view_veggies', error="Please enter a valid number for quantity"))
         
-        # Get the item from the database
-        if item_type == 'weighted':
-            item = WeightedVeggie.query.get_or_404(item_id)
-        elif item_type == 'pack':
-            item = PackVeggie.query.get_or_404(item_id)
-        elif item_type == 'unit_price':
-            item = UnitPriceVeggie.query.get_or_404(item_id)
-        elif item_type == 'premade_box':
-            item = PremadeBox.query.get_or_404(item_id)
-            
-            # Create a customized premade box if it is a customized premade box
-            if customize_box and request.form.getlist('custom_veggies'):
-                custom_veggie_ids = request.form.getlist('custom_veggies')
-                item = item.create_custom_box(custom_veggie_ids, session['id'])
-                db.session.commit()
-                # Update item_id 
-                item_id = item.id  
-            else:
-                # Use the original box if not customized
-                item = item
-
-        else:
+        if item_type not in CART_ITEM_TYPES:
             return render_template('error.html', error="Invalid item type")
-     
-        # Check if the cart exists in the session
-        if 'cart' not in session:
-            session['cart'] = []
-
-        # Calculate subtotal for an item
-        subtotal = item.calculate_subtotal(quantity)
 
-        # Add the item to the cart
-        cart_item = next((i for i in session['cart'] if i['id'] == int(item_id) and i['type'] == item_type), None)
-        
-        # If the item is already in the cart, update the quantity and subtotal
-        if cart_item:
-            cart_item['quantity'] += quantity
-            cart_item['subtotal'] = round(float(cart_item['subtotal']) + subtotal, 2)
+        # Get the item from the database with one polymorphic query
+        [(line, item)] = resolve_cart_items([{'id': int(item_id), 'type': item_type}])
 
-        # If the item is not in the cart, add it to the cart
-        else:
-            session['cart'].append({
-                'id': int(item_id),
-                'type': item_type,
-                'name': item.vegName if hasattr(item, 'vegName') else f"{item.boxSize} Premade Box",
-                'price': float(item.get_price()),  
-                'quantity': quantity,
-                'subtotal': round(float(subtotal), 2)
-            })
-
-        session.modified = True
+        # Create a customized premade box if it is a customized premade box
+        if item_type == 'premade_box' and customize_box and request.form.getlist('custom_veggies'):
+            custom_veggie_ids = request.form.getlist('custom_veggies')
+            item = item.create_custom_box(custom_veggie_ids, session['id'])
+            db.session.commit()
+            # Update item_id 
+            item_id = item.id  
+     
+        # Add the item to the cart, adding to the line if the item is already in the cart
+        cart = load_session_cart()
+        cart.add(int(item_id),
+                 item_type,
+                 cart_item_name(item),
+                 item.get_price(),
+                 quantity,
+                 item.calculate_subtotal(quantity))
+        save_session_cart(cart)
         return redirect(url_for('view_veggies', msg="Item added to cart successfully."))
     
     except Exception as e:
@@ -119,26 +104,26 @@ def add_to_cart():
 
 @app.route('/view_cart')
 @isLoggedIn
+@withCurrentUser(Customer)
 def view_cart():
     """View the items in the customer's cart."""
     try:
-        # Get the customer from the database
-        customer = Customer.query.get_or_404(session['id'])
-        # Get the cart from the session
-        cart = session.get('cart', [])
-        # Calculate the subtotal of the items in the cart
-        subtotal = sum(float(item['subtotal']) for item in cart)
-
-        # Fetch box contents for premade boxes
+        # Get the customer loaded for this request
+        customer = g.user
+        # Price the cart from the current item prices in one query
+        priced_cart = price_cart(customer, load_session_cart().lines)
+        cart = priced_cart['lines']
+
+        # Fetch box contents for all premade boxes in one query, served from the catalog cache
+        box_ids = tuple(sorted({item['id'] for item in cart if item['type'] == 'premade_box'}))
+        box_contents = catalog_cache.get_or_load(('box_contents', box_ids),
+                                                 lambda: PremadeBox.get_contents_for_boxes(box_ids))
         for item in cart:
             if item['type'] == 'premade_box':
-                box = PremadeBox.query.get(item['id'])
-                if box:
-                    item['contents'] = [veggie.vegName for veggie in box.get_contents()]
+                item['contents'] = box_contents[item['id']]
                     
-        # If the customer is a corporate customer, apply a 10% discount
-        if session.get('role') == 'corporate_customer':
-            subtotal = customer.apply_discount(subtotal)
+        # The subtotal includes the corporate customer discount
+        subtotal = priced_cart['subtotal'] - priced_cart['discount']
         return render_template('cart.html', cart=cart, subtotal=subtotal)
     
     except Exception as e:
@@ -147,18 +132,17 @@ def view_cart():
 
 @app.route('/process_payment', methods=['POST'])
 @isLoggedIn
+@withCurrentUser(Customer)
 def process_payment():
     """Get the delivery method, total price, and payment method, allow user to place an order and make payment."""
     try:
         # Get the delivery method from the form
         delivery_method = request.form.get('delivery_method')
 
-        # For delivery, add $10 to the total price
-        if delivery_method == 'Delivery':
-            total_price = round(float(request.form.get('subtotal')) + 10.00, 2)
-        # For pickup, the total price is the subtotal of the items in the cart
-        else: 
-            total_price = round(float(request.form.get('subtotal')), 2)
+        # Price the cart again rather than trusting the subtotal from the form,
+        # the delivery fee is added for delivery
+        customer = g.user
+        total_price = price_cart(customer, load_session_cart().lines, delivery_method)['total']
         return render_template('process_payment.html', total_price=total_price, delivery_method=delivery_method)
     
     except Exception as e:
@@ -167,40 +151,22 @@ def process_payment():
 
 @app.route('/place_order_and_process_payment', methods=['GET', 'POST'])
 @isLoggedIn
+@withCurrentUser(Customer)
 def place_order_and_process_payment():
     """Create an order object and allow user to make payment."""
     try:
         # Get the variables from the form
         payment_method = request.form.get('payment_method')
         delivery_method = request.form.get('delivery_method')
-        total_price = request.form.get('total_price')
 
-        # Get the customer from the database
-        customer = Customer.query.get_or_404(session['id'])
+        # Get the customer loaded for this request
+        customer = g.user
 
-        # Place an order
-        order = customer.place_order(delivery_method, payment_method)
+        # Place an order for all the items in the cart in one transaction
+        order = customer.checkout(delivery_method, payment_method, load_session_cart().lines)
 
-        # Add the items to the order
-        cart = session.get('cart', [])
-        for item in cart:
-            item_id = item['id']
-            item_type = item['type']
-            quantity = item['quantity']
-
-            # Get the item from the database based on its type
-            if item_type == 'weighted':
-                item = WeightedVeggie.query.get_or_404(item_id)
-            elif item_type == 'pack':
-                item = PackVeggie.query.get_or_404(item_id)
-            elif item_type == 'unit_price':
-                item = UnitPriceVeggie.query.get_or_404(item_id)
-            elif item_type == 'premade_box':
-                item = PremadeBox.query.get_or_404(item_id)
-            else:
-                raise ValueError(f"Invalid item type: {item_type}")
-            
-            order.add_item(item, quantity)
+        # The price to pay comes from the order lines, not from the form
+        total_price = round(order.total, 2)
 
         # Process Credit Card, Debit Card payment
         if payment_method != 'Account':
@@ -215,11 +181,11 @@ def place_order_and_process_payment():
             max_owning = customer.maxOwing
             # Check if the customer can charge from their account based on the updated balance
             can_charge = False
-            if customer_balance + float(total_price) <= max_owning:
+            if customer_balance + total_price <= max_owning:
                 can_charge = True   
 
             return render_template('account_payment.html', 
-                                   total_price=round(float(total_price), 2), 
+                                   total_price=total_price, 
                                    customer_balance=customer_balance,
                                    max_owning=max_owning,
                                    can_charge=can_charge,
@@ -231,6 +197,7 @@ def place_order_and_process_payment():
 
 @app.route('/add_credit_card_payment', methods=['POST'])
 @isLoggedIn
+@withCurrentUser(Customer)
 def add_credit_card_payment():
     """Add a credit card payment to the database."""
     try:
@@ -238,16 +205,16 @@ def add_credit_card_payment():
         card_type = request.form.get('card_type')
         card_number = request.form.get('card_number')
         card_expiry_date = request.form.get('card_expiry_date')
-        total_price = float(request.form.get('total_price'))
         order_id = int(request.form.get('order_id'))
 
-        # Get the customer from the database
-        customer = Customer.query.get_or_404(session['id'])
+        # Get the customer loaded for this request
+        customer = g.user
 
-        # Get the order from the database
+        # Get the order from the database, the price to pay comes from its order lines
         order = Order.query.get_or_404(order_id)
+        total_price = round(order.total, 2)
 
-        # Make the payment
+        # Make the payment, the stock of the items is taken in the same transaction
         customer.make_payment(
             total_price, 
             'Credit Card', 
@@ -257,17 +224,14 @@ def add_credit_card_payment():
             cardType=card_type)
         
         # Add order_id to the box_contents table
-        for item in session.get('cart', []):
+        for item in load_session_cart().lines:
             if item['type'] == 'premade_box':
                 box = PremadeBox.query.get(item['id'])
                 box.order_id = order_id
                 db.session.commit()
 
-        # Update the stock of items after receiving the payment
-        order.update_stock()
-        
         # Clear the cart
-        session.pop('cart', None)
+        discard_session_cart()
         return redirect(url_for('order_details', order_id=order_id, msg="Thank you! Your order was placed successfully."))
 
     except Exception as e:
@@ -276,22 +240,23 @@ def add_credit_card_payment():
 
 @app.route('/add_debit_card_payment', methods=['POST'])
 @isLoggedIn
+@withCurrentUser(Customer)
 def add_debit_card_payment():
     """Add a debit card payment to the database."""
     try:
         # Get the variables from the form
         bank_name = request.form.get('bank_name')
         debit_card_number = request.form.get('debit_card_number')
-        total_price = float(request.form.get('total_price'))
         order_id = int(request.form.get('order_id'))
 
-        # Get the customer from the database
-        customer = Customer.query.get_or_404(session['id'])
+        # Get the customer loaded for this request
+        customer = g.user
 
-        # Get the order from the database
+        # Get the order from the database, the price to pay comes from its order lines
         order = Order.query.get_or_404(order_id)
+        total_price = round(order.total, 2)
 
-        # Make the payment
+        # Make the payment, the stock of the items is taken in the same transaction
         customer.make_payment(
             total_price, 
             'Debit Card', 
@@ -300,17 +265,14 @@ def add_debit_card_payment():
             debitCardNumber=debit_card_number)
         
         # Add order_id to the box_contents table
-        for item in session.get('cart', []):
+        for item in load_session_cart().lines:
             if item['type'] == 'premade_box':
                 box = PremadeBox.query.get(item['id'])
                 box.order_id = order_id
                 db.session.commit()
         
-        # Update the stock of items after receiving the payment
-        order.update_stock()
-        
         # Clear the cart
-        session.pop('cart', None)
+        discard_session_cart()
         return redirect(url_for('order_details', order_id=order_id, msg="Thank you! Your order was placed successfully."))
 
     except Exception as e:
@@ -319,24 +281,25 @@ def add_debit_card_payment():
 
 @app.route('/add_account_payment', methods=['POST'])
 @isLoggedIn
+@withCurrentUser(Customer)
 def add_account_payment():
     """Add an account payment to the database and update the customer's balance."""
     try:
         # Get the variables from the form
-        total_price = float(request.form.get('total_price'))
         order_id = int(request.form.get('order_id'))
 
-        # Get the customer from the database
-        customer = Customer.query.get_or_404(session['id'])
+        # Get the customer loaded for this request
+        customer = g.user
         
-        # Get the order from the database
+        # Get the order from the database, the price to pay comes from its order lines
         order = Order.query.get_or_404(order_id)
+        total_price = round(order.total, 2)
 
-        # Make the payment
+        # Make the payment, the stock of the items is taken in the same transaction
         customer.make_payment(total_price, 'Account', order)
 
         # Update box_contents with order_id for a premade box in the cart
-        for item in session.get('cart', []):
+        for item in load_session_cart().lines:
             if item['type'] == 'premade_box':
                 db.session.execute(
                     box_contents.update()
@@ -345,11 +308,8 @@ def add_account_payment():
                 )
         db.session.commit()
 
-        # Update the stock of items after receiving the payment
-        order.update_stock()
-
         # Clear the cart
-        session.pop('cart', None)
+        discard_session_cart()
         return redirect(url_for('order_details', order_id=order_id, msg=f'Charge from account successful! New balance: ${customer.custBalance}'))
 
     except Exception as e:
@@ -358,11 +318,13 @@ def add_account_payment():
             
 @app.route('/order_history')
 @isLoggedIn
+@withCurrentUser(Customer)
+@readFromReplica
 def order_history():
     """View the order histories."""
     try:
-        # Get the customer and customer's balance from the database
-        customer = Customer.query.get_or_404(session['id'])
+        # Get the customer and customer's balance
+        customer = g.user
         customer_balance = customer.custBalance
         # Get customer's order history
         order_history = customer.view_order_history()
@@ -375,11 +337,16 @@ def order_history():
 
 @app.route('/order_details/<int:order_id>')
 @isLoggedIn
+@withETag(order_etag)
 def order_details(order_id):
     """View the order details."""
     try:
-        # Get the order and its details from the database
-        order = Order.query.get_or_404(order_id)
+        # Get the order with its customer, order lines and items, then its details from the database
+        order = db.get_or_404(Order, order_id, options=Order.details_options())
+
+        # Customers can only view their own orders
+        if session.get('role') != 'staff' and order.customer_id != session['id']:
+            return render_template('error.html', error='Access Denied')
         order_details = order.get_order_details()
 
         return render_template('order_details.html', order=order_details, order_id=order_id)
@@ -390,12 +357,13 @@ def order_details(order_id):
 
 @app.route('/cancel_order/<int:order_id>')
 @isLoggedIn
+@withCurrentUser(Customer)
 def cancel_order(order_id):
     """Cancel the order."""
     try:
-        # Get the order and customer from the database
+        # Get the order from the database and the customer loaded for this request
         order = Order.query.get_or_404(order_id)
-        customer = Customer.query.get_or_404(session['id'])
+        customer = g.user
 
         # Cancel the order
         customer.cancel_order(order_id)
@@ -415,11 +383,12 @@ def cancel_order(order_id):
 
 @app.route('/pay_balance', methods=['GET', 'POST'])
 @isLoggedIn
+@withCurrentUser(Customer)
 def pay_balance():
     """Pay the balance."""
 
-    # Get the customer and customer's balance from the database
-    customer = Customer.query.get_or_404(session['id'])
+    # Get the customer and customer's balance
+    customer = g.user
     customer_balance = customer.custBalance
 
     try:
@@ -443,11 +412,13 @@ def pay_balance():
             
 @app.route('/payment_history')
 @isLoggedIn
+@withCurrentUser(Customer)
+@readFromReplica
 def payment_history():
     """View the payment history."""
     try:
-        # Get the customer and their payment history from the database
-        customer = Customer.query.get_or_404(session['id'])
+        # Get the customer and their payment history
+        customer = g.user
         payment_history = customer.view_payment_history()
         return render_template('payment_history.html', payment_history=payment_history)
     
@@ -459,5 +430,5 @@ def payment_history():
 @isLoggedIn
 def clear_cart():
     """Clear the cart."""
-    session.pop('cart', None)
+    discard_session_cart()
     return redirect(url_for('view_cart'))
@@ -4,11 +4,20 @@ from flask import request
 from flask import redirect
 from flask import url_for
 from flask import session
-from orderapp import app
+from orderapp import app, db
+from orderapp.cart_store import discard_session_cart
 from orderapp.models.user import User
+from orderapp.passwords import PasswordHashingBusy
 
 PASSWORD_SALT = app.config['PASSWORD_SALT']
 
+def start_user_session(user):
+    """Save the logged in user in the session."""
+    session['loggedin'] = True
+    session['id'] = user.id
+    session['username'] = user.username
+    session['role'] = user.type
+
 @app.route('/')
 def home():
     return render_template('home.html')
@@ -30,15 +39,18 @@ def login():
 
             # Check if password is correct
             if user and user.check_password(userPassword):
+                # Save the new hash if the password was hashed again
+                db.session.commit()
+
                 # If password correct, create session data
-                session['loggedin'] = True
-                session['id'] = user.id
-                session['username'] = user.username
-                session['role'] = user.type
+                start_user_session(user)
                 return redirect(url_for('home')) 
             else:
                 return render_template('login.html', error='Incorrect username or password')
-            
+
+        except PasswordHashingBusy as e:
+            return render_template('login.html', error=str(e)), 503
+
         except Exception as e:
             return render_template('error.html', error=str(e))   
 
@@ -50,8 +62,7 @@ def logout():
     session.pop('id', None)
     session.pop('username', None)
     session.pop('role', None)
-    if 'cart' in session:
-        session.pop('cart', None)
+    discard_session_cart()
 
     # Redirect to login page
     return redirect(url_for('home'))
@@ -1,33 +1,46 @@
-from flask import Flask, abort, render_template, request, url_for, redirect, session
+from flask import Flask, abort, g, jsonify, render_template, request, url_for, redirect, session
 from orderapp import app, db
-from orderapp.decorators import isLoggedIn, isAuthorized
+from orderapp.cache import catalog_cache, fragment_cache
+from orderapp.conditional import catalog_etag, conditional_stats, order_list_etag
+from orderapp.directory import customer_directory
+from orderapp.pool_stats import pool_stats
+from orderapp.query_stats import route_query_stats
+from orderapp.versions import content_versions
+from orderapp.decorators import isLoggedIn, isAuthorized, readFromReplica, withCurrentUser, withETag
 from orderapp.models.item import PackVeggie, PremadeBox, box_contents, UnitPriceVeggie, Veggie, WeightedVeggie
 from orderapp.models.order import Order
-from orderapp.models.user import Customer, User
-from datetime import datetime
+from orderapp.models.report import POPULARITY_METRICS, SalesRollup
+from orderapp.models.user import Customer, Staff
+from datetime import date, datetime
 
 @app.route('/view_all_veggies')
 @isLoggedIn
 @isAuthorized(allowed_roles=['staff'])
+@withCurrentUser(Staff)
+@withETag(catalog_etag)
 def view_all_veggies():
     """View a list of all the veggies."""
     try:
         # Get staff instance
-        staff = User.query.get_or_404(session['id'])
-        
-        veggies = staff.veggies
-        premade_boxes = staff.premadeBoxes
-
-        # Categorize veggies
-        weighted_veggies = [v for v in veggies if isinstance(v, WeightedVeggie)]
-        pack_veggies = [v for v in veggies if isinstance(v, PackVeggie)]
-        unit_price_veggies = [v for v in veggies if isinstance(v, UnitPriceVeggie)]
-        
-        return render_template('all_veggies.html', 
-                            weighted_veggies=weighted_veggies,
-                            pack_veggies=pack_veggies,
-                            unit_price_veggies=unit_price_veggies,
-                            premade_boxes=premade_boxes)
+        staff = g.user
+
+        # The tables' rendered fragment is cached by the shared catalog version, read it before the catalog
+        catalog_version = content_versions.get('catalog')
+
+        def load_catalog():
+            """Load the veggies by type, the premade boxes and their contents, only when the tables are rendered."""
+            veggies = staff.veggies
+            boxes = staff.premadeBoxes
+            return {
+                'weighted_veggies': [v for v in veggies if isinstance(v, WeightedVeggie)],
+                'pack_veggies': [v for v in veggies if isinstance(v, PackVeggie)],
+                'unit_price_veggies': [v for v in veggies if isinstance(v, UnitPriceVeggie)],
+                'premade_boxes': boxes,
+                # Every box's contents in one query
+                'box_contents': PremadeBox.get_contents_for_boxes([box.id for box in boxes]),
+            }
+
+        return render_template('all_veggies.html', catalog_version=catalog_version, load_catalog=load_catalog)
     except Exception as e:
         return render_template('error.html', error=str(e))
 
@@ -35,15 +48,31 @@ def view_all_veggies():
 @app.route('/view_all_orders')
 @isLoggedIn
 @isAuthorized(allowed_roles=['staff'])
+@withCurrentUser(Staff)
+@readFromReplica
+@withETag(order_list_etag)
 def view_all_orders():
-    """View a list of all the orders."""
+    """View a page of the orders, newest first, with optional filters."""
 
     try:
-        # Get staff instance and order history
-        staff = User.query.get_or_404(session['id'])
-        order_history = staff.listOfOrders
-
-        return render_template('order_history.html', order_history=order_history)
+        # Get the filters from the query string, empty values are ignored
+        filters = {name: request.args.get(name) or None
+                   for name in ['status', 'start_date', 'end_date', 'delivery_method', 'customer_id']}
+        start_date = datetime.strptime(filters['start_date'], '%Y-%m-%d').date() if filters['start_date'] else None
+        end_date = datetime.strptime(filters['end_date'], '%Y-%m-%d').date() if filters['end_date'] else None
+        customer_id = int(filters['customer_id']) if filters['customer_id'] else None
+
+        # Get staff instance and one page of orders
+        staff = g.user
+        page = staff.list_orders(after=request.args.get('after'),
+                                 status=filters['status'],
+                                 start_date=start_date,
+                                 end_date=end_date,
+                                 delivery_method=filters['delivery_method'],
+                                 customer_id=customer_id)
+
+        return render_template('order_history.html', order_history=page['orders'],
+                               next_cursor=page['next_cursor'], filters=filters)
     except Exception as e:
         return render_template('error.html', error=str(e))
 
@@ -51,6 +80,7 @@ def view_all_orders():
 @app.route('/update_order_status', methods=['POST'])
 @isLoggedIn
 @isAuthorized(allowed_roles=['staff'])
+@withCurrentUser(Staff)
 def update_order_status():
     """Update the status of an order."""
 
@@ -60,7 +90,7 @@ def update_order_status():
         new_status = request.form.get('new_status')
 
         # Get staff instance and update order status
-        staff = User.query.get_or_404(session['id'])
+        staff = g.user
         staff.update_order_status(order_id, new_status)
 
         return redirect(url_for('order_details', order_id=order_id, msg="Order status updated successfully."))
@@ -73,13 +103,15 @@ def update_order_status():
 @isLoggedIn
 @isAuthorized(allowed_roles=['staff'])
 def customer_list():
-    """View a list of all the customers."""
+    """View a page of the customer directory, optionally searching by name prefix."""
 
     try:
-        # Get staff instance and a list of all customers
-        staff = User.query.get_or_404(session['id'])
-        customer_list = staff.listOfCustomers
-        return render_template('customer_list.html', customer_list=customer_list)
+        # Search the in-memory customer directory instead of loading every customer
+        search = request.args.get('q', '')
+        page = customer_directory.search(search, after=request.args.get('after'),
+                                         limit=app.config['CUSTOMERS_PAGE_SIZE'])
+        return render_template('customer_list.html', customer_list=page['customers'],
+                               next_cursor=page['next_cursor'], search=search)
     
     except Exception as e:
         return render_template('error.html', error=str(e))
@@ -109,18 +141,15 @@ def customer_details(customer_id):
 @app.route('/report')
 @isLoggedIn
 @isAuthorized(allowed_roles=['staff'])
+@readFromReplica
 def report():
     """View the summary report of sales."""
 
     try:
-        # Get staff instance 
-        staff = User.query.get_or_404(session['id'])
-
-        # Get the weekly, monthly, and yearly sales
-        weekly_sales = staff.get_weekly_sales()
-        monthly_sales = staff.get_monthly_sales()
-        yearly_sales = staff.get_yearly_sales()
-        return render_template('report.html', weekly_sales=weekly_sales, monthly_sales=monthly_sales, yearly_sales=yearly_sales)
+        # The sales tables' rendered fragment is cached until an order changes, the template
+        # only reads the weekly, monthly, and yearly sales from the precomputed rollups on a miss
+        return render_template('report.html', rollups=SalesRollup,
+                               orders_version=content_versions.get('orders'), today=date.today())
     
     except Exception as e:
         return render_template('error.html', error=str(e))
@@ -129,18 +158,44 @@ def report():
 @app.route('/popularity')
 @isLoggedIn
 @isAuthorized(allowed_roles=['staff'])
+@withCurrentUser(Staff)
+@readFromReplica
 def popularity():
-    """View the popular and unpopular items."""
+    """View the popular and unpopular items, all time or over a rolling window, by orders, units or revenue."""
 
     try:
         # Get staff instance
-        staff = User.query.get_or_404(session['id'])   
+        staff = g.user
+
+        # Get the window and ranking from the query string, all time by number of orders by default
+        days = request.args.get('days', type=int)
+        if days not in app.config['POPULARITY_WINDOWS']:
+            days = None
+        metric = request.args.get('metric', 'orders')
+        if metric not in POPULARITY_METRICS:
+            metric = 'orders'
+
+        # The rankings' rendered fragment is cached until an order or the catalog changes,
+        # the template only gets the popular and unpopular items from the staff instance on a miss
+        return render_template('popularity.html', staff=staff, days=days, metric=metric,
+                               windows=app.config['POPULARITY_WINDOWS'],
+                               orders_version=content_versions.get('orders'),
+                               catalog_version=content_versions.get('catalog'), today=date.today())
 
-        # Get the popular and unpopular items
-        popular_items = staff.get_popular_items()
-        unpopular_items = staff.get_unpopular_items()
+    except Exception as e:
+        return render_template('error.html', error=str(e))
 
-        return render_template('popularity.html', popular_items=popular_items, unpopular_items=unpopular_items)
 
-    except Exception as e:
-        return render_template('error.html', error=str(e))
\ No newline at end of file
+@app.route('/stats')
+@isLoggedIn
+@isAuthorized(allowed_roles=['staff'])
+def stats():
+    """View the in-process cache, query, conditional GET and connection pool counters."""
+    return jsonify({
+        'db_pools': pool_stats.stats(),
+        'catalog_cache': catalog_cache.stats(),
+        'fragment_cache': fragment_cache.stats(),
+        'conditional_get': conditional_stats.stats(),
+        'customer_directory': customer_directory.stats(),
+        'route_queries': route_query_stats.stats(),
+    })
@@ -1,4 +1,10 @@
 from orderapp import app
+from orderapp.directory import customer_directory
 
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    # Build the customer directory before the first request needs it
+    with app.app_context():
+        customer_directory.load()
+
+    # Abandoned unpaid orders are deleted in the background from the first request, see orderapp/reaper.py
+    app.run(debug=True)